@@ -0,0 +1,265 @@
+# ACTION DISPATCH - RUN MITIGATIONS ON ACTUATORS WITHOUT BLOCKING FAULT EVALUATION
+# the monitor hands each raised fault's mitigation plan to submit(), which only queues jobs and returns.
+# Worker threads run the handlers registered for each mitigation (GPIO output, action log file,
+# UDP / Unix-socket notifier, ...) with a timeout, retries with backoff and per-device rate limits.
+# Every handler call runs on its own daemon thread and the worker waits ACTION_TIMEOUT for it at most,
+# so a hung handler never holds a worker. Jobs are taken highest priority first: actions of
+# PREEMPTING_FAULTS (Thermal_Runaway) jump the whole queue, the rest follow fault severity; on a full
+# queue they evict the lowest priority job instead of being dropped.
+
+import heapq
+import itertools
+import json
+import socket
+import threading
+import time
+
+ACTION_WORKERS = 2            # handler threads
+ACTION_TIMEOUT = 1.0          # seconds a handler call may take, also passed to handlers for their blocking I/O
+MAX_HUNG_CALLS = 4            # calls of one handler still running past their timeout, further calls fail at once
+ACTION_RETRIES = 2            # extra attempts after a failed or timed out handler call
+RETRY_BACKOFF = 0.1           # seconds before the first retry, doubled for every further one
+MAX_QUEUED_ACTIONS = 1024     # jobs beyond this are dropped (and counted)
+PREEMPTING_FAULTS = ('Thermal_Runaway',)
+
+# (executions, per seconds) of one action on one device, further requests are suppressed.
+# Actions of PREEMPTING_FAULTS are never rate limited.
+RATE_LIMITS = {
+    'Stop_Charging': (1, 30.0),
+    'Reduce_Load': (1, 30.0),
+    'Reduce_Charging_Power': (1, 60.0),
+    'Alert_User': (1, 300.0),
+    'Recommend_Replacement': (1, 3600.0),
+}
+DEFAULT_RATE_LIMIT = (2, 60.0)
+
+
+# HANDLERS - called as handler(action, event, timeout), raise on failure
+class GPIOAction:
+    """Drive a GPIO pin (disconnect load, cut the charger). Without RPi.GPIO (not on a Pi) it only
+    records the pin state, so the monitor runs unchanged on a laptop."""
+
+    def __init__(self, pin, active_high=True):
+        self.pin = pin
+        self.level = active_high
+        self.state = None
+        try:
+            import RPi.GPIO as GPIO
+        except (ImportError, RuntimeError):
+            self.gpio = None
+        else:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(pin, GPIO.OUT, initial=not active_high)
+            self.gpio = GPIO
+
+    def __call__(self, action, event, timeout):
+        if self.gpio is not None:
+            self.gpio.output(self.pin, self.level)
+        self.state = self.level
+
+
+class FileLogAction:
+    """Append every executed action to a local JSON-lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, action, event, timeout):
+        line = json.dumps(event, default=str) + "\n"
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+class SocketNotifier:
+    """Send every action as one JSON datagram, to a (host, port) over UDP or to a Unix socket path"""
+
+    def __init__(self, address):
+        self.address = address
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.lock = threading.Lock()
+
+    def __call__(self, action, event, timeout):
+        payload = json.dumps(event, default=str).encode('utf-8')
+        with self.lock:
+            self.sock.settimeout(timeout)
+            self.sock.sendto(payload, self.address)
+
+
+def default_handlers(log_path=None, notify_address=None, gpio_pins=None):
+    """{action: [handlers]} - GPIO for the mapped actions, plus the log and notifier for every action ('*')"""
+    common = []
+    if log_path:
+        common.append(FileLogAction(log_path))
+    if notify_address:
+        common.append(SocketNotifier(notify_address))
+    handlers = {'*': common}
+    for action, pin in (gpio_pins or {}).items():
+        handlers[action] = [GPIOAction(pin)] + common
+    return handlers
+
+
+# DISPATCHER
+class ActionDispatcher:
+    """Priority queue of (action, handler) jobs served by a fixed pool of worker threads"""
+
+    def __init__(self, handlers, workers=ACTION_WORKERS, timeout=ACTION_TIMEOUT, retries=ACTION_RETRIES,
+                 rate_limits=RATE_LIMITS, max_queued=MAX_QUEUED_ACTIONS, on_error=None):
+        self.handlers = handlers
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.rate_limits = rate_limits
+        self.max_queued = max_queued
+        self.on_error = on_error  # on_error(event, handler, exception) after the last attempt failed
+        self._queue = []     # (priority, seq, job)
+        self._delayed = []   # (due time, seq, priority, job) waiting for a retry
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._buckets = {}   # (action, device) -> [tokens, last refill]
+        self._hung = {}      # handler -> calls still running past their timeout
+        self._threads = []
+        self._stopping = False
+        self.counts = {'submitted': 0, 'executed': 0, 'failed': 0, 'retried': 0, 'timed_out': 0,
+                       'rate_limited': 0, 'dropped': 0, 'evicted': 0, 'preempting': 0}
+
+    def _allow(self, action, device, now):
+        """Token bucket per (action, device)"""
+        limit, period = self.rate_limits.get(action, DEFAULT_RATE_LIMIT)
+        bucket = self._buckets.get((action, device))
+        if bucket is None:
+            bucket = self._buckets[(action, device)] = [float(limit), now]
+        bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit / period)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def submit(self, device, plan, severities, **context):
+        """Queue the actions of a mitigation plan ((action, fault), ...), returns the number of jobs queued.
+        Never blocks on a handler."""
+        now = time.monotonic()
+        queued = 0
+        with self._cond:
+            for action, fault in plan:
+                preempting = fault in PREEMPTING_FAULTS
+                if not preempting and not self._allow(action, device, now):
+                    self.counts['rate_limited'] += 1
+                    continue
+                event = dict(context, action=action, fault=fault, severity=severities.get(fault), device=device,
+                             time=time.time())
+                priority = -1 if preempting else severities.get(fault, 1000)
+                for handler in self.handlers.get(action, self.handlers.get('*', [])):
+                    if len(self._queue) + len(self._delayed) >= self.max_queued and not (preempting and self._evict()):
+                        self.counts['dropped'] += 1
+                        continue
+                    heapq.heappush(self._queue, (priority, next(self._seq), [event, handler, 0]))
+                    self.counts['submitted'] += 1
+                    self.counts['preempting'] += preempting
+                    queued += 1
+            if queued:
+                self._cond.notify(queued)
+        return queued
+
+    def _evict(self):
+        """Drop the lowest priority job that is not preempting (the newest of equals), False if there is none"""
+        queued = [(entry[0], entry[1], self._queue, i) for i, entry in enumerate(self._queue) if entry[0] >= 0]
+        queued += [(entry[2], entry[1], self._delayed, i) for i, entry in enumerate(self._delayed) if entry[2] >= 0]
+        if not queued:
+            return False
+        _, _, heap, i = max(queued, key=lambda item: item[:2])
+        heap[i] = heap[-1]
+        heap.pop()
+        heapq.heapify(heap)
+        self.counts['evicted'] += 1
+        return True
+
+    def _call(self, handler, event):
+        """Run one handler call on its own daemon thread, raises TimeoutError when it takes longer than the timeout"""
+        with self._cond:
+            if self._hung.get(handler, 0) >= MAX_HUNG_CALLS:
+                raise TimeoutError(f"{MAX_HUNG_CALLS} earlier calls still hung")
+        outcome = {}
+        finished = threading.Event()
+
+        def run():
+            try:
+                handler(event['action'], event, self.timeout)
+            except Exception as e:
+                outcome['error'] = e
+            finished.set()
+            with self._cond:
+                if outcome.get('hung'):
+                    self._hung[handler] -= 1
+
+        threading.Thread(target=run, name='action-call', daemon=True).start()
+        if not finished.wait(self.timeout):
+            with self._cond:
+                if not finished.is_set():
+                    outcome['hung'] = True
+                    self._hung[handler] = self._hung.get(handler, 0) + 1
+                    self.counts['timed_out'] += 1
+                    raise TimeoutError(f"No result after {self.timeout}s")
+        if 'error' in outcome:
+            raise outcome['error']
+
+    def _next_job(self):
+        """Highest priority job, waiting for work or the next due retry; None once stopped and drained"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, seq, priority, job = heapq.heappop(self._delayed)
+                    heapq.heappush(self._queue, (priority, seq, job))
+                if self._queue:
+                    return heapq.heappop(self._queue)
+                if self._stopping and not self._delayed:
+                    return None
+                self._cond.wait(self._delayed[0][0] - now if self._delayed else None)
+
+    def _run(self):
+        while True:
+            entry = self._next_job()
+            if entry is None:
+                return
+            priority, seq, job = entry
+            event, handler, attempt = job
+            try:
+                self._call(handler, event)
+            except Exception as e:
+                with self._cond:
+                    if attempt < self.retries and not self._stopping:
+                        self.counts['retried'] += 1
+                        job[2] = attempt + 1
+                        due = time.monotonic() + RETRY_BACKOFF * 2 ** attempt
+                        heapq.heappush(self._delayed, (due, seq, priority, job))
+                        self._cond.notify()
+                        continue
+                    self.counts['failed'] += 1
+                if self.on_error is not None:
+                    self.on_error(event, handler, e)
+            else:
+                with self._cond:
+                    self.counts['executed'] += 1
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'action-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Let the workers finish the queued jobs, then end them (pending retries are abandoned)"""
+        with self._cond:
+            self._stopping = True
+            self._delayed.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counts, queued=len(self._queue), retry_pending=len(self._delayed))
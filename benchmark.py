@@ -0,0 +1,334 @@
+# BENCHMARK - INGESTION RATE, LATENCY AND RESOURCE USE OF THE PI SCRIPT
+# run from the folder holding knowledge_graph.pkl:
+#   python benchmark.py logging --readings 20000
+#       synthetic readings straight through process_realtime_data (no sockets), log output to os.devnull
+#   python benchmark.py pipeline --scenario normal aging --devices 200 --rate 2000 --duration 20 --save baseline.json
+#       starts the server on localhost, drives it with load_generator.py and reads its stats endpoint;
+#       --compare baseline.json exits with status 1 when throughput or latency regressed
+#   python benchmark.py decision --readings 2000 --uri bolt://localhost:7687 --password ...
+#       fault decisions through the Python snapshot path vs one Cypher query per reading (needs Neo4j)
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+# (label, log level, log format) - DEBUG console is the per-reading view every reading used to print
+LOGGING_MODES = [
+    ('per-reading console view (before)', 'DEBUG', 'console'),
+    ('per-reading JSON lines', 'DEBUG', 'json'),
+    ('production console (after)', 'INFO', 'console'),
+    ('production JSON lines (after)', 'INFO', 'json'),
+]
+
+
+def synthetic_readings(count, devices=4, seed=1):
+    """Readings around the nominal operating point with an occasional out-of-limit value"""
+    rng = random.Random(seed)
+    readings = []
+    for i in range(count):
+        fault = rng.random() < 0.05
+        readings.append({
+            'DeviceID': f"pack-{i % devices:02d}",
+            'Voltage': rng.uniform(3.6, 4.0) if not fault else rng.uniform(2.5, 4.5),
+            'Impedance': rng.uniform(0.03, 0.04),
+            'IntTemp': rng.uniform(25, 40) if not fault else rng.uniform(55, 65),
+            'SurfaceTemp': rng.uniform(24, 38),
+            'Capacity': rng.uniform(0.85, 1.0),
+            'SoC': rng.uniform(20, 90),
+            'Status': rng.randint(0, 1),
+        })
+    return readings
+
+
+def load_ingestion():
+    """Import the Pi script without starting its server, hiding the startup messages"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import data_ingestion_pickle
+    return data_ingestion_pickle
+
+
+def bench_logging(readings):
+    ingestion = load_ingestion()
+    from device_state import DeviceStateTable
+
+    results = []
+    with open(os.devnull, 'w') as devnull:
+        for label, level, fmt in LOGGING_MODES:
+            ingestion.log.configure(level, fmt, devnull)
+            ingestion.device_states = DeviceStateTable()
+            start = time.perf_counter()
+            for sensor_data in readings:
+                ingestion.process_realtime_data(sensor_data, None)
+            elapsed = time.perf_counter() - start
+            results.append((label, len(readings) / elapsed))
+
+    baseline = results[0][1]
+    print(f"Ingestion rate over {len(readings)} readings (log output to {os.devnull}):")
+    for label, rate in results:
+        print(f"  {label:<36} {rate:>10.0f} readings/s  ({rate / baseline:.1f}x)")
+    return results
+
+
+# PIPELINE BENCHMARK
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_ingestion_pickle.py')
+SERVER_PORT = 5000
+STATS_URL = 'http://127.0.0.1:5001/'
+SERVER_START_TIMEOUT = 30  # seconds to wait for the stats endpoint after launching the server
+DRAIN_TIMEOUT = 10         # seconds to wait for the server to finish buffered readings
+
+
+def fetch_stats(reset=False):
+    with urllib.request.urlopen(STATS_URL + ('?reset=1' if reset else ''), timeout=2) as response:
+        return json.load(response)
+
+
+def process_usage(pid):
+    """(cpu seconds, rss MB, peak rss MB) of a process from /proc (Linux, as on the Pi)"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')  # utime + stime
+    memory = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(('VmRSS:', 'VmHWM:')):
+                name, value = line.split(':')
+                memory[name] = int(value.split()[0]) / 1024
+    return cpu, memory.get('VmRSS', 0.0), memory.get('VmHWM', 0.0)
+
+
+def start_server():
+    """Launch the Pi script in the current folder and wait until its stats endpoint answers"""
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited during startup: {server.stderr.read().decode(errors='replace')}")
+        try:
+            fetch_stats()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError(f"Server stats endpoint {STATS_URL} did not answer within {SERVER_START_TIMEOUT}s")
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def bench_scenario(scenario, devices, rate, duration, connections, batch):
+    """One load run against a fresh server, returns the result record saved in the baseline"""
+    from load_generator import run_load
+
+    server = start_server()
+    try:
+        before = fetch_stats(reset=True)
+        cpu_before, _, _ = process_usage(server.pid)
+        started = time.monotonic()
+        sent = asyncio.run(run_load('127.0.0.1', SERVER_PORT, scenario, devices, rate, duration, connections, batch))
+
+        # Wait for readings still buffered in sockets to go through fault detection
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        stats = fetch_stats()
+        while stats['readings_processed'] - before['readings_processed'] < sent['readings'] \
+                and time.monotonic() < deadline:
+            time.sleep(0.1)
+            stats = fetch_stats()
+        elapsed = time.monotonic() - started
+        cpu_after, rss, peak_rss = process_usage(server.pid)
+    finally:
+        stop_server(server)
+
+    processed = stats['readings_processed'] - before['readings_processed']
+    if stats['interval_s'] < elapsed * 0.9:
+        print(f"  note: the server's periodic report reset its histograms, latency covers the last "
+              f"{stats['interval_s']:.1f}s of {elapsed:.1f}s")
+    return {
+        'scenario': scenario,
+        'config': {'devices': devices, 'rate': rate, 'duration': duration, 'connections': connections, 'batch': batch},
+        'sent': sent['readings'],
+        'processed': processed,
+        'throughput': round(processed / elapsed, 1),
+        'latency_ms': {stage: {key: summary[key] for key in ('count', 'p50_ms', 'p99_ms', 'p999_ms', 'max_ms')
+                               if key in summary}
+                       for stage, summary in stats['stages'].items()},
+        'server_cpu_percent': round(100 * (cpu_after - cpu_before) / elapsed, 1),
+        'server_rss_mb': round(rss, 1),
+        'server_peak_rss_mb': round(peak_rss, 1),
+    }
+
+
+def print_result(result):
+    print(f"{result['scenario']}: {result['processed']}/{result['sent']} readings processed, "
+          f"{result['throughput']:.0f} readings/s, server CPU {result['server_cpu_percent']:.0f}%, "
+          f"RSS {result['server_rss_mb']:.1f} MB (peak {result['server_peak_rss_mb']:.1f} MB)")
+    for stage, summary in result['latency_ms'].items():
+        if summary.get('count'):
+            print(f"  {stage:<11} p50 {summary['p50_ms']:8.3f} ms  p99 {summary['p99_ms']:8.3f} ms  "
+                  f"p999 {summary['p999_ms']:8.3f} ms")
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Regression messages for throughput drops or end-to-end p99 growth beyond tolerance"""
+    regressions = []
+    previous = {result['scenario']: result for result in baseline['results']}
+    for result in results:
+        old = previous.get(result['scenario'])
+        if old is None:
+            continue
+        if old['config'] != result['config']:
+            print(f"  note: {result['scenario']} ran with a different config than the baseline")
+        if result['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}: throughput {result['throughput']:.0f} readings/s, "
+                               f"baseline {old['throughput']:.0f}")
+        new_p99 = result['latency_ms'].get('end_to_end', {}).get('p99_ms')
+        old_p99 = old['latency_ms'].get('end_to_end', {}).get('p99_ms')
+        if new_p99 is not None and old_p99 and new_p99 > old_p99 * (1 + tolerance):
+            regressions.append(f"{result['scenario']}: end-to-end p99 {new_p99:.3f} ms, baseline {old_p99:.3f} ms")
+    return regressions
+
+
+def bench_pipeline(args):
+    results = []
+    for scenario in args.scenario:
+        print(f"Running {scenario}: {args.devices} devices, {args.rate:g} readings/s, {args.duration:g}s")
+        result = bench_scenario(scenario, args.devices, args.rate, args.duration, args.connections, args.batch)
+        print_result(result)
+        results.append(result)
+
+    report = {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+              'machine': platform.machine(), 'platform': platform.platform(), 'results': results}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return report
+
+
+# DECISION BENCHMARK - PYTHON SNAPSHOT PATH VS ONE CYPHER QUERY PER READING
+DECISION_WARMUP = 20  # queries run first so Neo4j has planned and cached the decision query
+
+
+def snapshot_decision(snapshot, row, previous_row):
+    """Ranked fault names and the top fault's mitigations, as check_faults_and_alert computes them"""
+    from fault_engine import soc_row, MODE_CODE
+
+    rules = snapshot.fault_rules
+    level = soc_row(row['SoC'], snapshot.limit_table['soc_step'], len(snapshot.threshold_table))
+    if level is None:
+        return None, []
+    voltage_roc = row['Voltage'] - previous_row['Voltage'] if previous_row is not None else 0
+    values = [voltage_roc if param == 'Voltage_RoC' else row.get(param, float('nan')) for param in rules.parameters]
+    mode = MODE_CODE['Charging'] if row['Status'] == 1 else MODE_CODE['Discharging']
+    faults = rules.faults_in(rules.evaluate_row(values, snapshot.threshold_table[level], mode))
+    return faults, snapshot.mitigation_names(faults[0]) if faults else []
+
+
+def bench_decision(args, readings):
+    from neo4j import GraphDatabase
+    from graph_snapshot import GraphSnapshotCache
+    from graph_decision import decide_in_graph
+    from latency import LatencyHistogram
+
+    driver = GraphDatabase.driver(args.uri, auth=(args.user, args.password))
+    try:
+        load_started = time.perf_counter()
+        snapshot = GraphSnapshotCache(driver).get()
+        load_time = time.perf_counter() - load_started
+
+        python_latency = LatencyHistogram()
+        python_faults = []
+        previous = None
+        started = time.perf_counter()
+        for row in readings:
+            t = time.perf_counter()
+            faults, _ = snapshot_decision(snapshot, row, previous)
+            python_latency.record(time.perf_counter() - t)
+            python_faults.append(faults)
+            previous = row
+        python_time = time.perf_counter() - started
+
+        graph_latency = LatencyHistogram()
+        graph_faults = []
+        with driver.session() as session:
+            for row in readings[:DECISION_WARMUP]:
+                decide_in_graph(session, row, 'Charging')
+            previous = None
+            started = time.perf_counter()
+            for row in readings:
+                t = time.perf_counter()
+                status = 'Charging' if row['Status'] == 1 else 'Discharging'
+                faults = decide_in_graph(session, row, status, previous)
+                graph_latency.record(time.perf_counter() - t)
+                graph_faults.append(None if faults is None else [f['fault'] for f in faults])
+                previous = row
+            graph_time = time.perf_counter() - started
+    finally:
+        driver.close()
+
+    mismatches = sum(1 for a, b in zip(python_faults, graph_faults) if a != b)
+    print(f"Fault decisions for {len(readings)} readings ({args.uri}):")
+    print(f"  snapshot load (once)  {load_time * 1000:10.1f} ms")
+    for label, elapsed, histogram in (('python snapshot path', python_time, python_latency),
+                                      ('cypher query path', graph_time, graph_latency)):
+        summary = histogram.snapshot()
+        print(f"  {label:<21} {len(readings) / elapsed:10.0f} readings/s  p50 {summary['p50_ms']:8.3f} ms  "
+              f"p99 {summary['p99_ms']:8.3f} ms")
+    print(f"  cypher path is {graph_time / python_time:.0f}x slower per reading, "
+          f"{mismatches} readings with different fault lists")
+    return {'python_s': python_time, 'graph_s': graph_time, 'mismatches': mismatches}
+
+
+if __name__ == "__main__":
+    from load_generator import SCENARIOS
+
+    parser = argparse.ArgumentParser(description="Edge pipeline benchmarks")
+    parser.add_argument('benchmark', choices=['logging', 'pipeline', 'decision'], help="benchmark to run")
+    parser.add_argument('--readings', type=int, default=5000, help="logging/decision: synthetic readings per run")
+    parser.add_argument('--scenario', nargs='+', default=['mixed'], choices=SCENARIOS + ('mixed',),
+                        help="pipeline: scenarios to run, one fresh server each")
+    parser.add_argument('--devices', type=int, default=100, help="pipeline: fleet size")
+    parser.add_argument('--rate', type=float, default=2000, help="pipeline: offered readings/s (0 = unthrottled)")
+    parser.add_argument('--duration', type=float, default=20, help="pipeline: seconds of load per scenario")
+    parser.add_argument('--connections', type=int, default=4, help="pipeline: sender connections")
+    parser.add_argument('--batch', type=int, default=10, help="pipeline: readings per frame")
+    parser.add_argument('--save', help="pipeline: write results as JSON (e.g. a new baseline)")
+    parser.add_argument('--compare', help="pipeline: baseline JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="pipeline: allowed relative regression")
+    parser.add_argument('--uri', default='bolt://localhost:7687', help="decision: Neo4j URI")
+    parser.add_argument('--user', default='neo4j', help="decision: Neo4j user")
+    parser.add_argument('--password', default=os.environ.get('NEO4J_PASSWORD'),
+                        help="decision: Neo4j password (default $NEO4J_PASSWORD)")
+    args = parser.parse_args()
+
+    if args.benchmark == 'logging':
+        bench_logging(synthetic_readings(args.readings))
+    elif args.benchmark == 'decision':
+        bench_decision(args, synthetic_readings(args.readings))
+    else:
+        bench_pipeline(args)
@@ -5,26 +5,87 @@ from colorama import init, Fore
 init(autoreset=True)
 from datetime import datetime, timedelta
 import pandas as pd
-import pickle
 import socket
 import threading
+import asyncio
 import json
+from wire_protocol import read_payload, read_length_async, read_body_async, decode_payload, HEADER, ProtocolError
+from device_state import DeviceStateTable, DEFAULT_DEVICE_ID
+from fault_engine import soc_row, MODE_CODE, TEMP_PARAMETER
+from kg_artifact import ArtifactError
+from kg_reload import load_knowledge_base, KnowledgeBaseWatcher
+from event_log import EventLog
+from action_dispatch import ActionDispatcher, default_handlers
+from ingest_queue import IngestQueue
+from telemetry_store import TelemetryStore
+from event_journal import EventJournal
+from latency import LatencyRecorder, format_report
+
+# LOGGING CONFIGURATION
+LOG_LEVEL = 'INFO'      # 'DEBUG' shows every reading with its limits, 'INFO' only faults, alerts and connections
+LOG_FORMAT = 'console'  # 'console' (coloured text) or 'json' (one JSON object per line)
+log = EventLog(LOG_LEVEL, LOG_FORMAT)
 
 # LOAD KNOWLEDGE GRAPH FROM FILE
-print("Loading knowledge graph from file...")
-with open('knowledge_graph.pkl', 'rb') as f:
-    kg_data = pickle.load(f)
+# knowledge_graph.kgb (compiled by knowledge_graph_pickle.py) is preferred: it is memory-mapped and
+# verified instead of unpickled. A damaged or incompatible artifact stops the monitor rather than
+# running on a graph nobody built; the pickle is only used when there is no artifact at all.
+# While running, a rebuilt file is picked up within KG_RELOAD_INTERVAL seconds (None disables it).
+KG_ARTIFACT = 'knowledge_graph.kgb'
+KG_PICKLE = 'knowledge_graph.pkl'
+KG_RELOAD_INTERVAL = 2.0
+
+log.info('kg_loading', "Loading knowledge graph from file...")
+try:
+    knowledge = load_knowledge_base(KG_ARTIFACT, KG_PICKLE)
+except ArtifactError as e:
+    log.error('kg_rejected', "Knowledge graph artifact rejected: {reason}", reason=str(e))
+    raise SystemExit(1)
 
-print(Fore.GREEN + "Knowledge graph loaded successfully!")
+log.info('kg_loaded', "Knowledge graph loaded successfully! (version {version})", Fore.GREEN,
+         version=knowledge.version)
 
 # SOCKET SERVER CONFIGURATION
 HOST = '0.0.0.0'  # Pi's IP
 PORT = 5000
+SERVER_MODE = 'asyncio'     # 'asyncio' (one event loop for all sensors) or 'threaded' (thread per connection)
+MAX_CONNECTIONS = 4096      # asyncio mode: further connections are refused
+MAX_INFLIGHT_FRAMES = 64    # asyncio mode: frames buffered at once across all connections
+STATS_INTERVAL = 60         # seconds between throughput and latency reports
+STATS_HOST = '127.0.0.1'    # asyncio mode: local stats endpoint, `curl http://127.0.0.1:5001` returns JSON,
+                            # `curl http://127.0.0.1:5001/?reset=1` also starts a new latency interval
+STATS_PORT = 5001           # None disables the endpoint
+
+# ACTION DISPATCH - the mitigations of every raised fault run on the actuators in background threads
+# (action_dispatch.py): Thermal_Runaway actions first, then by severity, with retries and rate limits
+ACTION_LOG = 'actions.log'            # one JSON line per executed action, None disables
+ACTION_NOTIFY = ('127.0.0.1', 5002)   # UDP (host, port) or a Unix datagram socket path, None disables
+ACTION_GPIO_PINS = {                  # BCM pins driven high by an action (recorded only when not on a Pi)
+    'Immediate_Shutdown': 17,
+    'Stop_Charging': 27,
+    'Reduce_Load': 22,
+}
+
+# INGEST QUEUE - the servers only pre-screen and queue readings, one worker evaluates them (ingest_queue.py):
+# readings that could breach a limit are served before the benign backlog, only benign readings are shed
+INGEST_QUEUE = True  # False evaluates every reading on the connection's thread / event loop, in arrival order
+
+# TELEMETRY STORE - every reading and fault event is kept per device on local storage (telemetry_store.py),
+# written in group commits by a background thread; `python telemetry_store.py` inspects it
+TELEMETRY_DIR = 'telemetry'  # None disables
+
+# EVENT JOURNAL - recent readings and fault transitions in a memory-mapped ring file (event_journal.py), so a
+# restarted monitor carries on with every device's previous reading, missing-data timers and confirmed faults
+JOURNAL_PATH = 'monitor.journal'  # None disables
+JOURNAL_RESTORE_AGE = 300         # seconds, devices silent for longer before the restart start fresh
 
 # GLOBAL VARIABLES
-interpolated_limits = None
-previous_row = None
-last_received = {param: datetime.now() for param in ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity']}
+# knowledge (above) is the KnowledgeBase in service: compiled rules, limit and threshold tables,
+# severities and mitigations of one KG version. It is only ever replaced as a whole by swap_knowledge().
+device_states = DeviceStateTable()  # rate-of-change and missing-data state per battery
+MISSING_DATA_TIMEOUT = 30  # seconds without a value before alerting
+latency = LatencyRecorder()  # per-stage latency histograms, reset after every periodic report
+readings_processed = 0  # readings through fault detection since startup
 
 # SOCKET SERVER FUNCTIONS
 def start_data_server():
@@ -32,13 +93,13 @@ def start_data_server():
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.bind((HOST, PORT))
-    server_socket.listen(1)
-    print(Fore.GREEN + f"Data server listening on {HOST}:{PORT}")
-    print("Waiting for laptop connection...")
+    server_socket.listen(socket.SOMAXCONN)
+    log.info('server_listening', "Data server listening on {host}:{port}", Fore.GREEN, host=HOST, port=PORT)
+    log.info('server_waiting', "Waiting for laptop connection...")
     
     while True:
         client_socket, addr = server_socket.accept()
-        print(Fore.CYAN + f"Connection established from {addr}")
+        log.info('client_connected', "Connection established from {addr}", Fore.CYAN, addr=addr)
         
         # Handle client in a thread
         client_thread = threading.Thread(
@@ -50,29 +111,206 @@ def start_data_server():
 
 def handle_client(client_socket):
     """Handle incoming data from laptop"""
-    global previous_row
-    
     try:
         while True:
-            data = client_socket.recv(4096).decode('utf-8')
-            if not data:
+            # One frame holds one reading or a batch of readings
+            payload = read_payload(client_socket)
+            if payload is None:
                 break
+            received_at = time.monotonic()
+            readings = decode_payload(payload)
+            latency.record('parse', time.monotonic() - received_at)
                 
-            print(Fore.GREEN + f"Received sensor data")
+            log.debug('frame_received', "Received sensor data ({readings} readings)", Fore.GREEN,
+                      readings=len(readings))
             
-            # Parse JSON data
-            sensor_data = json.loads(data)
-            process_realtime_data(sensor_data, client_socket)
+            if ingest is not None:
+                ingest.put(readings, received_at)
+                continue
+            for sensor_data in readings:
+                process_realtime_data(sensor_data, client_socket, received_at)
             
+    except ProtocolError as e:
+        log.error('protocol_error', "Protocol error, dropping connection: {error}", error=e)
     except Exception as e:
-        print(Fore.RED + f"Client connection error: {e}")
+        log.error('client_error', "Client connection error: {error}", error=e)
     finally:
         client_socket.close()
-        print(Fore.YELLOW + "Client disconnected")
+        log.info('client_disconnected', "Client disconnected", Fore.YELLOW)
+
+# ASYNCIO SERVER FUNCTIONS
+class ConnectionStats:
+    """Throughput counters for one sensor connection"""
+    __slots__ = ('addr', 'connected_at', 'frames', 'readings', 'bytes')
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.connected_at = time.monotonic()
+        self.frames = 0
+        self.readings = 0
+        self.bytes = 0
+
+    def as_fields(self):
+        elapsed = max(time.monotonic() - self.connected_at, 1e-9)
+        return {'addr': self.addr, 'frames': self.frames, 'readings': self.readings, 'bytes': self.bytes,
+                'seconds': round(elapsed, 3), 'readings_per_s': round(self.readings / elapsed, 1)}
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.connected_at, 1e-9)
+        return (f"{self.addr}: {self.frames} frames, {self.readings} readings, {self.bytes} bytes "
+                f"in {elapsed:.1f}s ({self.readings / elapsed:.1f} readings/s)")
+
+connection_stats = {}
+
+async def start_async_data_server():
+    """Serve every sensor connection from one asyncio event loop until cancelled"""
+    frame_budget = asyncio.Semaphore(MAX_INFLIGHT_FRAMES)
+    client_tasks = set()
+
+    def on_connect(reader, writer):
+        # One task per connection, kept here so shutdown can cancel it (cancellation propagates out of it)
+        task = asyncio.create_task(handle_client_async(reader, writer, frame_budget))
+        client_tasks.add(task)
+        task.add_done_callback(client_tasks.discard)
+
+    server = await asyncio.start_server(on_connect, HOST, PORT, backlog=socket.SOMAXCONN, reuse_address=True)
+    log.info('server_listening', "Async data server listening on {host}:{port}", Fore.GREEN, host=HOST, port=PORT)
+    log.info('server_waiting', "Waiting for sensor connections...")
+
+    stats_server = None
+    if STATS_PORT is not None:
+        stats_server = await asyncio.start_server(serve_stats, STATS_HOST, STATS_PORT, reuse_address=True)
+        log.info('stats_listening', "Stats endpoint on http://{host}:{port}", Fore.GREEN, host=STATS_HOST, port=STATS_PORT)
+
+    reporter = asyncio.create_task(report_connection_stats())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # Stop accepting, then let every connection finish its current frame and close
+        reporter.cancel()
+        server.close()
+        if stats_server is not None:
+            stats_server.close()
+        for task in list(client_tasks):
+            task.cancel()
+        await asyncio.gather(*client_tasks, reporter, return_exceptions=True)
+        log.info('server_stopped', "Async data server stopped", Fore.YELLOW)
+
+async def handle_client_async(reader, writer, frame_budget):
+    """Handle one sensor connection, reading and processing one frame at a time"""
+    addr = writer.get_extra_info('peername')
+    if len(connection_stats) >= MAX_CONNECTIONS:
+        log.warning('connection_refused', "Connection limit reached, refusing {addr}", Fore.RED, addr=addr)
+        writer.close()
+        return
+
+    stats = ConnectionStats(addr)
+    connection_stats[id(stats)] = stats
+    log.info('client_connected', "Connection established from {addr}", Fore.CYAN, addr=addr)
+
+    try:
+        while True:
+            # An idle connection waits for its next header without a budget slot. Holding a slot while
+            # reading the body and processing keeps memory bounded; the next frame is not read until this
+            # one is done (or queued), so a fast sender is slowed down by TCP flow control
+            length = await read_length_async(reader)
+            if length is None:
+                break
+            async with frame_budget:
+                payload = await read_body_async(reader, length)
+                received_at = time.monotonic()
+                readings = decode_payload(payload)
+                latency.record('parse', time.monotonic() - received_at)
+
+                stats.frames += 1
+                stats.readings += len(readings)
+                stats.bytes += HEADER.size + len(payload)
+
+                if ingest is not None:
+                    ingest.put(readings, received_at)
+                else:
+                    for sensor_data in readings:
+                        process_realtime_data(sensor_data, None, received_at)
 
-def process_realtime_data(sensor_data, client_socket):
-    """Process real-time sensor data and check for faults"""
-    global previous_row, last_received
+            # Let other connections run between frames
+            await asyncio.sleep(0)
+
+    except ProtocolError as e:
+        log.error('protocol_error', "Protocol error from {addr}, dropping connection: {error}", addr=addr, error=e)
+    except ConnectionError:
+        pass
+    except Exception as e:
+        log.error('client_error', "Client connection error: {error}", addr=addr, error=e)
+    finally:
+        del connection_stats[id(stats)]
+        writer.close()
+        log.info('client_disconnected', "Client disconnected - {summary}", Fore.YELLOW,
+                 summary=stats.summary(), **stats.as_fields())
+
+async def report_connection_stats():
+    """Periodically log total and per-connection throughput"""
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        active = list(connection_stats.values())
+        total = sum(stats.readings for stats in active)
+        log.info('throughput', "Throughput report: {connections} connections, {readings} readings on open connections",
+                 Fore.CYAN, connections=len(active), readings=total)
+        for stats in active:
+            log.info('connection_throughput', "  {summary}", Fore.CYAN, summary=stats.summary(), **stats.as_fields())
+        report_latency()
+
+async def serve_stats(reader, writer):
+    """Local stats endpoint: answers any request with the current latency and throughput as JSON"""
+    request = b''
+    try:
+        # Read the request line so closing does not reset the client's connection
+        request = await asyncio.wait_for(reader.readline(), timeout=1.0)
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    stats = latency.snapshot(reset=b'reset=1' in request)
+    stats['readings_processed'] = readings_processed
+    stats['kg_version'] = knowledge.version
+    stats['kg_loaded_at'] = knowledge.loaded_at
+    stats['actions'] = dispatcher.stats()
+    if ingest is not None:
+        stats['ingest'] = ingest.stats()
+    if telemetry is not None:
+        stats['telemetry'] = telemetry.stats()
+    if journal is not None:
+        stats['journal'] = journal.stats()
+    stats['connections'] = [connection.as_fields() for connection in connection_stats.values()]
+    body = json.dumps(stats, default=str).encode('utf-8')
+    writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n"
+                 + f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+def report_latency():
+    """Log the per-stage latency percentiles of the last interval and start a new one"""
+    log.info('latency', lambda fields: Fore.CYAN + format_report(fields), **latency.snapshot(reset=True))
+    if ingest is not None:
+        log.info('ingest_queue', "Ingest queue: {urgent_depth} urgent / {benign_depth} benign queued "
+                 "(peak {peak_urgent} / {peak_benign}), {coalesced} coalesced, {dropped} dropped", Fore.CYAN,
+                 **ingest.stats(reset_peaks=True))
+
+def process_realtime_data(sensor_data, client_socket, received_at=None):
+    """Process real-time sensor data and check for faults.
+
+    received_at is the monotonic time the reading's frame arrived. Readings stamped with the
+    sender's monotonic 'SentAt' also record transit and end-to-end latency (same-host senders only).
+    """
+    global readings_processed
+    sent_at = sensor_data.get('SentAt')
+    if sent_at is not None and received_at is not None:
+        latency.record('transit', received_at - sent_at)
+
+    # Every battery keeps its own previous reading and missing-data timers
+    device_id = str(sensor_data.get('DeviceID', DEFAULT_DEVICE_ID))
+    state = device_states.get(device_id)
     
     # Convert sensor data to row format
     row = {
@@ -85,361 +323,293 @@ def process_realtime_data(sensor_data, client_socket):
         'Status': int(sensor_data.get('Status', 0))
     }
     
-    # Update last received timestamps
-    for param in last_received:
-        if row[param] > 0:
-            last_received[param] = datetime.now()
-    
-    # Check for missing data
-    for param in ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity']:
-        if row[param] == 0:
-            if (datetime.now() - last_received[param]).total_seconds() > 30:
-                print(Fore.RED + f"ALERT: {param} data missing for >30s")
-    
-    print()
-    elapsed = datetime.now() - start_time
-    print(f"Monitoring time: {str(elapsed).split('.')[0]}")
+    # Update last received timestamps and check for missing data
+    for param, silent_for in state.update_last_received(row, time.monotonic()):
+        if silent_for > MISSING_DATA_TIMEOUT:
+            log.warning('data_missing', "ALERT: {device} {parameter} data missing for >{timeout}s", Fore.RED,
+                        device=device_id, parameter=param, timeout=MISSING_DATA_TIMEOUT, silent_for=silent_for)
     
     # Determine operating status
     status_str = "Charging" if row['Status'] == 1 else "Discharging"
     
-    print(pd.DataFrame([row]))
-    print(f"Status: ({status_str})")
+    # Per-reading view only in DEBUG, production mode builds no strings or DataFrames here
+    if log.debug_enabled:
+        log.debug('reading', render_reading, device=device_id, status=status_str, reading=row)
     
-    # Run fault detection
-    faults, previous_row = check_faults_and_alert(row, status_str, previous_row)
+    # Trend statistics over this device's window, timed by the sensor's 'Timestamp' (seconds) when it sends one
+    timestamp = sensor_data.get('Timestamp')
+    if timestamp is None:
+        timestamp = received_at if received_at is not None else time.monotonic()
+    trends = state.update_trends(knowledge.trend_features, float(timestamp), row)
+
+    # Run fault detection against this device's own previous reading
+    faults, state.previous_row = check_faults_and_alert(row, status_str, state.previous_row, device_id, trends, state)
+    readings_processed += 1
+    if telemetry is not None:
+        telemetry.append(device_id, time.time(), row)
+    if journal is not None:
+        journal.record_reading(device_id, row)
+    if sent_at is not None:
+        latency.record('end_to_end', time.monotonic() - sent_at)
     
 
-# KNOWLEDGE GRAPH PROCESSING FUNCTIONS
-def precalculate_interpolated_limits():
-    """Pre-calculate ALL SoC-dependent limits for SoC 0-100 using interpolation"""
-    
-    param_limits = kg_data['parameter_limits']
-    
-    print(f"Found SoC levels with defined limits:")
-    for param, limits in param_limits.items():
-        if 'limits_per_soc' in limits:
-            print(f"  {param}: {len(limits['limits_per_soc'])} SoC levels")
-    
-    print()
-    # Pre-calculate interpolated limits for all SoC levels 0-100 for all parameters
-    all_limits = {}
-    total_socs = 101  # 0 to 100 inclusive
-    
-    print(f"Calculating interpolated limits for all parameters:")
-    print(Fore.CYAN + "Progress: [", end="")
-    
-    for soc in range(0, 101):
-        # Simple progress indicator
-        if soc % 10 == 0:
-            print(Fore.CYAN + "█", end="")
-        
-        all_limits[soc] = {}
-        
-        # Interpolate Voltage limits
-        if 'Voltage' in param_limits and 'limits_per_soc' in param_limits['Voltage']:
-            voltage_data = param_limits['Voltage']['limits_per_soc']
-            voltage_socs = [item['soc'] for item in voltage_data]
-            
-            if soc in voltage_socs:
-                # Exact match found
-                exact_data = next(item for item in voltage_data if item['soc'] == soc)
-                all_limits[soc]['Voltage'] = {
-                    'Volt_lower_Limit': exact_data['v_min'],
-                    'Volt_upper_Limit': exact_data['v_max']
-                }
-            else:
-                # Interpolate
-                lower_soc = max([s for s in voltage_socs if s <= soc], default=None)
-                upper_soc = min([s for s in voltage_socs if s >= soc], default=None)
-                
-                if lower_soc is not None and upper_soc is not None:
-                    ratio = (soc - lower_soc) / (upper_soc - lower_soc)
-                    
-                    lower_data = next(item for item in voltage_data if item['soc'] == lower_soc)
-                    upper_data = next(item for item in voltage_data if item['soc'] == upper_soc)
-                    
-                    all_limits[soc]['Voltage'] = {
-                        'Volt_lower_Limit': round(lower_data['v_min'] + (upper_data['v_min'] - lower_data['v_min']) * ratio, 3),
-                        'Volt_upper_Limit': round(lower_data['v_max'] + (upper_data['v_max'] - lower_data['v_max']) * ratio, 3)
-                    }
-                else:
-                    all_limits[soc]['Voltage'] = {'Volt_lower_Limit': 3.0, 'Volt_upper_Limit': 4.2}
-        
-        # Interpolate Impedance limits
-        if 'Impedance' in param_limits and 'limits_per_soc' in param_limits['Impedance']:
-            impedance_data = param_limits['Impedance']['limits_per_soc']
-            impedance_socs = [item['soc'] for item in impedance_data]
-            
-            if soc in impedance_socs:
-                exact_data = next(item for item in impedance_data if item['soc'] == soc)
-                all_limits[soc]['Impedance'] = {
-                    'Impedance_lower_Limit': exact_data['imp_min'],
-                    'Impedance_upper_Limit': exact_data['imp_max']
-                }
-            else:
-                lower_soc = max([s for s in impedance_socs if s <= soc], default=None)
-                upper_soc = min([s for s in impedance_socs if s >= soc], default=None)
-                
-                if lower_soc is not None and upper_soc is not None:
-                    ratio = (soc - lower_soc) / (upper_soc - lower_soc)
-                    
-                    lower_data = next(item for item in impedance_data if item['soc'] == lower_soc)
-                    upper_data = next(item for item in impedance_data if item['soc'] == upper_soc)
-                    
-                    all_limits[soc]['Impedance'] = {
-                        'Impedance_lower_Limit': round(lower_data['imp_min'] + (upper_data['imp_min'] - lower_data['imp_min']) * ratio, 4),
-                        'Impedance_upper_Limit': round(lower_data['imp_max'] + (upper_data['imp_max'] - lower_data['imp_max']) * ratio, 4)
-                    }
-                else:
-                    all_limits[soc]['Impedance'] = {'Impedance_lower_Limit': 0.0, 'Impedance_upper_Limit': 0.05}
-        
-        # Voltage Rate of Change limits
-        if 'Voltage_RoC' in param_limits:
-            all_limits[soc]['Voltage_RoC'] = {
-                'Rate_of_Change_Upper_Limit': param_limits['Voltage_RoC']['max']
-            }
-    
-    print(Fore.CYAN + "] 100%")
-    return all_limits
-
-# CHARGING SAFETY CHECK
-def check_charging_safety(row, status):
-    """Check for overcharging conditions during charging"""
-    if status != "Charging":
-        return None
-    
-    current_voltage = row.get('Voltage')
-    current_soc = int(row.get('SoC')) if not pd.isna(row.get('SoC')) else 0
-    
-    if interpolated_limits and current_soc in interpolated_limits:
-        voltage_limits = interpolated_limits[current_soc].get('Voltage', {})
-        max_voltage = voltage_limits.get('Volt_upper_Limit', 4.2)
-        
-        if current_voltage > max_voltage:
-            return "Overvoltage_Charging"
-    
-    return None
+# CONSOLE VIEWS - only called when the console format is active and the event's level is enabled
+def render_reading(fields):
+    elapsed = datetime.now() - start_time
+    return "\n".join(["", f"Monitoring time: {str(elapsed).split('.')[0]}",
+                      f"Device: {fields['device']}",
+                      str(pd.DataFrame([fields['reading']])),
+                      f"Status: ({fields['status']})"])
+
+def render_limits(fields):
+    lines = [Fore.LIGHTBLACK_EX + f"LOGIC CHECK: For SoC {fields['soc']:g}% - Limits:"]
+    lines += [Fore.LIGHTBLACK_EX + f"  {name}: {limit:g}" for name, limit in fields['limits'].items()]
+    return "\n".join(lines)
+
+def render_fault(fields):
+    lines = [Fore.RED + f"FAULT DETECTED: {fields['fault']}"]
+    if len(fields['faults']) > 1:
+        lines.append(Fore.RED + f"Concurrent faults: {', '.join(fields['faults'][1:])}")
+    if fields['mitigations']:
+        # Display mitigations
+        lines.append(Fore.YELLOW + 'Recommended Actions:')
+        for act in fields['mitigations']:
+            if act and ("Alert" in act or "Warning" in act or "Evacuation" in act):
+                lines.append(Fore.RED + f"WARNING: {act}")
+            elif act:
+                lines.append(Fore.CYAN + f"{act}")
+    return "\n".join(lines)
+
+
+# KNOWLEDGE GRAPH HOT RELOAD
+def swap_knowledge(new_knowledge):
+    """Put a KnowledgeBase built by the watcher thread in service; readings already running keep the old one"""
+    global knowledge
+    old_version = knowledge.version
+    knowledge = new_knowledge
+    log.info('kg_reloaded', "Knowledge graph reloaded: version {old_version} -> {version}", Fore.GREEN,
+             old_version=old_version, version=new_knowledge.version, source=new_knowledge.source,
+             rules=len(new_knowledge.kg_data['fault_rules']))
+
+def report_reload_error(error):
+    log.error('kg_reload_failed', "Knowledge graph reload failed, keeping version {version}: {reason}",
+              version=knowledge.version, reason=str(error))
+
+
+# ACTIONS
+def report_action_error(event, handler, error):
+    log.error('action_failed', "Action {action} for {fault} failed: {reason}", device=event['device'],
+              action=event['action'], fault=event['fault'], handler=type(handler).__name__, reason=str(error))
+
+dispatcher = ActionDispatcher(default_handlers(ACTION_LOG, ACTION_NOTIFY, ACTION_GPIO_PINS),
+                              on_error=report_action_error)
+
+
+# INGEST QUEUE
+def process_queued(sensor_data, received_at):
+    process_realtime_data(sensor_data, None, received_at)
+
+def report_ingest_error(sensor_data, error):
+    log.error('reading_error', "Reading could not be processed: {error}", device=sensor_data.get('DeviceID'),
+              error=error)
+
+ingest = IngestQueue(process_queued, lambda: knowledge.prescreen, latency, on_error=report_ingest_error,
+                     history=lambda device: device_states.get(device).trends) if INGEST_QUEUE else None
+
+
+# TELEMETRY STORE
+def report_store_error(error):
+    log.error('telemetry_failed', "Telemetry commit failed: {reason}", reason=str(error))
+
+telemetry = None  # TelemetryStore, opened by the main loop only (importing this module writes no files)
+
+
+# EVENT JOURNAL
+def restore_from_journal():
+    """Rebuild the device states saved in the journal. Faults that were confirmed stay confirmed (no second
+    'raised'), their actions run again only once a fresh reading hits them (see check_faults_and_alert)."""
+    now_wall, now = time.time(), time.monotonic()
+    recovered = journal.recover(JOURNAL_RESTORE_AGE, now_wall)
+    for device, saved in recovered.items():
+        # wall-clock times of the previous run -> this run's monotonic clock
+        last_received = [None if seen is None else now - (now_wall - seen) for seen in saved['last_received']]
+        confirmed = 0
+        for fault in saved['faults'] or []:
+            if fault in knowledge.fault_rules.fault_index:
+                confirmed |= 1 << knowledge.fault_rules.fault_index[fault]
+        policy = knowledge.debounce if saved['faults'] is not None else None
+        device_states.get(device).restore(saved['row'], last_received, policy, confirmed)
+        if confirmed:
+            log.warning('fault_restored', "Fault active before restart, awaiting a fresh reading: {faults}", Fore.RED,
+                        device=device, faults=knowledge.fault_rules.faults_in(confirmed), kg_version=knowledge.version)
+    log.info('journal_restored', "Restored {devices} devices from the journal ({records} records scanned in {ms:.1f} ms)",
+             Fore.GREEN, devices=len(recovered), records=len(journal.records), ms=journal.scan_ms)
+    journal.records = []  # only needed for the restore
+
+journal = None  # EventJournal, opened by the main loop only (a benchmark importing this module must not replay it)
+
 
 # CHECK FAULTS AND ALERT
-def check_faults_and_alert(row, status, previous_row=None):
-    global interpolated_limits
-    
+def check_faults_and_alert(row, status, previous_row=None, device_id=DEFAULT_DEVICE_ID, trends=None, state=None):
+    """Evaluate one reading and report its faults. With the device's DeviceState the faults are
+    debounced (fault_debounce.py): a fault is reported when it is confirmed, not on every raw hit."""
+    started = time.perf_counter()
     triggered = {}
+    # One read of the global: this reading is evaluated and reported entirely with this version
+    kb = knowledge
+    fault_rules, limit_table = kb.fault_rules, kb.limit_table
+    # The device's limit profile (chemistry / pack build) selects its threshold table
+    profile = kb.profile_id(device_id)
+    threshold_table = kb.threshold_tables[profile]
     
     # Calculate rate of change if previous row exists
     voltage_roc = 0
     if previous_row is not None and 'Voltage' in previous_row and 'Voltage' in row:
         voltage_roc = row['Voltage'] - previous_row['Voltage']
     
-    current_voltage = row.get('Voltage')
-    current_impedance = row.get('Impedance') 
-    current_inttemp = row.get('IntTemp')
-    current_surftemp = row.get('SurfaceTemp')
-    current_capacity = row.get('Capacity')
-    current_soc = int(row.get('SoC')) if not pd.isna(row.get('SoC')) else 0
-
-    # Use pre-calculated interpolated limits
-    if interpolated_limits and current_soc in interpolated_limits:
-        soc_limits = interpolated_limits[current_soc]
-        
-        # DEBUG: Show limits being used
-        print(Fore.LIGHTBLACK_EX + f"LOGIC CHECK: For SoC {current_soc}% - Limits:")
-        for param, limits in soc_limits.items():
-            print(Fore.LIGHTBLACK_EX + f"  {param}: {limits}")
-    else:
-        print(Fore.RED + f"ERROR: No interpolated limits found for SoC {current_soc}")
-        print("_" * 40)
-        print()
-        return triggered, row
-
-    # Get limits from kg_data
-    limits_dict = {}
-    param_limits = kg_data['parameter_limits']
-    
-    # Add SoC-independent limits
-    if 'IntTemp' in param_limits:
-        limits_dict[('IntTemp', 'Temperature_Upper_Limit')] = param_limits['IntTemp']['max']
-    if 'SurfaceTemp' in param_limits:
-        limits_dict[('SurfaceTemp', 'Surface_Temperature_Upper_Limit')] = param_limits['SurfaceTemp']['max']
-    if 'Capacity' in param_limits:
-        limits_dict[('Capacity', 'Capacity_Lower_Limit')] = param_limits['Capacity']['min']
-    
-    # Add interpolated SoC-dependent limits
-    if 'Voltage' in soc_limits:
-        limits_dict[('Voltage', 'Volt_lower_Limit')] = soc_limits['Voltage']['Volt_lower_Limit']
-        limits_dict[('Voltage', 'Volt_upper_Limit')] = soc_limits['Voltage']['Volt_upper_Limit']
-    
-    if 'Impedance' in soc_limits:
-        limits_dict[('Impedance', 'Impedance_lower_Limit')] = soc_limits['Impedance']['Impedance_lower_Limit']
-        limits_dict[('Impedance', 'Impedance_upper_Limit')] = soc_limits['Impedance']['Impedance_upper_Limit']
-    
-    if 'Voltage_RoC' in soc_limits:
-        limits_dict[('Voltage_RoC', 'Rate_of_Change_Upper_Limit')] = soc_limits['Voltage_RoC']['Rate_of_Change_Upper_Limit']
-
-    # FAULT DETECTION LOGIC
-    faults_detected = []
-
-    # OVERCHARGE DETECTION
-    charging_fault = check_charging_safety(row, status)
-    if charging_fault:
-        faults_detected.append(charging_fault)
-
-    # 1. Sudden Voltage Drop (Rate of Change)
-    roc_key = ('Voltage_RoC', 'Rate_of_Change_Upper_Limit')
-    if roc_key in limits_dict and abs(voltage_roc) > limits_dict[roc_key]:
-        if voltage_roc < 0:
-            faults_detected.append('Sudden_Voltage_Drop')
-
-    # 2. Deep Voltage Drop (Absolute low voltage)
-    v_lower_key = ('Voltage', 'Volt_lower_Limit')
-    if v_lower_key in limits_dict and current_voltage < limits_dict[v_lower_key] - 0.5:
-        faults_detected.append('Deep_Voltage_Drop')
-
-    # 3. Undervolt [V only]
-    if v_lower_key in limits_dict and current_voltage < limits_dict[v_lower_key]:
-        imp_upper_key = ('Impedance', 'Impedance_upper_Limit')
-        if current_impedance <= limits_dict.get(imp_upper_key, float('inf')):
-            faults_detected.append('Undervolt_V_Only')
-
-    # 4. Undervolt [V and Imp] -> Battery Aging
-    imp_upper_key = ('Impedance', 'Impedance_upper_Limit')
-    if (v_lower_key in limits_dict and current_voltage < limits_dict[v_lower_key] and
-        imp_upper_key in limits_dict and current_impedance > limits_dict[imp_upper_key]):
-        faults_detected.append('Battery_Aging')
-
-    # 5. Sudden Voltage Increase
-    if roc_key in limits_dict and voltage_roc > limits_dict[roc_key]:
-        faults_detected.append('Sudden_Voltage_Increase')
-
-    # 6. Overvoltage [V only]
-    v_upper_key = ('Voltage', 'Volt_upper_Limit')
-    if v_upper_key in limits_dict and current_voltage > limits_dict[v_upper_key]:
-        if current_impedance <= limits_dict.get(imp_upper_key, float('inf')):
-            faults_detected.append('Overvoltage_V_Only')
-
-    # 7. Overvoltage [V & Imp]
-    if (v_upper_key in limits_dict and current_voltage > limits_dict[v_upper_key] and
-        imp_upper_key in limits_dict and current_impedance > limits_dict[imp_upper_key]):
-        faults_detected.append('Overvoltage_V_Imp')
-
-    # 8. Battery Aging [Impedance]
-    if (imp_upper_key in limits_dict and current_impedance > limits_dict[imp_upper_key] and
-        current_voltage >= limits_dict.get(v_lower_key, 0) and 
-        current_voltage <= limits_dict.get(v_upper_key, float('inf'))):
-        faults_detected.append('Battery_Aging_Impedance')
-
-    # 9. Battery Aging [Int Temp]
-    int_temp_key = ('IntTemp', 'Temperature_Upper_Limit')
-    if (int_temp_key in limits_dict and current_inttemp > limits_dict[int_temp_key] and
-        current_inttemp > 60):  # Thermal runaway threshold
-        faults_detected.append('Thermal_Runaway')
-    elif int_temp_key in limits_dict and current_inttemp > limits_dict[int_temp_key]:
-        faults_detected.append('Battery_Aging_IntTemp')
-
-    # 10. Battery Aging [Surface Temp]  
-    surf_temp_key = ('SurfaceTemp', 'Surface_Temperature_Upper_Limit')
-    if (surf_temp_key in limits_dict and current_surftemp > limits_dict[surf_temp_key] and
-        current_surftemp > 55):  # Thermal runaway threshold
-        faults_detected.append('Thermal_Runaway')
-    elif surf_temp_key in limits_dict and current_surftemp > limits_dict[surf_temp_key]:
-        faults_detected.append('Battery_Aging_SurfTemp')
-
-    # 11. Battery Aging [Capacity]
-    cap_key = ('Capacity', 'Capacity_Lower_Limit')
-    if cap_key in limits_dict and current_capacity < limits_dict[cap_key]:
-        faults_detected.append('Battery_Aging_Capacity')
-
-    # 12. Battery Aging [All] - Multiple parameters indicating aging
-    aging_count = 0
-    if imp_upper_key in limits_dict and current_impedance > limits_dict[imp_upper_key]:
-        aging_count += 1
-    if int_temp_key in limits_dict and current_inttemp > limits_dict[int_temp_key]:
-        aging_count += 1  
-    if surf_temp_key in limits_dict and current_surftemp > limits_dict[surf_temp_key]:
-        aging_count += 1
-    if cap_key in limits_dict and current_capacity < limits_dict[cap_key]:
-        aging_count += 1
-        
-    if aging_count >= 3:
-        faults_detected.append('Battery_Aging_All')
+    current_soc = row.get('SoC', float('nan'))
+    soc_level = soc_row(current_soc, limit_table['soc_step'], len(threshold_table))
 
-    # GET MITIGATIONS FOR DETECTED FAULTS
+    # Use the pre-calculated limit table row nearest to the reported SoC
+    if soc_level is None:
+        log.error('soc_out_of_range', "ERROR: No interpolated limits found for SoC {soc}", device=device_id, soc=current_soc)
+        return triggered, row
+    if log.debug_enabled:
+        # DEBUG: Show limits being used
+        log.debug('limits', render_limits, device=device_id, soc=soc_level * limit_table['soc_step'],
+                  profile=kb.profiles[profile],
+                  limits=dict(zip(fault_rules.limit_names, kb.soc_limit_tables[profile][soc_level].tolist())))
+
+    # FAULT DETECTION LOGIC - one pass of the rule table compiled from the knowledge graph
+    trends = trends or {}
+    values = [voltage_roc if param == 'Voltage_RoC' else row[param] if param in row else trends.get(param, float('nan'))
+              for param in fault_rules.parameters]
+    thresholds = kb.thresholds(profile, soc_level, row.get(TEMP_PARAMETER, float('nan')))
+    mode = MODE_CODE.get(status, MODE_CODE['Unknown'])
+    bitmask = fault_rules.evaluate_row(values, thresholds, mode)
+    raised = bitmask
+    if state is not None:
+        raw = bitmask
+        bitmask, raised, cleared = state.confirm_faults(kb.debounce, raw)
+        if state.restored:
+            # restored from the journal: a fault hit again is reported and its actions run, as if raised now
+            again = state.restored & raw & bitmask
+            state.restored &= bitmask & ~again
+            raised |= again
+        if journal is not None and (raised or cleared):
+            journal.record_faults(device_id, fault_rules.faults_in(bitmask))
+        if cleared:
+            log.info('fault_cleared', "Fault cleared: {faults}", Fore.GREEN, device=device_id,
+                     faults=fault_rules.faults_in(cleared), kg_version=kb.version)
+            if telemetry is not None:
+                telemetry.append_event(device_id, 'cleared', fault_rules.faults_in(cleared), kg_version=kb.version)
+        if raw & ~bitmask and log.debug_enabled:
+            log.debug('fault_pending', "DEBUG: Awaiting confirmation: {faults}", Fore.LIGHTBLACK_EX,
+                      device=device_id, faults=fault_rules.faults_in(raw & ~bitmask))
+    faults_detected = fault_rules.faults_in(bitmask)  # confirmed faults, highest priority first
+    evaluated = time.perf_counter()
+    latency.record('evaluate', evaluated - started)
+
+    # MITIGATION PLAN FOR ALL DETECTED FAULTS
     if faults_detected:
-        # Get fault severities from kg_data
-        fault_severities = []
-        for fault in faults_detected:
-            if fault in kg_data['faults_detailed']:
-                severity = kg_data['faults_detailed'][fault]['severity']
-                fault_severities.append({'fault': fault, 'severity': severity})
+        # Faults are already ordered by severity (lowest number = highest priority)
+        ranked = [fault for fault in faults_detected if fault in kb.severities]
         
-        # Sort by severity (lowest number = highest priority)
-        fault_severities.sort(key=lambda x: x['severity'])
-        
-        if fault_severities:
-            # Get the highest priority fault
-            highest_priority_fault = fault_severities[0]
-            fault_name = highest_priority_fault['fault']
-            fault_severity = highest_priority_fault['severity']
+        if ranked:
+            fault_name = ranked[0]
+            fault_severity = kb.severities[fault_name]
             
-            # Get mitigations from kg_data
-            fault_mitigations = []
-            if fault_name in kg_data['mitigations']:
-                fault_mitigations = kg_data['mitigations'][fault_name]['mitigations']
+            # Mitigations of every concurrent fault, merged in priority order without duplicates and
+            # filtered by operating mode (precomputed per fault bit, see mitigation_plan.py)
+            plan = kb.planner.plan(bitmask, mode)
+            actions = [action for action, _ in plan]
+            latency.record('decide', time.perf_counter() - evaluated)
             
-            # Print only the highest priority fault with its mitigations
-            print(Fore.RED + f"FAULT DETECTED: {fault_name}")
-
-            if fault_mitigations:
-                # Display mitigations
-                print(Fore.YELLOW + 'Recommended Actions:')
-                for act in fault_mitigations:
-                    if act and ("Alert" in act or "Warning" in act or "Evacuation" in act):
-                        print(Fore.RED + f"WARNING: {act}")
-                    elif act:
-                        print(Fore.CYAN + f"{act}")
+            # Report the faults with the merged plan, once when a fault is raised
+            if raised:
+                log.warning('fault', render_fault, device=device_id, fault=fault_name, severity=fault_severity,
+                            mitigations=actions, faults=faults_detected, raised=fault_rules.faults_in(raised),
+                            profile=kb.profiles[profile], kg_version=kb.version)
+                # Run the newly raised faults' actions, queued only - handlers never block this reading
+                raised_plan = kb.planner.plan(raised, mode)
+                dispatcher.submit(device_id, raised_plan, kb.severities, kg_version=kb.version)
+                if telemetry is not None:
+                    telemetry.append_event(device_id, 'raised', fault_rules.faults_in(raised),
+                                           mitigations=[action for action, _ in raised_plan], kg_version=kb.version)
+            else:
+                log.debug('fault_active', "DEBUG: Still active: {fault}", Fore.LIGHTBLACK_EX,
+                          device=device_id, fault=fault_name, faults=faults_detected)
             
-            # DEBUG: Show all detected faults for reference
-            print(Fore.LIGHTMAGENTA_EX + f"DEBUG: All detected faults: {faults_detected}")
-            print(Fore.CYAN + f"DEBUG: Showing highest priority: {fault_name} (severity {fault_severity})")
+            # DEBUG: Which fault asked for each action
+            if log.debug_enabled:
+                log.debug('fault_detail', "DEBUG: Mitigation plan: {plan}", Fore.LIGHTMAGENTA_EX,
+                          device=device_id, plan=[f"{action} ({fault})" for action, fault in plan])
             
-            # Store only the highest priority fault in triggered for tracking
-            triggered[fault_name] = fault_mitigations
-        else:
-            print(Fore.YELLOW + f"Warning: No severity data found for faults: {faults_detected}")
+            # Every confirmed fault with the actions applicable to it in this mode
+            for fault in ranked:
+                triggered[fault] = kb.planner.fault_actions(fault, mode)
+        elif raised:
+            log.warning('fault_unranked', "Warning: No severity data found for faults: {faults}",
+                        device=device_id, faults=faults_detected, kg_version=kb.version)
+            if telemetry is not None:
+                telemetry.append_event(device_id, 'raised', fault_rules.faults_in(raised), kg_version=kb.version)
     else:
-        print(Fore.GREEN + "Normal - No faults detected")
+        latency.record('decide', time.perf_counter() - evaluated)
+        log.debug('normal', "Normal - No faults detected", Fore.GREEN, device=device_id, kg_version=kb.version)
 
-    print("_" * 80)
+    if log.debug_enabled and log.console:
+        log.write("_" * 80)
     return triggered, row
 
 # INITIALIZATION
-print("Initializing real-time battery monitoring system...")
+log.info('initializing', "Initializing real-time battery monitoring system...")
 start_time = datetime.now()
 
-# Pre-calculate all interpolated limits once at startup
-print("Detecting limits:")
-start_time_calc = datetime.now()
-
-interpolated_limits = precalculate_interpolated_limits()
-
-end_time_calc = datetime.now()
-calc_duration = (end_time_calc - start_time_calc).total_seconds()
-print(f"Calculation completed in {calc_duration:.2f} seconds")
-
-# Start the socket server in a background thread
-server_thread = threading.Thread(target=start_data_server)
-server_thread.daemon = True
-server_thread.start()
-
-print(Fore.GREEN + "Real-time monitoring system ready!")
-print("Waiting for sensor data from laptop...")
-print("Press Ctrl+C to stop monitoring")
-
-# MAIN LOOP - Keep the program running
-try:
-    while True:
-        time.sleep(1)
-except KeyboardInterrupt:
-    print(Fore.YELLOW + "\nMonitoring stopped by user")
-    print(Fore.GREEN + "Real-time monitoring system shutdown complete!")
+# Limits and rule thresholds were precomputed when the KnowledgeBase was built
+log.info('limit_table', "Limit table: {rows} SoC rows ({soc_step:g}% steps) x {limits} limits",
+         rows=len(knowledge.limit_table['values']), soc_step=knowledge.limit_table['soc_step'],
+         limits=len(knowledge.limit_table['limit_types']))
+log.info('rules_compiled', "Compiled {rules} fault rules for {faults} faults",
+         rules=len(knowledge.kg_data['fault_rules']), faults=len(knowledge.fault_rules.fault_names))
+
+log.info('ready', "Real-time monitoring system ready!", Fore.GREEN)
+
+# MAIN LOOP - Keep the program running (importing this module, e.g. from benchmark.py, only initializes)
+if __name__ == "__main__":
+    log.info('waiting', "Waiting for sensor data from laptop...")
+    log.info('waiting', "Press Ctrl+C to stop monitoring")
+    if KG_RELOAD_INTERVAL:
+        kg_watcher = KnowledgeBaseWatcher(KG_ARTIFACT, KG_PICKLE, knowledge, swap_knowledge, report_reload_error,
+                                          KG_RELOAD_INTERVAL).start()
+    # Files of a running monitor: telemetry history and the journal with the device states of the previous run
+    if TELEMETRY_DIR:
+        telemetry = TelemetryStore(TELEMETRY_DIR, on_error=report_store_error).start()
+    if JOURNAL_PATH:
+        journal = EventJournal(JOURNAL_PATH)
+        restore_from_journal()
+        journal.start()
+    dispatcher.start()
+    if ingest is not None:
+        ingest.start()
+    try:
+        if SERVER_MODE == 'asyncio':
+            asyncio.run(start_async_data_server())
+        else:
+            # Start the socket server in a background thread
+            server_thread = threading.Thread(target=start_data_server)
+            server_thread.daemon = True
+            server_thread.start()
+
+            while True:
+                time.sleep(STATS_INTERVAL)
+                report_latency()
+    except KeyboardInterrupt:
+        log.info('stopped', "\nMonitoring stopped by user", Fore.YELLOW)
+        if ingest is not None:
+            ingest.stop()
+        if telemetry is not None:
+            telemetry.stop()
+        if journal is not None:
+            journal.close()
+        dispatcher.stop()
+        log.info('shutdown', "Real-time monitoring system shutdown complete!", Fore.GREEN)
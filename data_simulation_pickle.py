@@ -1,69 +1,86 @@
-# laptop_client.py - READ FROM EXCEL AND SEND TO PI (NO RESPONSE NEEDED)
+# laptop_client.py - READ FROM EXCEL AND SEND TO PI OVER ONE PERSISTENT CONNECTION (NO RESPONSE NEEDED)
 
 import socket
-import json
 import time
-import pandas as pd
+from wire_protocol import send_readings
+from replay_cache import load_scenario
 
 HOST = '172.20.10.2'  # Pi's IP
 PORT = 5000
+EXCEL_PATH = r"C:\Users\Avaryn\Downloads\unexpected_running_conditions.xlsx"
 
-def send_sensor_data_from_excel(row):
-    """Send sensor data from Excel row to Pi"""
-    client_socket = None
-    try:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.settimeout(5)
-        client_socket.connect((HOST, PORT))
-        
-        # Convert Status from text to integer
-        status_text = str(row.get('Status', '')).strip().lower()
-        if status_text == 'charging':
-            status_value = 1
-        else:  # 'discharging' or anything else
-            status_value = 0
-        
-        # Convert Excel row to sensor data format
-        sensor_data = {
-            'Voltage': float(row.get('Voltage', 0)),
-            'Impedance': float(row.get('Impedance', 0)),
-            'IntTemp': float(row.get('IntTemp', 0)),
-            'SurfaceTemp': float(row.get('SurfaceTemp', 0)),
-            'Capacity': float(row.get('Capacity', 0)),
-            'SoC': float(row.get('SoC', 0)),
-            'Status': status_value  # Use converted integer
-        }
-        
-        print(f"Sending data: {sensor_data}")
-        
-        # Send data to Pi and immediately close
-        client_socket.send(json.dumps(sensor_data).encode('utf-8'))
-        
-        print("Data sent successfully")
-        return True
-        
-    except Exception as e:
-        print(f"Connection error: {e}")
-        return False
-    finally:
-        # Close socket if it was created
-        if client_socket:
-            client_socket.close()
+DEVICE_ID = 'pack-01'  # battery ID sent with every reading unless the Excel file has a DeviceID column
+BATCH_SIZE = 1        # readings per frame, raise this to replay faster than 1 Hz
+SEND_INTERVAL = 1.0   # seconds to wait between frames
 
-# READ EXCEL FILE
-print("Loading Excel file...")
-try:
-    df = pd.read_excel(r"C:\Users\Avaryn\Downloads\unexpected_running_conditions.xlsx")
+# Persistent connection to the Pi, reused for every frame
+client_socket = None
+
+def get_connection():
+    """Return the open connection to the Pi, connecting first if needed"""
+    global client_socket
+    if client_socket is None:
+        client_socket = socket.create_connection((HOST, PORT), timeout=5)
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print(f"Connected to {HOST}:{PORT}")
+    return client_socket
+
+def close_connection():
+    """Close the connection so the next send reconnects"""
+    global client_socket
+    if client_socket:
+        client_socket.close()
+        client_socket = None
+
+def row_to_sensor_data(row):
+    """Convert a scenario row to the sensor data format"""
+    # The replay cache already turned the Status text into 1 (charging) / 0 (discharging) / NaN
+    if row.get('Status') == 1:
+        status_value = 1
+    else:  # 'discharging' or anything else
+        status_value = 0
     
-    # Remove if file doesn't have error column
-    df = df.drop(columns=['expected error'], errors='ignore')
+    return {
+        'DeviceID': str(row.get('DeviceID') or DEVICE_ID),
+        'Voltage': float(row.get('Voltage', 0)),
+        'Impedance': float(row.get('Impedance', 0)),
+        'IntTemp': float(row.get('IntTemp', 0)),
+        'SurfaceTemp': float(row.get('SurfaceTemp', 0)),
+        'Capacity': float(row.get('Capacity', 0)),
+        'SoC': float(row.get('SoC', 0)),
+        'Status': status_value  # Use converted integer
+    }
+
+def send_sensor_data_from_excel(rows):
+    """Send a batch of Excel rows to the Pi as one frame over the persistent connection"""
+    sensor_data = [row_to_sensor_data(row) for row in rows]
     
-    # Force numeric types
-    for col in ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity', 'SoC']:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    # One reconnect attempt if the Pi dropped the connection since the last frame. Delivery is at-least-once:
+    # a send that failed after the Pi already read the frame is sent again, so the Pi may see it twice
+    for _ in range(2):
+        try:
+            if len(sensor_data) == 1:
+                print(f"Sending data: {sensor_data[0]}")
+            else:
+                print(f"Sending {len(sensor_data)} readings")
+            # Monotonic send time for the Pi's latency histograms (only comparable when both run on one host)
+            sent_at = time.monotonic()
+            for reading in sensor_data:
+                reading['SentAt'] = sent_at
+            send_readings(get_connection(), sensor_data)
+            print("Data sent successfully")
+            return True
+        except OSError as e:
+            print(f"Connection error: {e}")
+            close_connection()
+    return False
+
+# READ EXCEL FILE - parsed and cleaned once, later runs memory-map the cached columns
+print("Loading Excel file...")
+try:
+    df = load_scenario(EXCEL_PATH)
     
-    print(f"Loaded {len(df)} rows from Excel file")
+    print(f"Loaded {len(df)} rows from Excel file" + (" (replay cache)" if df.cached else ""))
     
 except Exception as e:
     print(f"Error loading Excel file: {e}")
@@ -77,17 +94,18 @@ row_index = 0
 
 try:
     while row_index < len(df):
-        row = df.iloc[row_index]
-        row_index += 1
+        rows = list(df.rows(row_index, row_index + BATCH_SIZE))
+        row_index += len(rows)
         
         print(f"\nSending row {row_index}/{len(df)}")
         print("-" * 50)
         
-        send_sensor_data_from_excel(row)
+        send_sensor_data_from_excel(rows)
         
-        # Wait 1 second before sending next row
-        print("Waiting 1 second...")
-        time.sleep(1)
+        # Wait before sending next frame
+        if SEND_INTERVAL > 0:
+            print(f"Waiting {SEND_INTERVAL:g} second(s)...")
+            time.sleep(SEND_INTERVAL)
         
     print("\nAll Excel data sent!")
     
@@ -96,3 +114,6 @@ except KeyboardInterrupt:
     
 except Exception as e:
     print(f"Unexpected error: {e}")
+
+finally:
+    close_connection()
@@ -0,0 +1,92 @@
+# DEVICE STATE - PER-BATTERY TRACKING FOR THE INGESTION PIPELINE
+# keeps rate-of-change, trend and missing-data state separate for every battery/device ID,
+# so interleaved senders never compare readings from different cells
+
+import time
+from trend_window import TrendWindow
+from fault_debounce import FaultDebouncer, remap_faults
+
+MONITORED_PARAMS = ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity']
+DEFAULT_DEVICE_ID = 'default'  # used when a payload carries no DeviceID
+
+
+class DeviceState:
+    """State of one monitored battery, one compact record per device"""
+    __slots__ = ('device_id', 'previous_row', 'last_received', 'trend', 'trends', 'debounce', 'restored')
+
+    def __init__(self, device_id, now=None):
+        now = time.monotonic() if now is None else now
+        self.device_id = device_id
+        self.previous_row = None
+        # monotonic time a non-zero value was last seen, same order as MONITORED_PARAMS
+        self.last_received = [now] * len(MONITORED_PARAMS)
+        self.trend = None  # TrendWindow, created for the trend features of the KG in service
+        self.trends = {}  # {feature name: value} after the last reading, read by the ingest pre-screen
+        self.debounce = None  # FaultDebouncer for the fault bits of the KG in service
+        self.restored = 0  # faults confirmed before a restart whose actions wait for a fresh reading
+
+    def update_trends(self, features, timestamp, row):
+        """Push a reading into this device's trend window, returns {feature name: value}.
+        A KG reload that changes the trend features starts a new window."""
+        if not features:
+            self.trends = {}
+            return self.trends
+        if self.trend is None or self.trend.features != features:
+            self.trend = TrendWindow(features)
+        self.trends = self.trend.push(timestamp, row)
+        return self.trends
+
+    def confirm_faults(self, policy, bitmask):
+        """Debounce a raw fault bitmask, returns (confirmed, raised, cleared) bitmasks.
+        A KG reload brings a new policy (fault bits may have moved), the state is carried over by fault name."""
+        if self.debounce is None:
+            self.debounce = FaultDebouncer(policy)
+        elif self.debounce.policy is not policy:
+            previous = self.debounce.policy
+            self.debounce = self.debounce.carried_over(policy)
+            self.restored = remap_faults(self.restored, previous.fault_names, policy.fault_names)
+        return self.debounce.update(bitmask)
+
+    def restore(self, row, last_received, policy=None, confirmed=0):
+        """State saved before a restart: previous reading, monotonic last-value times (None keeps the
+        current one) and, with the debounce policy in service, the confirmed fault bitmask"""
+        self.previous_row = row
+        self.last_received = [now if saved is None else saved for now, saved in zip(self.last_received, last_received)]
+        if policy is not None:
+            self.debounce = FaultDebouncer(policy)
+            self.debounce.restore(confirmed)
+            self.restored = self.debounce.active
+
+    def update_last_received(self, row, now):
+        """Record which parameters carried data, returns (param, seconds since last value) for those reading 0"""
+        missing = []
+        for i, param in enumerate(MONITORED_PARAMS):
+            value = row[param]
+            if value > 0:
+                self.last_received[i] = now
+            elif value == 0:
+                missing.append((param, now - self.last_received[i]))
+        return missing
+
+
+class DeviceStateTable:
+    """Device ID -> DeviceState with O(1) lookup, records are created on first reading"""
+
+    def __init__(self):
+        self._states = {}
+
+    def get(self, device_id):
+        state = self._states.get(device_id)
+        if state is None:
+            # setdefault is atomic, so two threads seeing a new device still share one record
+            state = self._states.setdefault(device_id, DeviceState(device_id))
+        return state
+
+    def __len__(self):
+        return len(self._states)
+
+    def __contains__(self, device_id):
+        return device_id in self._states
+
+    def devices(self):
+        return list(self._states)
@@ -0,0 +1,398 @@
+# EMBEDDED GRAPH - IN-PROCESS STAND-IN FOR NEO4J ON THE PI
+# the battery knowledge graph held in Python: nodes with labels and properties, adjacency lists per
+# relationship type in both directions, a label index and property indexes/unique keys like the
+# Neo4j schema. Loaded straight from kg_ontology.py, no JVM or database server involved.
+# EmbeddedGraphDatabase.driver() returns a driver with the same session / execute_read / tx.run()
+# .data() / .single() interface the ingestion script uses. It answers the queries of graph_snapshot.py
+# and graph_decision.py (matched by their text), it does not parse arbitrary Cypher.
+#   driver = EmbeddedGraphDatabase.driver()   # instead of GraphDatabase.driver(uri, auth=...)
+
+from fault_engine import COMPARATORS
+from kg_ontology import ontology_rows, ontology_hash
+import graph_decision
+import graph_snapshot
+
+
+class Node:
+    __slots__ = ('id', 'labels', 'properties')
+
+    def __init__(self, node_id, labels, properties):
+        self.id = node_id
+        self.labels = frozenset(labels)
+        self.properties = properties
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+
+class Relationship:
+    __slots__ = ('id', 'type', 'start', 'end', 'properties')
+
+    def __init__(self, rel_id, rel_type, start, end, properties):
+        self.id = rel_id
+        self.type = rel_type
+        self.start = start
+        self.end = end
+        self.properties = properties
+
+
+class GraphStore:
+    """Property graph with adjacency lists, a label index and (label, property) indexes"""
+
+    def __init__(self):
+        self.nodes = {}
+        self.relationships = {}
+        self.outgoing = {}    # node id -> {relationship type: [Relationship]}
+        self.incoming = {}    # node id -> {relationship type: [Relationship]}
+        self.label_index = {}     # label -> {node id}
+        self.property_index = {}  # (label, property) -> {value: {node id}}
+        self.unique_keys = set()  # (label, property) pairs that identify a node
+        self._next_id = 0
+
+    # SCHEMA
+    def create_index(self, label, key):
+        index = self.property_index.setdefault((label, key), {})
+        for node_id in self.label_index.get(label, ()):
+            value = self.nodes[node_id].properties.get(key)
+            if value is not None:
+                index.setdefault(value, set()).add(node_id)
+
+    def create_constraint(self, label, key):
+        """Unique key: merge_node() on it never creates a second node"""
+        self.create_index(label, key)
+        self.unique_keys.add((label, key))
+
+    # NODES
+    def _index_node(self, node, key=None):
+        for label in node.labels:
+            for (index_label, index_key), index in self.property_index.items():
+                if index_label == label and (key is None or key == index_key):
+                    value = node.properties.get(index_key)
+                    if value is not None:
+                        index.setdefault(value, set()).add(node.id)
+
+    def add_node(self, labels, **properties):
+        if isinstance(labels, str):
+            labels = [labels]
+        node = Node(self._next_id, labels, {k: v for k, v in properties.items() if v is not None})
+        self._next_id += 1
+        self.nodes[node.id] = node
+        self.outgoing[node.id] = {}
+        self.incoming[node.id] = {}
+        for label in node.labels:
+            self.label_index.setdefault(label, set()).add(node.id)
+        self._index_node(node)
+        return node
+
+    def set_properties(self, node, **properties):
+        """SET semantics: None removes a property"""
+        for key, value in properties.items():
+            old = node.properties.get(key)
+            for label in node.labels:
+                index = self.property_index.get((label, key))
+                if index is not None and old is not None:
+                    index.get(old, set()).discard(node.id)
+            if value is None:
+                node.properties.pop(key, None)
+            else:
+                node.properties[key] = value
+                self._index_node(node, key)
+
+    def find_nodes(self, label, **properties):
+        """Nodes with a label and matching properties, narrowed through an index when there is one"""
+        candidates = None
+        for key, value in properties.items():
+            index = self.property_index.get((label, key))
+            if index is not None:
+                candidates = index.get(value, set())
+                break
+        if candidates is None:
+            candidates = self.label_index.get(label, set())
+        nodes = [self.nodes[node_id] for node_id in candidates]
+        return [node for node in nodes
+                if all(node.properties.get(key) == value for key, value in properties.items())]
+
+    def merge_node(self, label, key_properties, **properties):
+        """MERGE on key_properties, then SET properties"""
+        found = self.find_nodes(label, **key_properties)
+        node = found[0] if found else self.add_node(label, **key_properties)
+        self.set_properties(node, **properties)
+        return node
+
+    # RELATIONSHIPS
+    def merge_relationship(self, start, rel_type, end, **properties):
+        for rel in self.outgoing[start.id].get(rel_type, ()):
+            if rel.end == end.id:
+                rel.properties.update(properties)
+                return rel
+        rel = Relationship(self._next_id, rel_type, start.id, end.id, dict(properties))
+        self._next_id += 1
+        self.relationships[rel.id] = rel
+        self.outgoing[start.id].setdefault(rel_type, []).append(rel)
+        self.incoming[end.id].setdefault(rel_type, []).append(rel)
+        return rel
+
+    def neighbours(self, node, rel_type, direction='out', label=None):
+        """Nodes one rel_type hop away from node"""
+        if direction == 'out':
+            nodes = [self.nodes[rel.end] for rel in self.outgoing[node.id].get(rel_type, ())]
+        else:
+            nodes = [self.nodes[rel.start] for rel in self.incoming[node.id].get(rel_type, ())]
+        return nodes if label is None else [n for n in nodes if label in n.labels]
+
+    def labelled(self, label):
+        return [self.nodes[node_id] for node_id in self.label_index.get(label, ())]
+
+
+# LOAD THE ONTOLOGY - the same nodes and relationships knowledge_graph_Neo4j.py writes
+def load_ontology(store, rows=None):
+    rows = ontology_rows() if rows is None else rows
+    for label, key in (('Parameter', 'name'), ('Fault', 'name'), ('SoC', 'level'), ('Mitigation', 'name'),
+                       ('OperatingMode', 'name'), ('Rule', 'id')):
+        store.create_constraint(label, key)
+    store.create_index('Limit', 'type')
+
+    for row in rows['parameters']:
+        store.merge_node('Parameter', {'name': row['name']})
+    for row in rows['soc_levels']:
+        store.merge_node('SoC', {'level': row['level']})
+    for row in rows['operating_modes']:
+        store.merge_node('OperatingMode', {'name': row['name']})
+    for row in rows['faults']:
+        store.merge_node('Fault', {'name': row['name']}, severity=row['severity'])
+    for row in rows['mitigations']:
+        store.merge_node('Mitigation', {'name': row['name']})
+
+    for row in rows['limits']:
+        limit = store.merge_node('Limit', {'type': row['type'], 'value': row['value']})
+        for parameter in store.find_nodes('Parameter', name=row['parameter']):
+            store.merge_relationship(parameter, 'HAS_LIMIT', limit)
+        if row['soc'] is not None:
+            for soc in store.find_nodes('SoC', level=row['soc']):
+                store.merge_relationship(soc, 'EXPECTED_RANGE', limit)
+
+    for key, rel_type in (('triggered_by', 'TRIGGERED_BY'), ('associated_with', 'ASSOCIATED_WITH')):
+        for row in rows[key]:
+            for fault in store.find_nodes('Fault', name=row['fault']):
+                for limit in store.find_nodes('Limit', type=row['limit_type']):
+                    store.merge_relationship(fault, rel_type, limit)
+
+    for rule in rows['rules']:
+        fault = store.merge_node('Fault', {'name': rule['fault']})
+        node = store.merge_node('Rule', {'id': rule['id']}, **{k: v for k, v in rule.items() if k != 'id'})
+        store.merge_relationship(node, 'DETECTS', fault)
+
+    for key, rel_type in (('mitigated_by', 'MITIGATED_BY'), ('recovery_actions', 'RECOVERY_ACTION')):
+        for row in rows[key]:
+            for fault in store.find_nodes('Fault', name=row['fault']):
+                for mitigation in store.find_nodes('Mitigation', name=row['mitigation']):
+                    store.merge_relationship(fault, rel_type, mitigation)
+    for row in rows['applicable_in']:
+        for mitigation in store.find_nodes('Mitigation', name=row['mitigation']):
+            for mode in store.find_nodes('OperatingMode', name=row['mode']):
+                store.merge_relationship(mitigation, 'APPLICABLE_IN', mode)
+
+    # a stable version per ontology content, so snapshot caches only reload when the ontology changed
+    content_hash = ontology_hash(rows)
+    store.merge_node('GraphVersion', {'name': 'battery_kg'}, version=int(content_hash[:12], 16),
+                     ontology_hash=content_hash)
+    return store
+
+
+# QUERY HANDLERS - Python implementations of the Cypher the ingestion path sends
+def _graph_version(store, params):
+    versions = sorted((node.get('version') for node in store.labelled('GraphVersion')),
+                      key=lambda v: (v is not None, v), reverse=True)
+    return [{'version': versions[0]}] if versions else []
+
+
+def _limits(store, params):
+    records = []
+    for parameter in store.labelled('Parameter'):
+        for limit in store.neighbours(parameter, 'HAS_LIMIT', label='Limit'):
+            levels = store.neighbours(limit, 'EXPECTED_RANGE', 'in', label='SoC') or [None]
+            for soc in levels:
+                records.append({'parameter': parameter['name'], 'limit_type': limit['type'],
+                                'value': limit['value'], 'soc_level': None if soc is None else soc['level']})
+    return records
+
+
+def _rules(store, params):
+    records = []
+    for rule in sorted(store.labelled('Rule'), key=lambda node: node['id']):
+        for fault in store.neighbours(rule, 'DETECTS', label='Fault'):
+            record = {'id': rule['id'], 'fault': fault['name'], 'severity': fault.get('severity')}
+            for key in ('logic', 'min_count', 'operating_modes', 'parameters', 'comparators', 'limits', 'scales',
+                        'offsets', 'defaults'):
+                record[key] = rule.get(key)
+            records.append(record)
+    return records
+
+
+def _severities(store, params):
+    return [{'fault': fault['name'], 'severity': fault['severity']}
+            for fault in store.labelled('Fault') if fault.get('severity') is not None]
+
+
+def _mitigation_modes(store, mitigation):
+    return [mode['name'] for mode in store.neighbours(mitigation, 'APPLICABLE_IN', label='OperatingMode')]
+
+
+def _mitigations(store, params):
+    records = []
+    for fault in store.labelled('Fault'):
+        for rel_type in ('MITIGATED_BY', 'RECOVERY_ACTION'):
+            for mitigation in store.neighbours(fault, rel_type, label='Mitigation'):
+                records.append({'fault': fault['name'], 'mitigation': mitigation['name'],
+                                'relationship_type': rel_type,
+                                'operating_modes': _mitigation_modes(store, mitigation)})
+    records.sort(key=lambda r: (r['fault'], r['relationship_type'], r['mitigation']))
+    return records
+
+
+def _limits_at(store, soc):
+    """{limit type: value at soc}, interpolated between SoC levels as in DECISION_QUERY"""
+    points = {}
+    fixed = {}
+    for record in _limits(store, None):
+        if record['soc_level'] is None:
+            fixed.setdefault(record['limit_type'], float(record['value']))
+        else:
+            points.setdefault(record['limit_type'], []).append((float(record['soc_level']), float(record['value'])))
+    limits = dict(fixed)
+    for limit_type, type_points in points.items():
+        type_points.sort()
+        lower = [p for p in type_points if p[0] <= soc]
+        upper = [p for p in type_points if p[0] >= soc]
+        lo = lower[-1] if lower else type_points[0]
+        hi = upper[0] if upper else type_points[-1]
+        limits[limit_type] = lo[1] if hi[0] == lo[0] else lo[1] + (hi[1] - lo[1]) * (soc - lo[0]) / (hi[0] - lo[0])
+    return limits
+
+
+def _decision(store, params):
+    soc, mode, values = params['soc'], params['mode'], params['values']
+    limits = _limits_at(store, soc)
+
+    exceeded = {}  # fault name -> limit types of the conditions that held
+    faults = {}
+    for rule in store.labelled('Rule'):
+        if rule['operating_modes'] and mode not in rule['operating_modes']:
+            continue
+        hits = []
+        for i, parameter in enumerate(rule['parameters']):
+            threshold = limits.get(rule['limits'][i], rule['defaults'][i]) * rule['scales'][i] + rule['offsets'][i]
+            value = values.get(parameter)
+            hits.append(value is not None and COMPARATORS[rule['comparators'][i]](value, threshold))
+        needed = {'all': len(hits), 'any': 1}.get(rule['logic'], rule['min_count'])
+        if sum(hits) >= needed:
+            for fault in store.neighbours(rule, 'DETECTS', label='Fault'):
+                faults[fault['name']] = fault
+                fault_limits = exceeded.setdefault(fault['name'], [])
+                fault_limits.extend(t for t, hit in zip(rule['limits'], hits) if hit and t not in fault_limits)
+
+    records = []
+    for name, fault in faults.items():
+        rule_order = min(rule['id'] for rule in store.neighbours(fault, 'DETECTS', 'in', label='Rule'))
+        triggered_by = []
+        for limit in store.neighbours(fault, 'TRIGGERED_BY', label='Limit'):
+            if limit['type'] not in triggered_by:
+                triggered_by.append(limit['type'])
+        actions = {}
+        for rel_type in ('MITIGATED_BY', 'RECOVERY_ACTION'):
+            names = []
+            for mitigation in store.neighbours(fault, rel_type, label='Mitigation'):
+                modes = _mitigation_modes(store, mitigation)
+                if mode == 'Unknown' or not modes or mode in modes:
+                    names.append(mitigation['name'])
+            actions[rel_type] = sorted(names)
+        records.append({'fault': name, 'severity': fault.get('severity'), 'rule_order': rule_order,
+                        'exceeded_limits': exceeded[name], 'triggered_by': triggered_by,
+                        'mitigated_by': actions['MITIGATED_BY'], 'recovery_actions': actions['RECOVERY_ACTION']})
+    records.sort(key=lambda r: (1000000 if r['severity'] is None else r['severity'], r['rule_order']))
+    return records
+
+
+def _query_key(query):
+    return ' '.join(query.split())
+
+
+QUERY_HANDLERS = {
+    _query_key(graph_snapshot.VERSION_QUERY): _graph_version,
+    _query_key(graph_snapshot.LIMITS_QUERY): _limits,
+    _query_key(graph_snapshot.RULES_QUERY): _rules,
+    _query_key(graph_snapshot.SEVERITY_QUERY): _severities,
+    _query_key(graph_snapshot.MITIGATIONS_QUERY): _mitigations,
+    _query_key(graph_decision.DECISION_QUERY): _decision,
+}
+
+
+# DRIVER INTERFACE - the subset of the neo4j driver API the ingestion scripts call
+class Result:
+    def __init__(self, records):
+        self.records = records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def data(self):
+        return [dict(record) for record in self.records]
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def consume(self):
+        self.records = []
+
+
+class Transaction:
+    def __init__(self, store):
+        self.store = store
+
+    def run(self, query, parameters=None, **kwparameters):
+        handler = QUERY_HANDLERS.get(_query_key(query))
+        if handler is None:
+            raise NotImplementedError(f"The embedded graph does not support this query: {query.strip()[:80]}...")
+        params = dict(parameters or {}, **kwparameters)
+        return Result(handler(self.store, params))
+
+
+class Session(Transaction):
+    """Queries run directly against the store; it is read-only after loading, so sessions need no locks"""
+
+    def execute_read(self, transaction_function, *args, **kwargs):
+        return transaction_function(Transaction(self.store), *args, **kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EmbeddedDriver:
+    def __init__(self, store):
+        self.store = store
+
+    def session(self, **config):
+        return Session(self.store)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class EmbeddedGraphDatabase:
+    """Drop-in for neo4j.GraphDatabase: EmbeddedGraphDatabase.driver() serves the ontology in-process"""
+
+    @staticmethod
+    def driver(uri=None, auth=None, store=None):
+        return EmbeddedDriver(store if store is not None else load_ontology(GraphStore()))
@@ -0,0 +1,253 @@
+# EVENT JOURNAL - MMAP RING OF RECENT READINGS AND FAULT TRANSITIONS FOR CRASH RECOVERY
+# a fixed-size file is memory-mapped once; every reading and every change of a device's confirmed faults
+# is copied into it as one record (header with magic, CRC32 and sequence number, 64-byte aligned), wrapping
+# around when the ring is full. Writing is a memory copy, a flusher thread msyncs the dirty pages at most
+# every FLUSH_INTERVAL (sooner after a fault transition, but never more often than FLUSH_MIN_GAP), so SD-card
+# writes stay bounded whatever the reading rate.
+# A device's faults are only journaled when they change, so every active fault set is written again at the
+# start of each lap, before the ring overwrites the record it was last seen in.
+# On startup the ring is scanned for records whose CRC matches: a record torn by power loss, or partly
+# overwritten by the next lap, simply fails its check. The records, ordered by sequence number, give every
+# device's last reading, missing-data timers and confirmed faults back.
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from device_state import MONITORED_PARAMS
+
+JOURNAL_SIZE = 1024 * 1024      # ring bytes, ~8k readings: minutes of a fleet, only the newest per device is needed
+RECORD_ALIGN = 64               # records start on these boundaries, the scan only looks there
+FLUSH_INTERVAL = 1.0            # seconds between msyncs of the dirty pages
+FLUSH_MIN_GAP = 0.2             # seconds, least time between two msyncs
+MAX_PAYLOAD = 4096
+JOURNAL_COLUMNS = ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity', 'SoC', 'Status']
+
+FILE_MAGIC = b'EVJ1'
+FILE_HEADER = struct.Struct('<4sII')         # magic, format version, ring bytes
+FORMAT_VERSION = 1
+DATA_START = mmap.PAGESIZE                   # the header has a page to itself
+RECORD_MAGIC = b'EVR1'
+RECORD_HEADER = struct.Struct('<4sIHHQd')    # magic, crc32, payload bytes, kind, sequence, wall-clock time
+RECORD_CRC_FROM = 8                          # the CRC covers the header from here on, then the payload
+DEVICE = struct.Struct('<H')
+VALUES = struct.Struct(f'<{len(JOURNAL_COLUMNS)}d')
+
+# record kinds
+READING = 1  # device, JOURNAL_COLUMNS values
+FAULTS = 2   # device, names of the confirmed faults after a transition ('\n'-separated, empty when all cleared)
+
+
+def _pack_device(device):
+    encoded = device.encode('utf-8')
+    return DEVICE.pack(len(encoded)) + encoded
+
+
+class EventJournal:
+    """Memory-mapped ring journal at path. Opening it scans the existing records (see recover())."""
+
+    def __init__(self, path, size=JOURNAL_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.size = size - size % RECORD_ALIGN
+        self.flush_interval = flush_interval
+        total = DATA_START + self.size
+        reused = False
+        if os.path.exists(path) and os.path.getsize(path) == total:
+            with open(path, 'rb') as f:
+                reused = FILE_HEADER.unpack(f.read(FILE_HEADER.size)) == (FILE_MAGIC, FORMAT_VERSION, self.size)
+        if not reused:
+            # new journal, or one of another size or version: start empty
+            with open(path, 'wb') as f:
+                f.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, self.size))
+                f.truncate(total)
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), total)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._urgent = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_flush = 0.0
+
+        started = time.perf_counter()
+        self.records = self._scan()
+        self.scan_ms = (time.perf_counter() - started) * 1000
+        # device key -> (FAULTS payload, wall time) of every device with confirmed faults, carried into each new lap
+        self._active_faults = {}
+        for _, kind, wall, payload, _, _ in self.records:
+            if kind == FAULTS:
+                self._track_faults(payload, wall)
+        if self.records:
+            seq, _, _, _, offset, length = self.records[-1]
+            self._seq = seq + 1
+            self._head = offset + self._aligned(length)
+        else:
+            self._seq = 1
+            self._head = DATA_START
+        self.counts = {'records': 0, 'wraps': 0, 'carried': 0, 'flushes': 0, 'recovered': len(self.records)}
+
+    @staticmethod
+    def _aligned(payload_length):
+        size = RECORD_HEADER.size + payload_length
+        return size + -size % RECORD_ALIGN
+
+    # WRITING
+    def _track_faults(self, payload, wall):
+        length, = DEVICE.unpack_from(payload)
+        key = payload[:DEVICE.size + length]
+        if len(payload) > len(key):
+            self._active_faults[key] = (payload, wall)
+        else:
+            self._active_faults.pop(key, None)  # all cleared, nothing to carry
+
+    def _write(self, kind, payload, wall):
+        """One record at the head, the caller holds the lock and has checked it fits"""
+        header = RECORD_HEADER.pack(RECORD_MAGIC, 0, len(payload), kind, self._seq, wall)
+        crc = zlib.crc32(payload, zlib.crc32(header[RECORD_CRC_FROM:]))
+        record = RECORD_HEADER.pack(RECORD_MAGIC, crc, len(payload), kind, self._seq, wall) + payload
+        self._mm[self._head:self._head + len(record)] = record
+        self._head += self._aligned(len(payload))
+        self._seq += 1
+
+    def _append(self, kind, payload, wall):
+        if len(payload) > MAX_PAYLOAD:
+            raise ValueError(f"Journal record of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+        size = self._aligned(len(payload))
+        with self._lock:
+            if self._head + size > DATA_START + self.size:
+                self._head = DATA_START
+                self.counts['wraps'] += 1
+                # the new lap overwrites the oldest records: write the active fault sets again first
+                for carried, carried_wall in self._active_faults.values():
+                    self._write(FAULTS, carried, carried_wall)
+                self.counts['carried'] += len(self._active_faults)
+            self._write(kind, payload, wall)
+            if kind == FAULTS:
+                self._track_faults(payload, wall)
+            self._dirty = True
+            self.counts['records'] += 1
+
+    def record_reading(self, device, row, wall=None):
+        """Journal one reading ({column: value}), a memory copy"""
+        values = VALUES.pack(*[float(row.get(col, 0.0)) for col in JOURNAL_COLUMNS])
+        self._append(READING, _pack_device(device) + values, time.time() if wall is None else wall)
+
+    def record_faults(self, device, faults, wall=None):
+        """Journal the confirmed faults of a device after they changed, flushed without waiting the full interval"""
+        payload = _pack_device(device) + "\n".join(faults).encode('utf-8')
+        self._append(FAULTS, payload, time.time() if wall is None else wall)
+        self._urgent.set()
+
+    # RECOVERY
+    def _scan(self):
+        """[(sequence, kind, wall time, payload, offset, payload length)] of the valid records, oldest first"""
+        mm, end = self._mm, DATA_START + self.size
+        records = []
+        position = DATA_START
+        while True:
+            offset = mm.find(RECORD_MAGIC, position, end)
+            if offset < 0:
+                break
+            position = offset + 1
+            if (offset - DATA_START) % RECORD_ALIGN or offset + RECORD_HEADER.size > end:
+                continue
+            _, crc, length, kind, seq, wall = RECORD_HEADER.unpack_from(mm, offset)
+            stop = offset + RECORD_HEADER.size + length
+            if length > MAX_PAYLOAD or stop > end:
+                continue
+            payload = mm[offset + RECORD_HEADER.size:stop]
+            if zlib.crc32(payload, zlib.crc32(mm[offset + RECORD_CRC_FROM:offset + RECORD_HEADER.size])) != crc:
+                continue
+            records.append((seq, kind, wall, payload, offset, length))
+            position = offset + self._aligned(length)
+        records.sort()
+        return records
+
+    def recover(self, max_age=None, now=None):
+        """{device: {'time', 'row', 'last_received', 'faults'}} from the records found when the journal was
+        opened (rescanned if anything was written since). 'last_received' holds the wall time each MONITORED_PARAMS value was last non-zero (None when
+        not in the journal), 'faults' the confirmed fault names (None without a fault record). Devices whose
+        last record is older than max_age seconds are left out. Walks the records newest first and stops
+        decoding a device's readings once its row and timers are known."""
+        timed = [JOURNAL_COLUMNS.index(param) for param in MONITORED_PARAMS]
+        records = self.records
+        if self.counts['records']:
+            with self._lock:
+                records = self._scan()
+        devices = {}
+        for _, kind, wall, payload, _, _ in reversed(records):
+            length, = DEVICE.unpack_from(payload)
+            offset = DEVICE.size + length
+            key = payload[:offset]
+            saved = devices.get(key)
+            if saved is None:
+                saved = devices[key] = {'time': wall, 'row': None, 'last_received': [None] * len(timed),
+                                        'faults': None, 'pending': len(timed)}
+            elif wall > saved['time']:
+                saved['time'] = wall  # carried fault records keep the time of their transition
+            if kind == READING:
+                if not saved['pending']:
+                    continue
+                values = VALUES.unpack_from(payload, offset)
+                if saved['row'] is None:
+                    saved['row'] = dict(zip(JOURNAL_COLUMNS, values))
+                    saved['row']['Status'] = int(saved['row']['Status'])
+                last_received = saved['last_received']
+                for i, column in enumerate(timed):
+                    if last_received[i] is None and values[column] > 0:
+                        last_received[i] = wall
+                        saved['pending'] -= 1
+            elif kind == FAULTS and saved['faults'] is None:
+                names = payload[offset:].decode('utf-8')
+                saved['faults'] = names.split("\n") if names else []
+
+        now = time.time() if now is None else now
+        recovered = {}
+        for key, saved in devices.items():
+            if max_age is None or now - saved['time'] <= max_age:
+                del saved['pending']
+                recovered[key[DEVICE.size:].decode('utf-8')] = saved
+        return recovered
+
+    # FLUSHING
+    def flush(self):
+        """msync the mapping if anything was written since the last flush"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._dirty = False
+        self._mm.flush()
+        self._last_flush = time.monotonic()
+        self.counts['flushes'] += 1
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._urgent.wait(self.flush_interval)
+            gap = self._last_flush + FLUSH_MIN_GAP - time.monotonic()
+            if gap > 0 and self._stop.wait(gap):
+                break
+            self._urgent.clear()
+            self.flush()
+        self.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='journal-flush', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the flusher, flush and unmap"""
+        self._stop.set()
+        self._urgent.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self._mm.close()
+        self._file.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, head=self._head - DATA_START, sequence=self._seq, scan_ms=round(self.scan_ms, 3))
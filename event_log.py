@@ -0,0 +1,104 @@
+# EVENT LOG - LEVEL-GATED STRUCTURED OUTPUT FOR THE EDGE PIPELINE
+# every message is an event: a level, a short event name and keyword fields.
+# nothing is formatted unless the event's level is enabled, so production mode (INFO) does no
+# per-reading string, JSON or DataFrame work. 'json' writes one JSON object per line for
+# log shippers, 'console' keeps the coloured human-readable view
+
+import json
+import sys
+import threading
+import time
+from colorama import Fore
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+LEVEL_COLORS = {DEBUG: Fore.LIGHTBLACK_EX, INFO: '', WARNING: Fore.YELLOW, ERROR: Fore.RED}
+FORMATS = ('console', 'json')
+
+
+def parse_level(level):
+    """Accept a level number or name ('debug', 'INFO', ...)"""
+    if isinstance(level, str):
+        try:
+            return LEVELS[level.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown log level {level!r}, expected one of {list(LEVELS)}")
+    return int(level)
+
+
+def _json_default(value):
+    # numpy scalars and arrays, tuples of addresses, exceptions
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class EventLog:
+    """Level-gated event writer shared by the ingestion threads/tasks"""
+
+    def __init__(self, level=INFO, fmt='console', stream=None):
+        self._lock = threading.Lock()
+        self.configure(level, fmt, stream)
+
+    def configure(self, level=None, fmt=None, stream=None):
+        """Change level, format or output stream (None keeps the current setting)"""
+        if level is not None:
+            self.level = parse_level(level)
+        if fmt is not None:
+            if fmt not in FORMATS:
+                raise ValueError(f"Unknown log format {fmt!r}, expected one of {FORMATS}")
+            self.fmt = fmt
+        if stream is not None:
+            self.stream = stream
+        elif not hasattr(self, 'stream'):
+            self.stream = None  # resolved to sys.stdout on every write, so redirection keeps working
+
+        # Plain attributes so hot-path guards cost one attribute load
+        self.debug_enabled = self.level <= DEBUG
+        self.console = self.fmt == 'console'
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def event(self, level, name, message=None, color=None, **fields):
+        """Emit one event if level is enabled.
+
+        message is only used by the console view: a str.format template over fields, or a
+        callable taking the fields dict and returning the text (for multi-line views).
+        The JSON view writes {'ts', 'level', 'event', **fields} as one line.
+        """
+        if level < self.level:
+            return
+        if self.fmt == 'json':
+            record = {'ts': round(time.time(), 6), 'level': LEVEL_NAMES.get(level, level), 'event': name}
+            record.update(fields)
+            line = json.dumps(record, separators=(',', ':'), default=_json_default)
+        elif callable(message):
+            line = message(fields)
+        else:
+            text = message.format(**fields) if message is not None else f"{name} {fields}"
+            line = (LEVEL_COLORS.get(level, '') if color is None else color) + text
+        self.write(line)
+
+    def debug(self, name, message=None, color=None, **fields):
+        self.event(DEBUG, name, message, color, **fields)
+
+    def info(self, name, message=None, color=None, **fields):
+        self.event(INFO, name, message, color, **fields)
+
+    def warning(self, name, message=None, color=None, **fields):
+        self.event(WARNING, name, message, color, **fields)
+
+    def error(self, name, message=None, color=None, **fields):
+        self.event(ERROR, name, message, color, **fields)
+
+    def write(self, line):
+        """Write one preformatted line, whole lines only so concurrent writers never interleave"""
+        stream = self.stream or sys.stdout
+        with self._lock:
+            stream.write(line + '\n')
@@ -0,0 +1,134 @@
+# FAULT DEBOUNCE - N-OF-M CONFIRMATION AND K-SAMPLE CLEARING PER DEVICE AND FAULT
+# a rule firing on one sample no longer raises the fault: the fault is confirmed once it fired in
+# N of its last M samples and cleared after K clean samples in a row, with N / M / K set per severity
+# class. Faults in IMMEDIATE_FAULTS (Thermal_Runaway) are raised on their first sample. Faults whose rules
+# use a trend statistic (IntTemp_Slope, ...) get TREND_POLICY whatever their severity: the statistic is
+# already an average over the trend window, a single reading still should not raise it.
+# State per device is one M-bit shift register and one clean counter per fault plus the bitmask of
+# confirmed faults; a reading only visits the faults that fired or are still being tracked.
+# A KG reload brings a new policy whose fault bits may have moved: the state is carried over by fault name.
+
+from trend_window import trend_features
+
+# Severity classes (see the severity notes in knowledge_graph_pickle.py), first matching class wins:
+# (highest severity in the class, raise after N hits, within the last M samples, clear after K clean samples)
+DEBOUNCE_POLICY = [
+    (3, 1, 1, 5),    # critical: raise at once, hold for 5 clean samples
+    (6, 2, 3, 3),    # electrical hazards
+    (8, 3, 5, 5),    # property damage
+    (10, 4, 6, 10),  # performance / single-parameter warnings
+]
+UNRANKED_POLICY = (4, 6, 10)  # faults without a severity
+TREND_POLICY = (3, 5, 5)      # faults raised by trend statistics
+IMMEDIATE_FAULTS = ('Thermal_Runaway',)  # zero-delay path regardless of the class settings
+MAX_WINDOW = 8  # M is at most 8, so each shift register fits in a byte and popcount is a table lookup
+
+POPCOUNT = [bin(i).count('1') for i in range(1 << MAX_WINDOW)]
+
+
+class DebouncePolicy:
+    """N / M / K per fault bit of a RuleSet, built once per knowledge graph version"""
+
+    def __init__(self, ruleset, severities, policy=DEBOUNCE_POLICY, immediate=IMMEDIATE_FAULTS):
+        self.fault_names = list(ruleset.fault_names)
+        self.raise_after = []
+        self.window_mask = []
+        self.clear_after = []
+        self.immediate_mask = 0
+        trend_parameters = {name for name, _, _ in trend_features(ruleset.parameters)}
+        self.trend_mask = 0
+        for leaves, _, _, fault_bit in ruleset.rule_plan:
+            if any(ruleset.parameters[ruleset.leaf_columns[leaf]] in trend_parameters for leaf in leaves):
+                self.trend_mask |= fault_bit
+        for bit, fault in enumerate(ruleset.fault_names):
+            severity = severities.get(fault)
+            n, m, k = UNRANKED_POLICY
+            if self.trend_mask >> bit & 1:
+                n, m, k = TREND_POLICY
+            elif severity is not None:
+                n, m, k = next(((n, m, k) for top, n, m, k in policy if severity <= top), UNRANKED_POLICY)
+            if fault in immediate:
+                n, m = 1, 1
+                self.immediate_mask |= 1 << bit
+            if not 1 <= n <= m <= MAX_WINDOW or not 1 <= k <= 255:
+                raise ValueError(f"Invalid debounce setting for {fault}: {n} of {m}, clear after {k}")
+            self.raise_after.append(n)
+            self.window_mask.append((1 << m) - 1)
+            self.clear_after.append(k)
+
+
+def remap_faults(bitmask, old_names, new_names):
+    """Fault bitmask of old_names order in new_names order, faults missing from new_names are left out"""
+    remapped = 0
+    for i, fault in enumerate(new_names):
+        j = old_names.index(fault) if fault in old_names else -1
+        if j >= 0 and bitmask >> j & 1:
+            remapped |= 1 << i
+    return remapped
+
+
+class FaultDebouncer:
+    """Debounce state of one device, update() turns raw rule bitmasks into confirmed fault bitmasks"""
+    __slots__ = ('policy', 'history', 'clean', 'active', 'tracked')
+
+    def __init__(self, policy):
+        self.policy = policy
+        faults = len(policy.raise_after)
+        self.history = bytearray(faults)  # last M hits of each fault, newest in bit 0
+        self.clean = bytearray(faults)    # clean samples in a row while the fault is confirmed
+        self.active = 0                   # confirmed faults
+        self.tracked = 0                  # faults with hits in their window or confirmed
+
+    def update(self, bitmask):
+        """Feed one reading's raw bitmask, returns (confirmed, raised, cleared) bitmasks"""
+        policy, history, clean = self.policy, self.history, self.clean
+        previous = active = self.active
+        tracked = 0
+        work = bitmask | self.tracked
+        while work:
+            low = work & -work
+            work ^= low
+            i = low.bit_length() - 1
+            hit = bitmask & low
+            h = ((history[i] << 1) | (1 if hit else 0)) & policy.window_mask[i]
+            if active & low:
+                if hit:
+                    clean[i] = 0
+                else:
+                    clean[i] += 1
+                    if clean[i] >= policy.clear_after[i]:
+                        active ^= low
+                        clean[i] = 0
+                        h = 0
+            elif POPCOUNT[h] >= policy.raise_after[i]:
+                active |= low
+                clean[i] = 0
+            history[i] = h
+            if h or active & low:
+                tracked |= low
+        self.active = active
+        self.tracked = tracked
+        return active, active & ~previous, previous & ~active
+
+    def carried_over(self, policy):
+        """Debouncer for the policy of a reloaded KG with each fault's window, clean counter and confirmed
+        state taken over by fault name (its window cut to the new M); faults new to the KG start clean"""
+        debouncer = FaultDebouncer(policy)
+        old_index = {fault: j for j, fault in enumerate(self.policy.fault_names)}
+        for i, fault in enumerate(policy.fault_names):
+            j = old_index.get(fault)
+            if j is None:
+                continue
+            low = 1 << i
+            debouncer.history[i] = self.history[j] & policy.window_mask[i]
+            if self.active >> j & 1:
+                debouncer.active |= low
+                debouncer.clean[i] = min(self.clean[j], policy.clear_after[i] - 1)
+            if debouncer.history[i] or debouncer.active & low:
+                debouncer.tracked |= low
+        return debouncer
+
+    def restore(self, confirmed):
+        """Start from a confirmed bitmask saved before a restart, with empty windows and clear counters"""
+        self.active = confirmed & ((1 << len(self.policy.raise_after)) - 1)
+        self.tracked = self.active
@@ -0,0 +1,428 @@
+# FAULT ENGINE - RULE COMPILER AND VECTORIZED FAULT EVALUATION
+# compiles the declarative fault rule table stored in the knowledge graph into flat NumPy arrays,
+# then evaluates one reading or millions of readings with the same threshold matrix
+
+import math
+import operator
+import numpy as np
+import pandas as pd
+
+# Column order expected when readings are passed as a plain NumPy array
+READING_COLUMNS = ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity', 'SoC', 'Status']
+
+# Operating modes a rule can be restricted to (index = mode code)
+OPERATING_MODES = ['Charging', 'Discharging', 'Unknown']
+MODE_CODE = {mode: i for i, mode in enumerate(OPERATING_MODES)}
+
+COMPARATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq
+}
+
+SOC_STEP = 0.1  # default SoC resolution of the precomputed limit table (%)
+VOLTAGE_PARAMETERS = ('Voltage', 'Voltage_RoC')  # limits given per cell, scaled by a profile's cells in series
+
+# Temperature axis of the SoC x temperature limit grids
+TEMP_PARAMETER = 'IntTemp'    # reading that selects the temperature row
+TEMP_RANGE = (-30.0, 70.0)    # grid span (C), readings outside use the nearest edge
+TEMP_STEP = 1.0               # grid resolution (C)
+TEMP_REFERENCE = 25.0         # temperature of the SoC-only curves, used when a reading has no temperature
+
+
+# RULE COMPILER
+class RuleSet:
+    """Fault rules compiled into a flat threshold matrix.
+
+    Every distinct rule condition becomes one leaf: reading parameter, comparator, limit column,
+    scale, offset and a default used when the limit is not defined. A rule fires when at least
+    min_count of its leaves hold and the operating mode matches. Faults are numbered by priority
+    (severity, then rule table order), so bit 0 of a bitmask is the most critical fault.
+    """
+
+    def __init__(self, fault_rules, faults_detailed):
+        # Faults ordered by priority; faults without a severity are detected but never ranked
+        first_seen = []
+        for rule in fault_rules:
+            if rule['fault'] not in first_seen:
+                first_seen.append(rule['fault'])
+        ranked = [f for f in first_seen if f in faults_detailed]
+        ranked.sort(key=lambda f: faults_detailed[f]['severity'])
+        self.fault_names = ranked + [f for f in first_seen if f not in faults_detailed]
+        self.fault_index = {name: i for i, name in enumerate(self.fault_names)}
+        self.severities = [faults_detailed[f]['severity'] for f in ranked]
+        self.ranked_count = len(ranked)
+        if len(self.fault_names) > 32:
+            raise ValueError("At most 32 faults fit in a fault bitmask")
+
+        self.parameters = []
+        self.limit_names = []
+        leaves = []      # (parameter, comparator, limit, scale, offset, default), shared between rules
+        leaf_keys = []   # repr of each leaf, NaN defaults never compare equal so leaves are matched by repr
+        self.rule_plan = []  # (leaf indices, min_count, mode mask, fault bit) per rule
+
+        for rule in fault_rules:
+            rule_leaves = []
+            for cond in rule['conditions']:
+                if cond['comparator'] not in COMPARATORS:
+                    raise ValueError(f"Unknown comparator {cond['comparator']!r} in rule for {rule['fault']}")
+                default = cond.get('default')
+                leaf = (self._column(self.parameters, cond['parameter']), cond['comparator'],
+                        self._column(self.limit_names, cond['limit']), float(cond.get('scale', 1.0)),
+                        float(cond.get('offset', 0.0)), np.nan if default is None else float(default))
+                if repr(leaf) not in leaf_keys:
+                    leaf_keys.append(repr(leaf))
+                    leaves.append(leaf)
+                rule_leaves.append(leaf_keys.index(repr(leaf)))
+
+            logic = rule.get('logic', 'all')
+            if logic == 'all':
+                min_count = len(rule_leaves)
+            elif logic == 'any':
+                min_count = 1
+            elif logic == 'at_least':
+                min_count = rule['min_count']
+            else:
+                raise ValueError(f"Unknown rule logic {logic!r} for {rule['fault']}")
+
+            mode_mask = 0
+            for mode in rule.get('operating_modes') or OPERATING_MODES:
+                mode_mask |= 1 << MODE_CODE[mode]
+            self.rule_plan.append((tuple(rule_leaves), min_count, mode_mask, 1 << self.fault_index[rule['fault']]))
+
+        self.leaf_param = np.array([leaf[0] for leaf in leaves], dtype=np.intp)
+        self.leaf_columns = [leaf[0] for leaf in leaves]
+        self.leaf_compare = [COMPARATORS[leaf[1]] for leaf in leaves]
+        self.leaf_limit = np.array([leaf[2] for leaf in leaves], dtype=np.intp)
+        self.leaf_scale = np.array([leaf[3] for leaf in leaves], dtype=float)
+        self.leaf_offset = np.array([leaf[4] for leaf in leaves], dtype=float)
+        self.leaf_default = np.array([leaf[5] for leaf in leaves], dtype=float)
+
+        # Rule membership and rule -> fault matrices for batch evaluation
+        self.membership = np.zeros((len(self.rule_plan), len(leaves)), dtype=np.float32)
+        self.rule_faults = np.zeros((len(self.fault_names), len(self.rule_plan)), dtype=np.float32)
+        for r, (rule_leaves, _, _, bit) in enumerate(self.rule_plan):
+            self.membership[r, list(rule_leaves)] = 1
+            self.rule_faults[bit.bit_length() - 1, r] = 1
+        self.min_count = np.array([plan[1] for plan in self.rule_plan], dtype=np.float32)
+        self.rule_modes = np.array([plan[2] for plan in self.rule_plan], dtype=np.uint8)
+        self.fault_bits = 2.0 ** np.arange(len(self.fault_names))
+
+    @staticmethod
+    def _column(columns, name):
+        if name not in columns:
+            columns.append(name)
+        return columns.index(name)
+
+    def thresholds(self, limits):
+        """Per-leaf thresholds for rows of limits in limit_names order, precomputed once per limit table"""
+        limits = np.asarray(limits, dtype=float)
+        limit = limits[..., self.leaf_limit]
+        limit = np.where(np.isnan(limit), self.leaf_default, limit)
+        return limit * self.leaf_scale + self.leaf_offset
+
+    def grid_thresholds(self, grid):
+        """Leaves whose limit has a SoC x temperature grid, and their thresholds (..., soc, temperature, leaves)"""
+        leaves = [i for i, limit in enumerate(self.leaf_limit.tolist()) if self.limit_names[limit] in grid['limit_types']]
+        if not leaves:
+            return [], None
+        columns = [grid['limit_types'].index(self.limit_names[self.leaf_limit[i]]) for i in leaves]
+        limit = np.asarray(grid['values'], dtype=float)[..., columns]
+        limit = np.where(np.isnan(limit), self.leaf_default[leaves], limit)
+        return leaves, limit * self.leaf_scale[leaves] + self.leaf_offset[leaves]
+
+    def evaluate_row(self, values, thresholds, mode):
+        """Fault bitmask for a single reading (values in parameters order, one row of thresholds())"""
+        if isinstance(thresholds, np.ndarray):
+            thresholds = thresholds.tolist()
+        hits = [compare(values[p], t) for compare, p, t in zip(self.leaf_compare, self.leaf_columns, thresholds)]
+        bitmask = 0
+        for rule_leaves, min_count, mode_mask, bit in self.rule_plan:
+            if mode_mask >> mode & 1 and sum(hits[i] for i in rule_leaves) >= min_count:
+                bitmask |= bit
+        return bitmask
+
+    def evaluate_columns(self, values, thresholds, modes):
+        """Fault bitmasks for column-major input: (parameters, N) values, one threshold row (or scalar)
+        per leaf and (N,) mode codes"""
+        n = values.shape[1]
+        hits = np.empty((len(self.leaf_compare), n), dtype=np.float32)
+        with np.errstate(invalid='ignore'):
+            for i, compare in enumerate(self.leaf_compare):
+                hits[i] = compare(values[self.leaf_param[i]], thresholds[i])
+
+        fired = (self.membership @ hits) >= self.min_count[:, None]
+        fired &= (self.rule_modes[:, None] >> np.asarray(modes, dtype=np.uint8)[None, :]) & 1 == 1
+        # rules -> faults (several rules can raise the same fault) -> bitmask, all as matrix products
+        faults = (self.rule_faults @ fired.astype(np.float32)) > 0
+        return (self.fault_bits @ faults).astype(np.uint32)
+
+    def faults_in(self, bitmask):
+        """Fault names set in a bitmask, highest priority first"""
+        bitmask = int(bitmask)
+        return [name for bit, name in enumerate(self.fault_names) if bitmask >> bit & 1]
+
+    def top_fault(self, bitmasks):
+        """Index of the highest priority ranked fault per bitmask (-1 when none fired)"""
+        bitmasks = np.asarray(bitmasks, dtype=np.uint32)
+        lowest = bitmasks & (~bitmasks + np.uint32(1))
+        with np.errstate(divide='ignore'):
+            index = np.where(lowest > 0, np.log2(np.maximum(lowest, 1)), -1).astype(np.int16)
+        index[index >= self.ranked_count] = -1
+        return index
+
+
+def compile_rules(kg_data):
+    """Compile the rule table of a knowledge graph into a RuleSet"""
+    if 'fault_rules' not in kg_data:
+        raise ValueError("Knowledge graph has no fault_rules table, rebuild it with knowledge_graph_pickle.py")
+    return RuleSet(kg_data['fault_rules'], kg_data['faults_detailed'])
+
+
+# LIMIT TABLES
+def build_soc_limit_table(kg_data, soc_step=SOC_STEP):
+    """Interpolate every limit type of a pickled knowledge graph over SoC 0-100, see interpolate_limit_table()"""
+    param_limits = kg_data['parameter_limits']
+    limit_points = {}
+    for limit_type, source in kg_data.get('limit_types', {}).items():
+        param_data = param_limits.get(source['parameter'], {})
+        if 'limits_per_soc' in param_data:
+            limit_points[limit_type] = [(item['soc'], item[source['key']]) for item in param_data['limits_per_soc']
+                                        if source['key'] in item]
+        elif source['key'] in param_data:
+            limit_points[limit_type] = param_data[source['key']]
+        else:
+            limit_points[limit_type] = []
+    return interpolate_limit_table(limit_points, soc_step)
+
+
+def limit_grid_points(param_limits, limit_types):
+    """[(soc, temp, value), ...] of every limit type that has a SoC x temperature grid ('limits_per_soc_temp')"""
+    grid_points = {}
+    for limit_type, source in limit_types.items():
+        points = [(item['soc'], item['temp'], item[source['key']])
+                  for item in param_limits.get(source['parameter'], {}).get('limits_per_soc_temp', [])
+                  if source['key'] in item]
+        if points:
+            grid_points[limit_type] = points
+    return grid_points
+
+
+def build_profile_limit_tables(kg_data, soc_step=SOC_STEP):
+    """One SoC limit table per limit profile, stacked so a profile ID indexes the first axis.
+
+    Profiles come from kg_data['limit_profiles'] ({name: {'parameter_limits', 'cells_in_series'}});
+    a graph without profiles gets a single one from its parameter_limits. Voltage limits are per cell
+    and scaled by cells_in_series. Returns {'soc_step', 'limit_types', 'profiles', 'values'} with
+    values shaped (profiles, rows, limit types). When any profile defines SoC x temperature limits,
+    'temperature' holds the dense grids of those limit types, see interpolate_limit_grid(), with values
+    shaped (profiles, soc rows, temperature rows, grid limit types); a profile without a grid for one
+    of them repeats its SoC curve at every temperature.
+    """
+    profiles = kg_data.get('limit_profiles') or {
+        kg_data.get('default_profile', 'default'): {'parameter_limits': kg_data['parameter_limits']}}
+    limit_types = kg_data.get('limit_types', {})
+    tables = []
+    grid_types = []
+    for profile in profiles.values():
+        table = build_soc_limit_table({'parameter_limits': profile['parameter_limits'], 'limit_types': limit_types},
+                                      soc_step)
+        series = profile.get('cells_in_series', 1)
+        for col, limit_type in enumerate(table['limit_types']):
+            if limit_types[limit_type]['parameter'] in VOLTAGE_PARAMETERS:
+                table['values'][:, col] *= series
+        tables.append(table['values'])
+        grid_types += [t for t in limit_grid_points(profile['parameter_limits'], limit_types) if t not in grid_types]
+    profile_table = {'soc_step': soc_step, 'limit_types': list(limit_types), 'profiles': list(profiles),
+                     'values': np.ascontiguousarray(np.stack(tables))}
+
+    if grid_types:
+        grids = []
+        for profile, values in zip(profiles.values(), tables):
+            grid = interpolate_limit_grid(limit_grid_points(profile['parameter_limits'], limit_types), soc_step)
+            series = profile.get('cells_in_series', 1)
+            stacked = np.empty(grid['values'].shape[:2] + (len(grid_types),))
+            for col, limit_type in enumerate(grid_types):
+                if limit_type in grid['limit_types']:
+                    stacked[:, :, col] = grid['values'][:, :, grid['limit_types'].index(limit_type)]
+                    if limit_types[limit_type]['parameter'] in VOLTAGE_PARAMETERS:
+                        stacked[:, :, col] *= series
+                else:
+                    stacked[:, :, col] = values[:, list(limit_types).index(limit_type), None]
+            grids.append(stacked)
+        profile_table['temperature'] = {'temp_min': grid['temp_min'], 'temp_step': grid['temp_step'],
+                                        'limit_types': grid_types, 'values': np.ascontiguousarray(np.stack(grids))}
+    return profile_table
+
+
+def interpolate_limit_table(limit_points, soc_step=SOC_STEP):
+    """Interpolate limits over SoC 0-100 in soc_step increments with np.interp.
+
+    limit_points maps each limit type to its [(soc, value), ...] points, or to a single value for
+    SoC-independent limits. Returns {'soc_step', 'limit_types', 'values'} where values is a contiguous
+    (rows, limit types) float array; row i holds the limits at SoC i * soc_step, limit types without
+    points are NaN.
+    """
+    limit_types = list(limit_points)
+    rows = int(round(100 / soc_step)) + 1
+    grid = np.linspace(0, 100, rows)
+
+    values = np.full((rows, len(limit_types)), np.nan)
+    for col, limit_type in enumerate(limit_types):
+        points = limit_points[limit_type]
+        if isinstance(points, (list, tuple)):
+            if points:
+                points = sorted(points)
+                values[:, col] = np.interp(grid, [p[0] for p in points], [p[1] for p in points])
+        elif points is not None:
+            values[:, col] = points
+
+    return {'soc_step': soc_step, 'limit_types': limit_types, 'values': np.ascontiguousarray(values)}
+
+
+def interpolate_limit_grid(grid_points, soc_step=SOC_STEP, temp_step=TEMP_STEP, temp_range=TEMP_RANGE):
+    """Bilinear interpolation of SoC x temperature limits onto a dense grid.
+
+    grid_points maps each limit type to [(soc, temp, value), ...] covering every combination of its
+    SoC and temperature levels. Interpolating linearly along temperature and then along SoC is exactly
+    bilinear inside each grid cell; beyond the outermost temperatures the limits stay at the edge.
+    Returns {'soc_step', 'temp_min', 'temp_step', 'limit_types', 'values'} where values is a contiguous
+    (soc rows, temperature rows, limit types) array; [i, j] holds the limits at SoC i * soc_step and
+    temperature temp_min + j * temp_step.
+    """
+    limit_types = list(grid_points)
+    soc_grid = np.linspace(0, 100, int(round(100 / soc_step)) + 1)
+    temp_grid = temp_range[0] + temp_step * np.arange(int(round((temp_range[1] - temp_range[0]) / temp_step)) + 1)
+
+    values = np.full((len(soc_grid), len(temp_grid), len(limit_types)), np.nan)
+    for col, limit_type in enumerate(limit_types):
+        points = {(soc, temp): value for soc, temp, value in grid_points[limit_type]}
+        socs = sorted({soc for soc, _ in points})
+        temps = sorted({temp for _, temp in points})
+        if len(points) != len(socs) * len(temps):
+            raise ValueError(f"{limit_type} limits do not cover every SoC x temperature combination")
+        knots = np.array([[points[(soc, temp)] for temp in temps] for soc in socs])
+        along_temp = np.array([np.interp(temp_grid, temps, knot_row) for knot_row in knots])
+        values[:, :, col] = np.array([np.interp(soc_grid, socs, column) for column in along_temp.T]).T
+
+    return {'soc_step': soc_step, 'temp_min': float(temp_grid[0]), 'temp_step': temp_step,
+            'limit_types': limit_types, 'values': np.ascontiguousarray(values)}
+
+
+def limit_columns(limit_table, limit_names):
+    """Columns of a SoC limit table in limit_names order (NaN for limit types the table lacks).
+    Works on a single table (rows, limits) and on stacked profile tables (profiles, rows, limits)."""
+    values = limit_table['values']
+    out = np.full(values.shape[:-1] + (len(limit_names),), np.nan)
+    for col, name in enumerate(limit_names):
+        if name in limit_table['limit_types']:
+            out[..., col] = values[..., limit_table['limit_types'].index(name)]
+    return out
+
+
+def soc_row(soc, soc_step, rows):
+    """Table row for one SoC reading (nearest grid point, NaN counts as 0), None when out of range"""
+    if soc != soc:
+        return 0
+    row = math.floor(soc / soc_step + 0.5)
+    return row if 0 <= row < rows else None
+
+
+def temp_row(temp, temp_min, temp_step, rows):
+    """Temperature grid row for one reading (nearest grid point, clamped to the grid, NaN = TEMP_REFERENCE)"""
+    if temp != temp:
+        temp = TEMP_REFERENCE
+    return min(max(math.floor((temp - temp_min) / temp_step + 0.5), 0), rows - 1)
+
+
+# BATCH EVALUATION
+def _reading_columns(readings):
+    """Return the reading columns by name as float arrays from a DataFrame or an (N, 7) array"""
+    if isinstance(readings, pd.DataFrame):
+        return {col: readings[col].to_numpy(dtype=float, na_value=np.nan) for col in readings.columns}
+
+    values = np.asarray(readings, dtype=float)
+    if values.ndim != 2 or values.shape[1] != len(READING_COLUMNS):
+        raise ValueError(f"Expected an (N, {len(READING_COLUMNS)}) array with columns {READING_COLUMNS}")
+    return {col: values[:, i] for i, col in enumerate(READING_COLUMNS)}
+
+
+def soc_index(soc, soc_step, rows):
+    """Vectorized soc_row(): table rows per reading plus which readings fall inside the table"""
+    soc_level = np.where(np.isnan(soc), 0.0, np.floor(soc / soc_step + 0.5))
+    in_range = (soc_level >= 0) & (soc_level < rows)
+    return np.where(in_range, soc_level, 0).astype(np.intp), in_range
+
+
+def temp_index(temp, temp_min, temp_step, rows):
+    """Vectorized temp_row()"""
+    temp = np.where(np.isnan(temp), TEMP_REFERENCE, temp)
+    return np.clip(np.floor((temp - temp_min) / temp_step + 0.5), 0, rows - 1).astype(np.intp)
+
+
+def evaluate_batch(readings, ruleset, limit_table, previous_voltage=None, profile_ids=None):
+    """Evaluate all fault rules for every reading at once.
+
+    Returns a dict with the per-row fault 'bitmask' (bit i = ruleset.fault_names[i]), the index
+    of the highest-priority fault in 'top_fault' (-1 when nothing fired) and its 'top_severity'
+    (0 when nothing fired). previous_voltage is the voltage of the reading before the batch,
+    used for the first row's rate of change. With stacked profile tables (build_profile_limit_tables)
+    profile_ids gives each reading's profile (default: profile 0). Limit types with a SoC x temperature
+    grid take their thresholds from the grid at each reading's TEMP_PARAMETER.
+    """
+    columns = _reading_columns(readings)
+    n = len(next(iter(columns.values()))) if columns else 0
+
+    # Rate of change against the previous reading (0 for the very first one)
+    if 'Voltage_RoC' not in columns and 'Voltage' in columns:
+        voltage = columns['Voltage']
+        voltage_roc = np.zeros(n)
+        if n:
+            voltage_roc[1:] = voltage[1:] - voltage[:-1]
+            if previous_voltage is not None:
+                voltage_roc[0] = voltage[0] - previous_voltage
+        columns['Voltage_RoC'] = voltage_roc
+
+    values = np.array([columns.get(p, np.zeros(n)) for p in ruleset.parameters], dtype=float).reshape(-1, n)
+    status = columns.get('Status', np.zeros(n))
+    modes = np.where(status == 1, MODE_CODE['Charging'], MODE_CODE['Discharging'])
+
+    table = limit_columns(limit_table, ruleset.limit_names)
+    if table.ndim == 2:
+        table = table[None]
+    profile_ids = np.zeros(n, dtype=np.intp) if profile_ids is None else np.asarray(profile_ids, dtype=np.intp)
+    soc_idx, in_range = soc_index(columns.get('SoC', np.zeros(n)), limit_table['soc_step'], table.shape[1])
+
+    # Thresholds that do not change with SoC or profile stay scalars, the rest are gathered per reading
+    all_thresholds = ruleset.thresholds(table)
+    thresholds = []
+    for leaf in range(all_thresholds.shape[-1]):
+        column = all_thresholds[..., leaf]
+        first = column.flat[0]
+        thresholds.append(first if np.all(column == first) else column[profile_ids, soc_idx])
+
+    grid = limit_table.get('temperature')
+    if grid is not None:
+        leaves, grid_thresholds = ruleset.grid_thresholds(grid)
+        if leaves:
+            if grid_thresholds.ndim == 3:
+                grid_thresholds = grid_thresholds[None]
+            temp_idx = temp_index(columns.get(TEMP_PARAMETER, np.full(n, np.nan)), grid['temp_min'],
+                                  grid['temp_step'], grid_thresholds.shape[2])
+            gathered = grid_thresholds[profile_ids, soc_idx, temp_idx]
+            for j, leaf in enumerate(leaves):
+                thresholds[leaf] = gathered[:, j]
+    bitmask = ruleset.evaluate_columns(values, thresholds, modes)
+    bitmask[~in_range] = 0
+
+    top_fault = ruleset.top_fault(bitmask)
+    severities = np.array(ruleset.severities + [0], dtype=np.int16)
+    return {'bitmask': bitmask, 'top_fault': top_fault, 'top_severity': severities[top_fault]}
+
+
+def top_fault_names(ruleset, result):
+    """Map the 'top_fault' indices of evaluate_batch to fault names (None when no fault)"""
+    names = np.array(ruleset.fault_names[:ruleset.ranked_count] + [None], dtype=object)
+    return names[result['top_fault']]
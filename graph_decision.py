@@ -0,0 +1,107 @@
+# GRAPH DECISION - THE WHOLE FAULT DECISION FOR ONE READING IN A SINGLE CYPHER QUERY
+# the reading's values, SoC and operating mode go in as parameters; Neo4j interpolates the SoC limits,
+# evaluates the Rule nodes, ranks the fired faults by severity and returns the TRIGGERED_BY limits and
+# the mitigations applicable in the current OperatingMode. One auto-commit query = one round-trip.
+# same rule semantics as fault_engine.RuleSet, so both paths report the same faults for a reading
+
+import math
+from fault_engine import soc_row, SOC_STEP
+
+DECISION_QUERY = """
+// limit value of every limit type at this SoC (linear between SoC levels, like interpolate_limit_table)
+MATCH (:Parameter)-[:HAS_LIMIT]->(l:Limit)
+OPTIONAL MATCH (s:SoC)-[:EXPECTED_RANGE]->(l)
+WITH l.type AS type, toFloat(l.value) AS value, toFloat(s.level) AS level
+ORDER BY level
+WITH type, collect(CASE WHEN level IS NOT NULL THEN [level, value] END) AS points,
+     collect(CASE WHEN level IS NULL THEN value END) AS fixed
+WITH type, points, fixed,
+     coalesce(last([p IN points WHERE p[0] <= $soc]), head(points)) AS lo,
+     coalesce(head([p IN points WHERE p[0] >= $soc]), last(points)) AS hi
+WITH collect([type, CASE
+         WHEN size(points) = 0 THEN head(fixed)
+         WHEN hi[0] = lo[0] THEN lo[1]
+         ELSE lo[1] + (hi[1] - lo[1]) * ($soc - lo[0]) / (hi[0] - lo[0])
+     END]) AS limits
+
+// evaluate every rule that applies in this operating mode
+MATCH (r:Rule)-[:DETECTS]->(f:Fault)
+WHERE size(r.operating_modes) = 0 OR $mode IN r.operating_modes
+WITH f, r, [i IN range(0, size(r.parameters) - 1) |
+     coalesce(head([pair IN limits WHERE pair[0] = r.limits[i] | pair[1]]), r.defaults[i])
+     * r.scales[i] + r.offsets[i]] AS thresholds
+WITH f, r, [i IN range(0, size(r.parameters) - 1) | CASE r.comparators[i]
+         WHEN '<' THEN $values[r.parameters[i]] < thresholds[i]
+         WHEN '<=' THEN $values[r.parameters[i]] <= thresholds[i]
+         WHEN '>' THEN $values[r.parameters[i]] > thresholds[i]
+         WHEN '>=' THEN $values[r.parameters[i]] >= thresholds[i]
+         WHEN '==' THEN $values[r.parameters[i]] = thresholds[i]
+     END] AS hits
+WHERE size([hit IN hits WHERE hit]) >= CASE r.logic
+         WHEN 'all' THEN size(hits)
+         WHEN 'any' THEN 1
+         ELSE r.min_count
+     END
+WITH f, collect(DISTINCT [i IN range(0, size(hits) - 1) WHERE hits[i] | r.limits[i]]) AS exceeded
+
+// rank: severity first (faults without one last), then the fault's first rule in the rule table
+CALL {
+    WITH f
+    MATCH (first:Rule)-[:DETECTS]->(f)
+    RETURN min(first.id) AS rule_order
+}
+CALL {
+    WITH f
+    OPTIONAL MATCH (f)-[:TRIGGERED_BY]->(limit:Limit)
+    RETURN collect(DISTINCT limit.type) AS triggered_by
+}
+CALL {
+    WITH f
+    OPTIONAL MATCH (f)-[rel:MITIGATED_BY|RECOVERY_ACTION]->(m:Mitigation)
+    WHERE $mode = 'Unknown'
+       OR NOT EXISTS { (m)-[:APPLICABLE_IN]->(:OperatingMode) }
+       OR EXISTS { (m)-[:APPLICABLE_IN]->(:OperatingMode {name: $mode}) }
+    WITH rel, m
+    ORDER BY m.name
+    RETURN collect(CASE WHEN type(rel) = 'MITIGATED_BY' THEN m.name END) AS mitigated_by,
+           collect(CASE WHEN type(rel) = 'RECOVERY_ACTION' THEN m.name END) AS recovery_actions
+}
+RETURN f.name AS fault, f.severity AS severity, rule_order,
+       reduce(acc = [], limits IN exceeded | acc + [t IN limits WHERE NOT t IN acc]) AS exceeded_limits,
+       triggered_by, mitigated_by, recovery_actions
+ORDER BY coalesce(f.severity, 1000000), rule_order
+"""
+
+
+def reading_values(row, previous_row=None):
+    """Rule parameter values of a reading, Voltage_RoC from the previous reading, missing values as None"""
+    values = {}
+    for param, value in row.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[param] = None if math.isnan(value) else value
+    voltage_roc = 0
+    if previous_row is not None and 'Voltage' in previous_row and 'Voltage' in row:
+        voltage_roc = row['Voltage'] - previous_row['Voltage']
+    values['Voltage_RoC'] = None if voltage_roc != voltage_roc else voltage_roc
+    return values
+
+
+def decision_soc(soc, soc_step=SOC_STEP):
+    """SoC snapped to the same grid point the snapshot path uses, None when out of range"""
+    rows = int(round(100 / soc_step)) + 1
+    level = soc_row(float('nan') if soc is None else soc, soc_step, rows)
+    return None if level is None else round(level * soc_step, 6)
+
+
+def decide_in_graph(session, row, status, previous_row=None, soc_step=SOC_STEP):
+    """Fired faults for one reading, highest priority first, None when the SoC is out of range.
+
+    Each fault is {'fault', 'severity', 'rule_order', 'exceeded_limits', 'triggered_by',
+    'mitigated_by', 'recovery_actions'} with the mitigations already filtered by operating mode.
+    """
+    soc = decision_soc(row.get('SoC'), soc_step)
+    if soc is None:
+        return None
+    # auto-commit query: RUN and PULL are pipelined, no BEGIN/COMMIT round-trips
+    return session.run(DECISION_QUERY, values=reading_values(row, previous_row), soc=soc,
+                       mode=status).data()
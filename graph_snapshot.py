@@ -0,0 +1,166 @@
+# GRAPH SNAPSHOT - EVERYTHING THE NEO4J INGESTION PATH NEEDS, READ ONCE
+# limits (as a precomputed SoC limit table), the compiled rule table, fault severities and typed
+# mitigations per fault are loaded in one read transaction. The snapshot is only reloaded when the
+# builder's GraphVersion node changes, so steady-state evaluation makes no database calls apart from
+# one tiny version check every poll interval
+
+import time
+from fault_engine import RuleSet, interpolate_limit_table, limit_columns, SOC_STEP
+from mitigation_plan import MitigationPlanner
+
+VERSION_POLL_INTERVAL = 30  # seconds between GraphVersion checks
+
+VERSION_QUERY = """
+MATCH (v:GraphVersion)
+RETURN v.version AS version
+ORDER BY version DESC
+LIMIT 1
+"""
+
+LIMITS_QUERY = """
+MATCH (p:Parameter)-[:HAS_LIMIT]->(l:Limit)
+OPTIONAL MATCH (soc:SoC)-[:EXPECTED_RANGE]->(l)
+RETURN p.name AS parameter, l.type AS limit_type, l.value AS value, soc.level AS soc_level
+"""
+
+RULES_QUERY = """
+MATCH (r:Rule)-[:DETECTS]->(f:Fault)
+RETURN r.id AS id, f.name AS fault, f.severity AS severity, r.logic AS logic, r.min_count AS min_count,
+       r.operating_modes AS operating_modes, r.parameters AS parameters, r.comparators AS comparators,
+       r.limits AS limits, r.scales AS scales, r.offsets AS offsets, r.defaults AS defaults
+ORDER BY r.id
+"""
+
+SEVERITY_QUERY = """
+MATCH (f:Fault)
+WHERE f.severity IS NOT NULL
+RETURN f.name AS fault, f.severity AS severity
+"""
+
+MITIGATIONS_QUERY = """
+MATCH (f:Fault)-[r:MITIGATED_BY|RECOVERY_ACTION]->(m:Mitigation)
+OPTIONAL MATCH (m)-[:APPLICABLE_IN]->(op:OperatingMode)
+RETURN f.name AS fault, m.name AS mitigation, type(r) AS relationship_type, collect(op.name) AS operating_modes
+ORDER BY fault, relationship_type, mitigation
+"""
+
+
+def read_graph_version(tx):
+    """Version stamped by the graph builder, None for graphs built before versioning"""
+    record = tx.run(VERSION_QUERY).single()
+    return None if record is None else record['version']
+
+
+def read_limit_points(tx):
+    """{limit type: [(soc, value), ...] for SoC-dependent limits, or one value for fixed limits}"""
+    per_soc = {}
+    fixed = {}
+    for r in tx.run(LIMITS_QUERY).data():
+        if r['soc_level'] is None:
+            fixed[r['limit_type']] = r['value']
+        else:
+            per_soc.setdefault(r['limit_type'], []).append((r['soc_level'], r['value']))
+    # A limit type linked to SoC levels is interpolated even if one of its nodes is also unlinked
+    limit_points = dict(fixed)
+    limit_points.update(per_soc)
+    return limit_points
+
+
+def read_fault_rules(tx):
+    """Rule nodes as fault_rules dicts plus {fault: {'severity'}} for the faults they detect"""
+    fault_rules = []
+    faults_detailed = {}
+    for r in tx.run(RULES_QUERY).data():
+        conditions = []
+        for i in range(len(r['parameters'])):
+            default = r['defaults'][i]
+            conditions.append({
+                'parameter': r['parameters'][i],
+                'comparator': r['comparators'][i],
+                'limit': r['limits'][i],
+                'scale': r['scales'][i],
+                'offset': r['offsets'][i],
+                'default': None if default != default else default  # NaN = no default
+            })
+        fault_rules.append({'fault': r['fault'], 'logic': r['logic'], 'min_count': r['min_count'],
+                            'operating_modes': r['operating_modes'], 'conditions': conditions})
+        if r['severity'] is not None:
+            faults_detailed[r['fault']] = {'severity': r['severity']}
+    return fault_rules, faults_detailed
+
+
+class GraphSnapshot:
+    """Immutable view of the knowledge graph used for evaluation"""
+
+    def __init__(self, version, limit_points, fault_rules, faults_detailed, severities, mitigations,
+                 soc_step=SOC_STEP):
+        self.version = version
+        self.loaded_at = time.time()
+        self.severities = severities  # {fault: severity}
+        self.mitigations = mitigations  # {fault: [{'mitigation', 'relationship_type', 'operating_modes'}]}
+
+        self.fault_rules = RuleSet(fault_rules, faults_detailed)
+        self.limit_table = interpolate_limit_table(limit_points, soc_step)
+        self.soc_limits = limit_columns(self.limit_table, self.fault_rules.limit_names)
+        self.threshold_table = self.fault_rules.thresholds(self.soc_limits).tolist()
+        # MITIGATED_BY actions ahead of RECOVERY_ACTION ones, each with its APPLICABLE_IN modes
+        self.planner = MitigationPlanner(self.fault_rules, {
+            fault: [(m['mitigation'], m['operating_modes'])
+                    for m in sorted(entries, key=lambda m: m['relationship_type'] != 'MITIGATED_BY')]
+            for fault, entries in mitigations.items()})
+
+    def mitigation_names(self, fault, relationship_type=None):
+        """Mitigation names of a fault, optionally only one relationship type (MITIGATED_BY / RECOVERY_ACTION)"""
+        return [m['mitigation'] for m in self.mitigations.get(fault, [])
+                if relationship_type is None or m['relationship_type'] == relationship_type]
+
+
+def load_snapshot(tx, soc_step=SOC_STEP):
+    """Read a complete GraphSnapshot inside one read transaction"""
+    version = read_graph_version(tx)
+    limit_points = read_limit_points(tx)
+    fault_rules, faults_detailed = read_fault_rules(tx)
+    severities = {r['fault']: r['severity'] for r in tx.run(SEVERITY_QUERY).data()}
+
+    mitigations = {}
+    for r in tx.run(MITIGATIONS_QUERY).data():
+        if r['mitigation']:
+            mitigations.setdefault(r['fault'], []).append({
+                'mitigation': r['mitigation'],
+                'relationship_type': r['relationship_type'],
+                'operating_modes': sorted(r['operating_modes'])
+            })
+    return GraphSnapshot(version, limit_points, fault_rules, faults_detailed, severities, mitigations, soc_step)
+
+
+class GraphSnapshotCache:
+    """Current GraphSnapshot of a Neo4j database, reloaded only when the graph version changes"""
+
+    def __init__(self, driver, poll_interval=VERSION_POLL_INTERVAL, database=None, soc_step=SOC_STEP):
+        self.driver = driver
+        self.poll_interval = poll_interval
+        self.session_args = {'database': database} if database else {}
+        self.soc_step = soc_step
+        self.snapshot = None
+        self.next_poll = 0.0
+        self.reloads = 0
+
+    def reload(self):
+        with self.driver.session(**self.session_args) as session:
+            self.snapshot = session.execute_read(load_snapshot, self.soc_step)
+        self.reloads += 1
+        self.next_poll = time.monotonic() + self.poll_interval
+        return self.snapshot
+
+    def get(self):
+        """Current snapshot, checking the graph version at most once per poll interval"""
+        if self.snapshot is None:
+            return self.reload()
+        now = time.monotonic()
+        if now >= self.next_poll:
+            self.next_poll = now + self.poll_interval
+            with self.driver.session(**self.session_args) as session:
+                version = session.execute_read(read_graph_version)
+            if version != self.snapshot.version:
+                return self.reload()
+        return self.snapshot
@@ -0,0 +1,372 @@
+# INGEST QUEUE - SEVERITY-PRIORITIZED LANES BETWEEN THE SOCKET SERVERS AND FAULT DETECTION
+# the servers only pre-screen a frame and queue its readings, one worker thread runs fault detection.
+# The pre-screen is a vectorized bound check of the whole frame against the thresholds at each reading's
+# profile, SoC row and temperature, with Voltage_RoC taken against the device's previous reading and trend
+# statistics from its last evaluation: a reading that could fire any rule goes to the urgent lane, which is
+# always served first; a reading inside every bound is benign and waits in the benign lane, served
+# round-robin across devices in batches. Under overload benign readings are shed, while urgent readings are
+# coalesced per device: beyond its urgent backlog (or the lane's bound) a device's newest urgent reading
+# replaces its newest queued one.
+# Readings of one device stay in order: each device has one FIFO, a device's queued benign readings (older)
+# are evaluated just before its urgent one, so rate of change, trends and debounce see the same sequence as
+# without the queue and an urgent reading only ever waits behind its own device's backlog, never the fleet's.
+
+import math
+import threading
+import time
+from collections import deque
+import numpy as np
+from fault_engine import READING_COLUMNS, COMPARATORS, TEMP_PARAMETER, soc_row, soc_index, temp_index
+from device_state import DEFAULT_DEVICE_ID
+from fault_debounce import MAX_WINDOW
+from trend_window import trend_features
+
+MAX_BENIGN_READINGS = 10000   # benign readings queued across all devices before shedding
+DEVICE_BACKLOG = 64           # benign readings queued per device before shedding
+MAX_URGENT_READINGS = 4096    # urgent readings queued across all devices before coalescing
+URGENT_BACKLOG = MAX_WINDOW   # urgent readings queued per device before coalescing, a debounce window's worth
+BENIGN_BATCH = 32             # benign readings taken per lock acquisition (urgent ones are checked in between)
+SHED_POLICY = 'coalesce'      # 'coalesce': the newest benign reading replaces the device's newest queued one,
+                              # 'drop': the newest benign reading is discarded
+VECTOR_MIN_READINGS = 8       # frames with fewer readings are screened one reading at a time
+SCREEN_COLUMNS = [col for col in READING_COLUMNS if col != 'Status']  # converted with float() like the monitor
+TREND_SCREEN_MARGIN = 0.5     # a trend statistic within this fraction of its limit could hold by the next reading
+
+
+# PRE-SCREEN
+class PreScreen:
+    """Rule check of one KnowledgeBase limited to what a reading shows on its own.
+
+    Every condition on a reading value is compared with its threshold at the reading's profile, SoC row
+    and temperature row, and a reading is urgent when some rule has at least min_count conditions that
+    hold or could hold. Derived parameters come with the readings (see urgent()): Voltage_RoC is exact,
+    a trend statistic is the device's value after its last evaluated reading and is screened against its
+    limit loosened by TREND_SCREEN_MARGIN, as the next sample moves it only a little. A missing derived
+    value (NaN, a window still filling) counts as not holding, like in the monitor. Operating modes are
+    ignored, so mode-specific rules err on the urgent side.
+    """
+
+    def __init__(self, knowledge):
+        ruleset = knowledge.fault_rules
+        self.profile_id = knowledge.profile_id
+        self.thresholds = knowledge.thresholds
+        self.soc_step = knowledge.limit_table['soc_step']
+        thresholds = np.asarray(knowledge.threshold_tables, dtype=float)  # (profiles, soc, leaves)
+        self.soc_rows = thresholds.shape[1]
+
+        self.reading_columns = [p for p in ruleset.parameters if p in SCREEN_COLUMNS]
+        self.reading_columns += [col for col in SCREEN_COLUMNS if col not in self.reading_columns]
+        self.derived_columns = [p for p in ruleset.parameters if p not in SCREEN_COLUMNS]
+        self.columns = self.reading_columns + self.derived_columns
+        trend_parameters = {name for name, _, _ in trend_features(ruleset.parameters)}
+        self.soc_column = self.columns.index('SoC')
+        self.temp_column = self.columns.index(TEMP_PARAMETER)
+        # screened leaves as sign * value (< or <=) bound: sign +1 for 'value below limit' conditions, -1 for 'above'
+        leaves, rows, signs, strict, bounds, margins = [], [], [], [], [], []
+        for leaf, (param, compare) in enumerate(zip(ruleset.leaf_columns, ruleset.leaf_compare)):
+            name = ruleset.parameters[param]
+            if compare in (COMPARATORS['<'], COMPARATORS['<=']):
+                sign, bound = 1.0, thresholds[..., leaf]
+            elif compare in (COMPARATORS['>'], COMPARATORS['>=']):
+                sign, bound = -1.0, -thresholds[..., leaf]
+            else:
+                sign, bound = 1.0, np.full(thresholds.shape[:2], np.inf)  # '==' always counts as possibly holding
+            margin = TREND_SCREEN_MARGIN if name in trend_parameters else 0.0
+            bound = bound + margin * np.abs(bound)
+            leaves.append(leaf)
+            rows.append(self.columns.index(name))
+            signs.append(sign)
+            strict.append(compare in (COMPARATORS['<'], COMPARATORS['>']))
+            bounds.append(bound)
+            margins.append(margin)
+        self.rows = np.array(rows, dtype=np.intp)
+        self.signs = np.array(signs)[:, None]
+        self.strict = np.array(strict)[:, None]
+        self.bounds = np.stack(bounds, axis=-1) if bounds else np.zeros(thresholds.shape[:2] + (0,))
+        self.membership = ruleset.membership[:, leaves]
+        self.min_count = ruleset.min_count[:, None]
+
+        # Screened leaves with a SoC x temperature grid are gathered from the KnowledgeBase's grid per reading
+        self.grid = None
+        grid_leaves = [(position, knowledge.temperature_leaves.index(leaf)) for position, leaf in enumerate(leaves)
+                       if leaf in knowledge.temperature_leaves and ruleset.leaf_compare[leaf] is not COMPARATORS['==']]
+        if grid_leaves:
+            self.grid = knowledge.temperature_tables  # (profiles, soc, temperature, grid leaves), shared, not copied
+            self.grid_positions = [position for position, _ in grid_leaves]
+            self.grid_columns = [column for _, column in grid_leaves]
+            self.grid_signs = self.signs[self.grid_positions, 0]
+            self.grid_margins = np.array(margins)[self.grid_positions]
+            self.temp_min, self.temp_step = knowledge.temp_min, knowledge.temp_step
+
+        # Small frames: the same check per reading on the KnowledgeBase's threshold rows, no NumPy calls
+        self.scalar_checks = [(leaf, row, ruleset.leaf_compare[leaf]) for leaf, row in zip(leaves, rows)]
+        self.scalar_trend_checks = [(position, leaf, row, ruleset.leaf_compare[leaf], margin, sign)
+                                    for position, (leaf, row, margin, sign) in enumerate(zip(leaves, rows, margins, signs))
+                                    if margin]
+        position = {leaf: i for i, leaf in enumerate(leaves)}
+        self.scalar_rules = [([position[leaf] for leaf in rule_leaves if leaf in position], min_count)
+                             for rule_leaves, min_count, _, _ in ruleset.rule_plan]
+
+    def urgent(self, readings, derived=None):
+        """Bool per reading, True when it could fire a rule (or its SoC has no limits). derived holds a
+        {derived parameter: value} dict per reading (None: all unknown). Raises ValueError / TypeError for
+        values the monitor could not convert either."""
+        if derived is None:
+            derived = [{}] * len(readings)
+        if len(readings) < VECTOR_MIN_READINGS:
+            return [self._urgent_one(reading, values) for reading, values in zip(readings, derived)]
+        values = np.array([[float(reading.get(col, 0)) for reading in readings] for col in self.reading_columns]
+                          + [[values.get(col, np.nan) for values in derived] for col in self.derived_columns])
+        profiles = [self.profile_id(str(reading.get('DeviceID', DEFAULT_DEVICE_ID))) for reading in readings]
+        soc_idx, in_range = soc_index(values[self.soc_column], self.soc_step, self.soc_rows)
+        bounds = self.bounds[profiles, soc_idx]
+        if self.grid is not None:
+            temp_idx = temp_index(values[self.temp_column], self.temp_min, self.temp_step, self.grid.shape[2])
+            grid = self.grid[profiles, soc_idx, temp_idx][:, self.grid_columns] * self.grid_signs
+            bounds[:, self.grid_positions] = grid + self.grid_margins * np.abs(grid)
+        signed, bounds = self.signs * values[self.rows], bounds.T
+        with np.errstate(invalid='ignore'):
+            hits = np.where(self.strict, signed < bounds, signed <= bounds)
+        fired = ((self.membership @ hits.astype(np.float32)) >= self.min_count).any(axis=0)
+        return (fired | ~in_range).tolist()
+
+    def _urgent_one(self, reading, derived):
+        values = [float(reading.get(col, 0)) for col in self.reading_columns]
+        values += [derived.get(col, np.nan) for col in self.derived_columns]
+        soc_level = soc_row(values[self.soc_column], self.soc_step, self.soc_rows)
+        if soc_level is None:
+            return True
+        profile = self.profile_id(str(reading.get('DeviceID', DEFAULT_DEVICE_ID)))
+        thresholds = self.thresholds(profile, soc_level, values[self.temp_column])
+        hits = [compare(values[row], thresholds[leaf]) for leaf, row, compare in self.scalar_checks]
+        for position, leaf, row, compare, margin, sign in self.scalar_trend_checks:
+            limit = thresholds[leaf]
+            hits[position] = compare(values[row], limit + sign * margin * abs(limit))
+        return any(sum(hits[i] for i in rule_leaves) >= min_count for rule_leaves, min_count in self.scalar_rules)
+
+
+# QUEUE
+class IngestQueue:
+    """Urgent and benign reading lanes in front of process(sensor_data, received_at), served by one thread.
+
+    Every device has one FIFO of its queued readings, urgent and benign, so its readings are evaluated in
+    arrival order. The urgent lane names a device once per urgent reading: serving it evaluates that
+    device's readings up to and including its oldest urgent one. Benign readings of devices without a
+    pending urgent reading are served round-robin. Shedding only ever touches a device's newest queued
+    reading (or drops the new one), so it never reorders a device either.
+
+    prescreen() returns the PreScreen of the KG in service, so a reload changes the bounds with the rules.
+    history(device) returns the device's trend statistics after its last evaluated reading ({} when unknown);
+    Voltage_RoC is taken against the device's previous reading in arrival order.
+    Wait times go to the 'queue_urgent' / 'queue_benign' stages of latency (a LatencyRecorder).
+    """
+
+    def __init__(self, process, prescreen, latency=None, max_benign=MAX_BENIGN_READINGS,
+                 device_backlog=DEVICE_BACKLOG, batch=BENIGN_BATCH, shed_policy=SHED_POLICY, on_error=None,
+                 max_urgent=MAX_URGENT_READINGS, urgent_backlog=URGENT_BACKLOG, history=None):
+        if shed_policy not in ('coalesce', 'drop'):
+            raise ValueError(f"Unknown shed policy {shed_policy!r}")
+        self.process = process
+        self.prescreen = prescreen
+        self.latency = latency
+        self.max_benign = max_benign
+        self.device_backlog = device_backlog
+        self.batch = batch
+        self.shed_policy = shed_policy
+        self.max_urgent = max_urgent
+        self.urgent_backlog = urgent_backlog
+        self.on_error = on_error  # on_error(sensor_data, exception) when process() raised
+        self.history = history
+        self._last_voltage = {}    # device -> voltage of its previous screened reading
+        self._queued = {}          # device -> deque of items in arrival order, a device with an entry is in _order once
+        self._order = deque()      # devices with queued readings, round-robin
+        self._urgent = deque()     # device of every queued urgent reading, in arrival order
+        self._urgent_queued = {}   # device -> urgent readings in its FIFO
+        self._benign_depth = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.peak_urgent = 0
+        self.peak_benign = 0
+        self.counts = {'urgent': 0, 'benign': 0, 'screen_failed': 0, 'coalesced': 0, 'dropped': 0,
+                       'urgent_coalesced': 0, 'urgent_dropped': 0, 'processed': 0, 'errors': 0}
+
+    def put(self, readings, received_at=None):
+        """Screen and queue the readings of one frame, never blocks on fault detection"""
+        if not readings:
+            return
+        prescreen = self.prescreen()
+        derived = self._derived(readings) if prescreen.derived_columns else None
+        failed = 0
+        try:
+            urgent = prescreen.urgent(readings, derived)
+        except (ValueError, TypeError):
+            # unparsable values: screen reading by reading, the bad ones go first so the monitor reports them
+            urgent = []
+            for i, sensor_data in enumerate(readings):
+                try:
+                    urgent.append(prescreen.urgent([sensor_data], derived and derived[i:i + 1])[0])
+                except (ValueError, TypeError):
+                    urgent.append(True)
+                    failed += 1
+        now = time.monotonic()
+        with self._cond:
+            self.counts['screen_failed'] += failed
+            for sensor_data, is_urgent in zip(readings, urgent):
+                device = str(sensor_data.get('DeviceID', DEFAULT_DEVICE_ID))
+                # [reading, frame received, queued at, readings it stands for, urgent]
+                item = [sensor_data, received_at, now, 1, is_urgent]
+                if is_urgent:
+                    self._queue_urgent(device, item)
+                else:
+                    self._queue_benign(device, item)
+            self.peak_urgent = max(self.peak_urgent, len(self._urgent))
+            self.peak_benign = max(self.peak_benign, self._benign_depth)
+            self._cond.notify()
+
+    def _derived(self, readings):
+        """{derived parameter: value} per reading, from the device's previous reading and last trend values"""
+        derived = []
+        with self._cond:
+            for sensor_data in readings:
+                device = str(sensor_data.get('DeviceID', DEFAULT_DEVICE_ID))
+                try:
+                    voltage = float(sensor_data.get('Voltage', 0))
+                except (ValueError, TypeError):
+                    voltage = math.nan
+                previous = self._last_voltage.get(device)
+                roc = 0.0 if previous is None else voltage - previous  # no previous reading: 0, like the monitor
+                if voltage == voltage:
+                    self._last_voltage[device] = voltage
+                values = dict(self.history(device)) if self.history is not None else {}
+                values['Voltage_RoC'] = roc
+                derived.append(values)
+        return derived
+
+    def _append(self, device, item):
+        queued = self._queued.get(device)
+        if queued is None:
+            queued = self._queued[device] = deque()
+            self._order.append(device)
+        queued.append(item)
+
+    @staticmethod
+    def _supersede(queued_item, item):
+        """The newer reading takes the queued one's place (and wait time)"""
+        queued_item[0], queued_item[1], queued_item[3] = item[0], item[1], queued_item[3] + item[3]
+
+    def _queue_urgent(self, device, item):
+        self.counts['urgent'] += 1
+        urgent_queued = self._urgent_queued.get(device, 0)
+        if len(self._urgent) >= self.max_urgent or urgent_queued >= self.urgent_backlog:
+            if not urgent_queued:
+                # lane full and nothing of this device to supersede
+                self.counts['urgent_dropped'] += 1
+                return
+            # benign readings newer than the device's newest urgent one are shed, then the newest reading
+            # supersedes that urgent one: it is last in the device's FIFO, so the order is kept
+            queued = self._queued[device]
+            while not queued[-1][4]:
+                queued.pop()
+                self._benign_depth -= 1
+                self.counts['dropped'] += 1
+            self._supersede(queued[-1], item)
+            self.counts['urgent_coalesced'] += 1
+            return
+        self._urgent_queued[device] = urgent_queued + 1
+        self._urgent.append(device)
+        self._append(device, item)
+
+    def _queue_benign(self, device, item):
+        self.counts['benign'] += 1
+        queued = self._queued.get(device)
+        backlog = 0 if queued is None else len(queued) - self._urgent_queued.get(device, 0)
+        if self._benign_depth >= self.max_benign or backlog >= self.device_backlog:
+            if queued and not queued[-1][4] and self.shed_policy == 'coalesce':
+                # only the device's newest queued reading is superseded, never one older than an urgent reading
+                self._supersede(queued[-1], item)
+                self.counts['coalesced'] += 1
+            else:
+                self.counts['dropped'] += 1
+            return
+        self._append(device, item)
+        self._benign_depth += 1
+
+    def _next_batch(self):
+        """Items to evaluate in this order; None once stopped and drained"""
+        with self._cond:
+            while True:
+                if self._urgent:
+                    # the device's readings up to its oldest urgent one, older benign readings first;
+                    # the device's entry stays until its _order turn
+                    device = self._urgent.popleft()
+                    queued = self._queued[device]
+                    batch = []
+                    while True:
+                        item = queued.popleft()
+                        batch.append(item)
+                        if item[4]:
+                            break
+                        self._benign_depth -= 1
+                    self._urgent_queued[device] -= 1
+                    if not self._urgent_queued[device]:
+                        del self._urgent_queued[device]
+                    return batch
+                if self._benign_depth:
+                    # no urgent reading is queued, every FIFO holds benign readings only
+                    batch = []
+                    while len(batch) < self.batch and self._order:
+                        device = self._order.popleft()
+                        queued = self._queued[device]
+                        if not queued:
+                            del self._queued[device]
+                            continue
+                        batch.append(queued.popleft())
+                        self._benign_depth -= 1
+                        if queued:
+                            self._order.append(device)
+                        else:
+                            del self._queued[device]
+                    return batch
+                if self._stopping:
+                    return None
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            for sensor_data, received_at, queued_at, _, is_urgent in batch:
+                if self.latency is not None:
+                    self.latency.record('queue_urgent' if is_urgent else 'queue_benign', time.monotonic() - queued_at)
+                try:
+                    self.process(sensor_data, received_at)
+                except Exception as e:
+                    self.counts['errors'] += 1
+                    if self.on_error is not None:
+                        self.on_error(sensor_data, e)
+                self.counts['processed'] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ingest', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Evaluate everything still queued, then end the worker"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self, reset_peaks=False):
+        with self._cond:
+            stats = dict(self.counts, urgent_depth=len(self._urgent), benign_depth=self._benign_depth,
+                         backlogged_devices=len(self._queued), peak_urgent=self.peak_urgent,
+                         peak_benign=self.peak_benign)
+            if reset_peaks:
+                self.peak_urgent = len(self._urgent)
+                self.peak_benign = self._benign_depth
+        return stats
@@ -0,0 +1,360 @@
+# KG ARTIFACT - COMPILED, CHECKSUMMED KNOWLEDGE GRAPH FILE FOR THE PI
+# knowledge_graph_pickle.py writes knowledge_graph.kgb next to the pickle. The file is a fixed header,
+# a section table and 8-byte aligned little-endian arrays: one interned string table, integer IDs for
+# parameters / limit types / faults / mitigations, the rule table as flat columns, the precomputed
+# SoC (and SoC x temperature) limit tables of every limit profile and the device -> profile map.
+# Loading maps the file and wraps the sections as NumPy views - nothing is unpickled, so a tampered
+# file cannot run code, and a truncated, corrupt or incompatible file is rejected.
+#   python kg_artifact.py knowledge_graph.kgb     prints the header and load time
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+from fault_engine import COMPARATORS, OPERATING_MODES
+
+MAGIC = b'BKGA'
+FORMAT_VERSION = 3  # 2: limit profiles and device map, 3: SoC x temperature grids
+ALIGNMENT = 8
+
+# magic, format version, section count, engine signature, crc32 of everything after the header,
+# file size, content hash (first 16 bytes of the SHA-256 of the data sections)
+HEADER = struct.Struct('<4sHHIIQ16s')
+# name, dtype code, ndim, offset, shape[0], shape[1]
+SECTION = struct.Struct('<16sBB6xQQQ')
+DTYPES = ['<u1', '<u2', '<u4', '<i2', '<f8']
+
+RULE_LOGIC = ['all', 'any', 'at_least']
+NO_SEVERITY = -1
+
+# Codes stored in the file index these tables, an artifact built against different ones is stale
+ENGINE_SIGNATURE = zlib.crc32(json.dumps([list(COMPARATORS), OPERATING_MODES, RULE_LOGIC]).encode())
+
+
+class ArtifactError(ValueError):
+    """The artifact is missing, truncated, corrupt or was built for another format/engine"""
+
+
+class StringTable:
+    """Interns strings while writing, every name is stored once and referenced by ID"""
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, text):
+        text = str(text)
+        if text not in self.ids:
+            self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return self.ids[text]
+
+    def arrays(self):
+        encoded = [s.encode('utf-8') for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _csr(lists, dtype=np.uint32):
+    """Flatten a list of lists into (start offsets, values)"""
+    start = np.zeros(len(lists) + 1, dtype=np.uint32)
+    start[1:] = np.cumsum([len(items) for items in lists])
+    return start, np.array([item for items in lists for item in items], dtype=dtype)
+
+
+# WRITER
+def compile_sections(kg_data):
+    """Turn the pickled knowledge graph dict into the artifact's named arrays"""
+    strings = StringTable()
+    limit_table = kg_data['limit_table']
+    fault_rules = kg_data['fault_rules']
+    faults_detailed = kg_data['faults_detailed']
+    mitigations = kg_data.get('mitigations', {})
+
+    # IDs: faults in rule order, then faults that only have details or mitigations
+    fault_names = []
+    for name in [rule['fault'] for rule in fault_rules] + list(faults_detailed) + list(mitigations):
+        if name not in fault_names:
+            fault_names.append(name)
+    fault_id = {name: i for i, name in enumerate(fault_names)}
+    mitigation_names = []
+    for entry in mitigations.values():
+        for name in entry['mitigations']:
+            if name not in mitigation_names:
+                mitigation_names.append(name)
+    mitigation_id = {name: i for i, name in enumerate(mitigation_names)}
+    parameters = []
+    limit_types = list(limit_table['limit_types'])
+    for rule in fault_rules:
+        for cond in rule['conditions']:
+            if cond['parameter'] not in parameters:
+                parameters.append(cond['parameter'])
+            if cond['limit'] not in limit_types:
+                limit_types.append(cond['limit'])  # a limit type without values reads as NaN
+
+    values = np.full((limit_table['values'].shape[0], len(limit_types)), np.nan)
+    values[:, :limit_table['values'].shape[1]] = limit_table['values']
+
+    # Profiles stacked on the first axis, stored flattened as (profiles * rows, limit types)
+    profile_table = kg_data.get('profile_table') or {
+        'profiles': [kg_data.get('default_profile', 'default')], 'limit_types': limit_table['limit_types'],
+        'values': limit_table['values'][None]}
+    profile_names = list(profile_table['profiles'])
+    profile_values = np.full(profile_table['values'].shape[:2] + (len(limit_types),), np.nan)
+    for col, limit_type in enumerate(profile_table['limit_types']):
+        profile_values[:, :, limit_types.index(limit_type)] = profile_table['values'][:, :, col]
+    default_profile = kg_data.get('default_profile', profile_names[0])
+    # SoC x temperature grids stored flattened as (profiles * soc rows * temperature rows, grid limit types)
+    grid = profile_table.get('temperature') or {'temp_min': 0.0, 'temp_step': 0.0, 'limit_types': []}
+    grid_types = list(grid['limit_types'])
+    grid_values = (np.asarray(grid['values'], dtype=np.float64).reshape(-1, len(grid_types)) if grid_types
+                   else np.zeros((0, 0)))
+    device_profiles = kg_data.get('device_profiles', {})
+
+    conditions = [cond for rule in fault_rules for cond in rule['conditions']]
+    rule_start, _ = _csr([range(len(rule['conditions'])) for rule in fault_rules])
+    mode_masks = []
+    for rule in fault_rules:
+        mask = 0
+        for mode in rule.get('operating_modes') or []:
+            mask |= 1 << OPERATING_MODES.index(mode)
+        mode_masks.append(mask)  # 0 = every mode
+    severities = [faults_detailed.get(name, {}).get('severity', NO_SEVERITY) for name in fault_names]
+    trigger_start, triggers = _csr([[strings.intern(t) for t in faults_detailed.get(name, {}).get('triggers', [])]
+                                    for name in fault_names])
+    mitigation_start, fault_mitigations = _csr([[mitigation_id[m] for m in mitigations.get(name, {}).get('mitigations', [])]
+                                                for name in fault_names], np.uint16)
+    mode_start, fault_modes = _csr([[strings.intern(m) for m in mitigations.get(name, {}).get('operating_modes', [])]
+                                    for name in fault_names])
+
+    sections = {
+        'parameters': np.array([strings.intern(p) for p in parameters], dtype=np.uint32),
+        'limit_types': np.array([strings.intern(t) for t in limit_types], dtype=np.uint32),
+        'limit_values': values,
+        'soc_step': np.array([limit_table['soc_step']], dtype=np.float64),
+        'profiles': np.array([strings.intern(p) for p in profile_names], dtype=np.uint32),
+        'profile_values': profile_values.reshape(-1, len(limit_types)),
+        'default_profile': np.array([profile_names.index(default_profile)], dtype=np.uint16),
+        'temp_axis': np.array([grid['temp_min'], grid['temp_step']], dtype=np.float64),
+        'temp_types': np.array([strings.intern(t) for t in grid_types], dtype=np.uint32),
+        'temp_values': grid_values,
+        'device_ids': np.array([strings.intern(d) for d in device_profiles], dtype=np.uint32),
+        'device_profile': np.array([profile_names.index(p) for p in device_profiles.values()], dtype=np.uint16),
+        'faults': np.array([strings.intern(f) for f in fault_names], dtype=np.uint32),
+        'fault_severity': np.array(severities, dtype=np.int16),
+        'fault_desc': np.array([strings.intern(faults_detailed.get(name, {}).get('description', ''))
+                                for name in fault_names], dtype=np.uint32),
+        'trigger_start': trigger_start,
+        'triggers': triggers,
+        'mitigations': np.array([strings.intern(m) for m in mitigation_names], dtype=np.uint32),
+        'fault_mit_start': mitigation_start,
+        'fault_mit': fault_mitigations,
+        'fault_mode_start': mode_start,
+        'fault_modes': fault_modes,
+        'rule_fault': np.array([fault_id[rule['fault']] for rule in fault_rules], dtype=np.uint16),
+        'rule_logic': np.array([RULE_LOGIC.index(rule.get('logic', 'all')) for rule in fault_rules], dtype=np.uint8),
+        'rule_min_count': np.array([rule.get('min_count', 0) for rule in fault_rules], dtype=np.uint8),
+        'rule_modes': np.array(mode_masks, dtype=np.uint8),
+        'rule_start': rule_start,
+        'cond_param': np.array([parameters.index(c['parameter']) for c in conditions], dtype=np.uint16),
+        'cond_compare': np.array([list(COMPARATORS).index(c['comparator']) for c in conditions], dtype=np.uint8),
+        'cond_limit': np.array([limit_types.index(c['limit']) for c in conditions], dtype=np.uint16),
+        'cond_scale': np.array([c.get('scale', 1.0) for c in conditions], dtype=np.float64),
+        'cond_offset': np.array([c.get('offset', 0.0) for c in conditions], dtype=np.float64),
+        'cond_default': np.array([np.nan if c.get('default') is None else c['default'] for c in conditions],
+                                 dtype=np.float64),
+    }
+    # the string table goes last, every section above interned into it
+    sections['strings'], sections['string_offsets'] = strings.arrays()
+    return sections
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_artifact(path, kg_data):
+    """Write kg_data as a compiled artifact (atomic rename), returns the content version"""
+    sections = compile_sections(kg_data)
+    offset = _align(HEADER.size + SECTION.size * len(sections))
+    table = []
+    blobs = []
+    content = hashlib.sha256()
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        dtype_code = [np.dtype(d) for d in DTYPES].index(array.dtype)
+        shape = array.shape + (0,) * (2 - array.ndim)
+        table.append(SECTION.pack(name.encode('ascii'), dtype_code, array.ndim, offset, shape[0], shape[1]))
+        data = array.tobytes()
+        blobs.append((offset, data))
+        content.update(name.encode('ascii') + data)
+        offset = _align(offset + len(data))
+
+    body = bytearray(offset - HEADER.size)
+    body[:len(table) * SECTION.size] = b''.join(table)
+    for start, data in blobs:
+        body[start - HEADER.size:start - HEADER.size + len(data)] = data
+    digest = content.digest()[:16]
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), ENGINE_SIGNATURE, zlib.crc32(body), offset, digest)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return digest.hex()
+
+
+# READER
+class KGArtifact:
+    """Memory-mapped artifact, every section a read-only NumPy view into the file"""
+
+    def __init__(self, buffer, sections, version, path=None):
+        self.buffer = buffer
+        self.sections = sections
+        self.version = version  # hex content hash, identical for identical graphs
+        self.path = path
+        self._strings = None
+
+    def __getitem__(self, name):
+        return self.sections[name]
+
+    def string(self, string_id):
+        offsets = self.sections['string_offsets']
+        return bytes(self.sections['strings'][offsets[string_id]:offsets[string_id + 1]]).decode('utf-8')
+
+    def strings(self, ids):
+        return [self.string(i) for i in ids.tolist()]
+
+    def _slice(self, start, values, i):
+        return values[start[i]:start[i + 1]]
+
+    def limit_table(self):
+        """{'soc_step', 'limit_types', 'values'} with values mapped straight from the file"""
+        return {'soc_step': float(self.sections['soc_step'][0]), 'limit_types': self.strings(self.sections['limit_types']),
+                'values': self.sections['limit_values']}
+
+    def profile_table(self):
+        """Stacked per-profile limit tables, values shaped (profiles, rows, limit types) over the file,
+        plus the SoC x temperature grids under 'temperature' when the graph has them"""
+        profiles = self.strings(self.sections['profiles'])
+        values = self.sections['profile_values']
+        rows = values.shape[0] // len(profiles)
+        table = {'soc_step': float(self.sections['soc_step'][0]), 'limit_types': self.strings(self.sections['limit_types']),
+                 'profiles': profiles, 'values': values.reshape(len(profiles), rows, values.shape[1])}
+        grid_types = self.strings(self.sections['temp_types'])
+        if grid_types:
+            temp_min, temp_step = self.sections['temp_axis'].tolist()
+            table['temperature'] = {'temp_min': temp_min, 'temp_step': temp_step, 'limit_types': grid_types,
+                                    'values': self.sections['temp_values'].reshape(len(profiles), rows, -1, len(grid_types))}
+        return table
+
+    def fault_rules(self):
+        """The rule table as the fault_rules dicts compile_rules() expects"""
+        s = self.sections
+        parameters = self.strings(s['parameters'])
+        limit_types = self.strings(s['limit_types'])
+        faults = self.strings(s['faults'])
+        comparators = list(COMPARATORS)
+        rules = []
+        for r in range(len(s['rule_fault'])):
+            conditions = []
+            for c in range(s['rule_start'][r], s['rule_start'][r + 1]):
+                default = float(s['cond_default'][c])
+                conditions.append({'parameter': parameters[s['cond_param'][c]],
+                                   'comparator': comparators[s['cond_compare'][c]],
+                                   'limit': limit_types[s['cond_limit'][c]],
+                                   'scale': float(s['cond_scale'][c]), 'offset': float(s['cond_offset'][c]),
+                                   'default': None if default != default else default})
+            mask = int(s['rule_modes'][r])
+            rules.append({'fault': faults[s['rule_fault'][r]], 'logic': RULE_LOGIC[s['rule_logic'][r]],
+                          'min_count': int(s['rule_min_count'][r]),
+                          'operating_modes': [m for i, m in enumerate(OPERATING_MODES) if mask >> i & 1],
+                          'conditions': conditions})
+        return rules
+
+    def to_kg_data(self):
+        """The parts of the pickled kg_data the ingestion script uses"""
+        s = self.sections
+        faults = self.strings(s['faults'])
+        mitigation_names = self.strings(s['mitigations'])
+        faults_detailed = {}
+        mitigations = {}
+        for i, name in enumerate(faults):
+            if s['fault_severity'][i] != NO_SEVERITY:
+                faults_detailed[name] = {'severity': int(s['fault_severity'][i]),
+                                         'description': self.string(s['fault_desc'][i]),
+                                         'triggers': self.strings(self._slice(s['trigger_start'], s['triggers'], i))}
+            fault_mitigations = self._slice(s['fault_mit_start'], s['fault_mit'], i).tolist()
+            if fault_mitigations:
+                mitigations[name] = {'mitigations': [mitigation_names[m] for m in fault_mitigations],
+                                     'operating_modes': self.strings(self._slice(s['fault_mode_start'], s['fault_modes'], i))}
+        profile_table = self.profile_table()
+        device_profiles = {device: profile_table['profiles'][p] for device, p in
+                           zip(self.strings(s['device_ids']), s['device_profile'].tolist())}
+        return {'fault_rules': self.fault_rules(), 'faults_detailed': faults_detailed, 'mitigations': mitigations,
+                'limit_table': self.limit_table(), 'profile_table': profile_table,
+                'default_profile': profile_table['profiles'][int(s['default_profile'][0])],
+                'device_profiles': device_profiles, 'metadata': {'version': self.version, 'source': self.path}}
+
+
+def load_artifact(path, expected_version=None):
+    """Map and validate an artifact, raises ArtifactError instead of returning a stale or damaged graph"""
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"Cannot map {path}: {e}") from e
+
+    if len(buffer) < HEADER.size:
+        raise ArtifactError(f"{path} is truncated")
+    magic, version, count, signature, crc, size, digest = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ArtifactError(f"{path} is not a knowledge graph artifact")
+    if version != FORMAT_VERSION:
+        raise ArtifactError(f"{path} has format version {version}, this build reads {FORMAT_VERSION}")
+    if signature != ENGINE_SIGNATURE:
+        raise ArtifactError(f"{path} was compiled for a different fault engine, rebuild it")
+    if size != len(buffer):
+        raise ArtifactError(f"{path} is {len(buffer)} bytes, header says {size}")
+    if zlib.crc32(memoryview(buffer)[HEADER.size:]) != crc:
+        raise ArtifactError(f"{path} failed its checksum")
+    if expected_version is not None and digest.hex() != expected_version:
+        raise ArtifactError(f"{path} holds graph version {digest.hex()}, expected {expected_version}")
+
+    sections = {}
+    for i in range(count):
+        name, dtype_code, ndim, offset, rows, cols = SECTION.unpack_from(buffer, HEADER.size + i * SECTION.size)
+        shape = (rows, cols)[:ndim]
+        count_items = rows * cols if ndim == 2 else rows
+        if count_items:
+            array = np.frombuffer(buffer, dtype=DTYPES[dtype_code], count=count_items, offset=offset).reshape(shape)
+        else:
+            array = np.zeros(shape, dtype=DTYPES[dtype_code])
+        sections[name.rstrip(b'\0').decode('ascii')] = array
+    return KGArtifact(buffer, sections, digest.hex(), path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python kg_artifact.py knowledge_graph.kgb")
+        sys.exit(1)
+    started = time.perf_counter()
+    artifact = load_artifact(sys.argv[1])
+    loaded = time.perf_counter() - started
+    table = artifact.limit_table()
+    print(f"{sys.argv[1]}: format {FORMAT_VERSION}, graph version {artifact.version}, "
+          f"{os.path.getsize(sys.argv[1])} bytes")
+    print(f"  {len(artifact['faults'])} faults, {len(artifact['rule_fault'])} rules, "
+          f"{len(artifact['mitigations'])} mitigations, {len(artifact['string_offsets']) - 1} strings")
+    print(f"  limit table {table['values'].shape[0]} SoC rows x {len(table['limit_types'])} limits "
+          f"({table['soc_step']:g}% steps), profiles {', '.join(artifact.strings(artifact['profiles']))}")
+    print(f"  mapped and verified in {loaded * 1000:.3f} ms")
@@ -0,0 +1,204 @@
+# KG ONTOLOGY - THE BATTERY KNOWLEDGE GRAPH AS PLAIN DATA
+# parameters, per-SoC and fixed limits, faults with severities, the rule table and mitigations.
+# knowledge_graph_Neo4j.py loads these rows into Neo4j with batched UNWIND statements, so changing the
+# ontology means editing this file and re-running the builder (which only writes the difference)
+
+import hashlib
+import json
+
+PARAMETERS = ['Impedance', 'Voltage', 'IntTemp', 'SurfaceTemp', 'Capacity', 'Voltage_RoC']
+SOC_LEVELS = [0, 20, 40, 60, 80, 100]
+OPERATING_MODES = ['Charging', 'Discharging']
+
+# Fault categories from the first version of the graph, kept as Fault nodes without a severity
+FAULT_CATEGORIES = ['Overvoltage', 'Voltage_Drop']
+
+# PARAMETER LIMITS
+# SoC-dependent limits: parameter -> {limit type: [value at each SOC_LEVELS entry]}
+SOC_LIMITS = {
+    'Voltage': {
+        'Volt_lower_Limit': [3.0, 3.3, 3.6, 3.8, 4.0, 4.1],
+        'Volt_upper_Limit': [3.3, 3.6, 3.8, 4.0, 4.1, 4.2],
+    },
+    'Impedance': {
+        'Impedance_lower_Limit': [0.0, 0.02, 0.03, 0.035, 0.04, 0.045],
+        'Impedance_upper_Limit': [0.02, 0.03, 0.035, 0.04, 0.045, 0.05],
+    },
+    'Voltage_RoC': {
+        'Rate_of_Change_Upper_Limit': [0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
+    },
+}
+
+# Limits that do not depend on SoC: (parameter, limit type, value)
+FIXED_LIMITS = [
+    ('IntTemp', 'Temperature_Upper_Limit', 58),
+    ('IntTemp', 'Temperature_Runaway_Limit', 60),
+    ('SurfaceTemp', 'Surface_Temperature_Upper_Limit', 55),
+    ('SurfaceTemp', 'Surface_Temperature_Runaway_Limit', 55),
+    ('Capacity', 'Capacity_Lower_Limit', 0.8),
+]
+
+# FAULTS WITH SEVERITY LEVELS
+# SEVERITY NOTES: Lower number = higher priority. User safety is prioritized over equipment damage.
+# 1-3: Immediate danger to user, 4-6: Electrical hazards, 7-8: Property damage, 9-10: Performance issues
+# fault, severity, TRIGGERED_BY limit types, ASSOCIATED_WITH limit types
+FAULTS = [
+    ('Thermal_Runaway', 1, ['Temperature_Upper_Limit', 'Surface_Temperature_Upper_Limit'], ['Impedance_upper_Limit']),
+    ('Overvoltage_V_Imp', 4, ['Volt_upper_Limit', 'Impedance_upper_Limit'], []),
+    ('Overvoltage_V_Only', 5, ['Volt_upper_Limit'], []),
+    ('Sudden_Voltage_Drop', 6, ['Rate_of_Change_Upper_Limit'], []),
+    ('Sudden_Voltage_Increase', 6, ['Rate_of_Change_Upper_Limit'], []),
+    ('Deep_Voltage_Drop', 7, ['Volt_lower_Limit'], []),
+    ('Battery_Aging', 8, ['Capacity_Lower_Limit'], ['Impedance_upper_Limit', 'Temperature_Upper_Limit']),
+    ('Battery_Aging_All', 8, ['Impedance_upper_Limit', 'Temperature_Upper_Limit', 'Surface_Temperature_Upper_Limit',
+                              'Capacity_Lower_Limit'], []),
+    ('Undervolt_V_Only', 9, ['Volt_lower_Limit'], []),
+    ('Battery_Aging_Impedance', 10, ['Impedance_upper_Limit'], []),
+    ('Battery_Aging_IntTemp', 10, ['Temperature_Upper_Limit'], []),
+    ('Battery_Aging_SurfTemp', 10, ['Surface_Temperature_Upper_Limit'], []),
+    ('Battery_Aging_Capacity', 10, ['Capacity_Lower_Limit'], []),
+]
+
+# FAULT DETECTION RULES
+# Declarative rule table, compiled by fault_engine.py in the ingestion script. Each condition reads:
+# parameter <comparator> limit * scale + offset, with 'default' standing in for an undefined limit
+# (NaN = condition is false). A rule fires when all / any / at least min_count conditions hold.
+# Rules are listed in detection order, which also breaks ties between equal severities.
+INF = float('inf')
+NO_DEFAULT = float('nan')
+
+FAULT_RULES = [
+    # fault, logic, min_count, operating modes, conditions (parameter, comparator, limit, scale, offset, default)
+    ('Overvoltage_Charging', 'all', 1, ['Charging'], [
+        ('Voltage', '>', 'Volt_upper_Limit', 1.0, 0.0, 4.2)]),
+    ('Sudden_Voltage_Drop', 'all', 1, [], [
+        ('Voltage_RoC', '<', 'Rate_of_Change_Upper_Limit', -1.0, 0.0, NO_DEFAULT)]),
+    ('Deep_Voltage_Drop', 'all', 1, [], [
+        ('Voltage', '<', 'Volt_lower_Limit', 1.0, -0.5, NO_DEFAULT)]),
+    ('Undervolt_V_Only', 'all', 2, [], [
+        ('Voltage', '<', 'Volt_lower_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('Impedance', '<=', 'Impedance_upper_Limit', 1.0, 0.0, INF)]),
+    ('Battery_Aging', 'all', 2, [], [
+        ('Voltage', '<', 'Volt_lower_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('Impedance', '>', 'Impedance_upper_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Sudden_Voltage_Increase', 'all', 1, [], [
+        ('Voltage_RoC', '>', 'Rate_of_Change_Upper_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Overvoltage_V_Only', 'all', 2, [], [
+        ('Voltage', '>', 'Volt_upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('Impedance', '<=', 'Impedance_upper_Limit', 1.0, 0.0, INF)]),
+    ('Overvoltage_V_Imp', 'all', 2, [], [
+        ('Voltage', '>', 'Volt_upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('Impedance', '>', 'Impedance_upper_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Battery_Aging_Impedance', 'all', 3, [], [
+        ('Impedance', '>', 'Impedance_upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('Voltage', '>=', 'Volt_lower_Limit', 1.0, 0.0, 0.0),
+        ('Voltage', '<=', 'Volt_upper_Limit', 1.0, 0.0, INF)]),
+    ('Thermal_Runaway', 'all', 2, [], [
+        ('IntTemp', '>', 'Temperature_Upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('IntTemp', '>', 'Temperature_Runaway_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Battery_Aging_IntTemp', 'all', 2, [], [
+        ('IntTemp', '>', 'Temperature_Upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('IntTemp', '<=', 'Temperature_Runaway_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Thermal_Runaway', 'all', 2, [], [
+        ('SurfaceTemp', '>', 'Surface_Temperature_Upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('SurfaceTemp', '>', 'Surface_Temperature_Runaway_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Battery_Aging_SurfTemp', 'all', 2, [], [
+        ('SurfaceTemp', '>', 'Surface_Temperature_Upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('SurfaceTemp', '<=', 'Surface_Temperature_Runaway_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Battery_Aging_Capacity', 'all', 1, [], [
+        ('Capacity', '<', 'Capacity_Lower_Limit', 1.0, 0.0, NO_DEFAULT)]),
+    ('Battery_Aging_All', 'at_least', 3, [], [
+        ('Impedance', '>', 'Impedance_upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('IntTemp', '>', 'Temperature_Upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('SurfaceTemp', '>', 'Surface_Temperature_Upper_Limit', 1.0, 0.0, NO_DEFAULT),
+        ('Capacity', '<', 'Capacity_Lower_Limit', 1.0, 0.0, NO_DEFAULT)])
+]
+
+# FAULT RESPONSES
+# fault -> (MITIGATED_BY mitigations, RECOVERY_ACTION mitigations)
+FAULT_MITIGATIONS = {
+    'Thermal_Runaway': (['Immediate_Shutdown'], ['Evacuation_Warning']),
+    'Overvoltage_V_Imp': (['Stop_Charging'], ['Resume_Reduced_Charging']),
+    'Overvoltage_V_Only': (['Stop_Charging'], ['Resume_Reduced_Charging']),
+    'Sudden_Voltage_Drop': (['Reduce_Load'], []),
+    'Deep_Voltage_Drop': (['Reduce_Load'], []),
+    'Undervolt_V_Only': (['Reduce_Load'], []),
+    'Battery_Aging': (['Reduce_Charging_Power'], ['Recommend_Replacement']),
+    'Battery_Aging_All': (['Reduce_Charging_Power'], ['Recommend_Replacement']),
+    'Battery_Aging_Impedance': (['Increase_Monitoring_Frequency'], ['Alert_User']),
+    'Battery_Aging_IntTemp': (['Increase_Monitoring_Frequency'], ['Alert_User']),
+    'Battery_Aging_SurfTemp': (['Increase_Monitoring_Frequency'], ['Alert_User']),
+    'Battery_Aging_Capacity': (['Increase_Monitoring_Frequency'], ['Alert_User']),
+}
+
+# mitigation -> operating modes it applies in (APPLICABLE_IN), empty = not tied to a mode
+MITIGATION_MODES = {
+    'Immediate_Shutdown': ['Charging', 'Discharging'],
+    'Evacuation_Warning': ['Charging', 'Discharging'],
+    'Stop_Charging': ['Charging'],
+    'Resume_Reduced_Charging': ['Charging'],
+    'Reduce_Load': ['Discharging'],
+    'Reduce_Charging_Power': ['Charging'],
+    'Recommend_Replacement': ['Charging'],
+    'Increase_Monitoring_Frequency': [],
+    'Alert_User': [],
+}
+
+
+def limit_rows():
+    """One row per Limit node: {'parameter', 'type', 'value', 'soc'} (soc None for fixed limits)"""
+    rows = []
+    for parameter, limits in SOC_LIMITS.items():
+        for limit_type, values in limits.items():
+            for soc, value in zip(SOC_LEVELS, values):
+                rows.append({'parameter': parameter, 'type': limit_type, 'value': value, 'soc': soc})
+    for parameter, limit_type, value in FIXED_LIMITS:
+        rows.append({'parameter': parameter, 'type': limit_type, 'value': value, 'soc': None})
+    return rows
+
+
+def rule_rows():
+    """One row per Rule node, conditions stored as parallel list properties"""
+    rules = []
+    for rule_id, (fault, logic, min_count, modes, conditions) in enumerate(FAULT_RULES):
+        rules.append({
+            'id': rule_id, 'fault': fault, 'logic': logic, 'min_count': min_count, 'operating_modes': modes,
+            'parameters': [c[0] for c in conditions],
+            'comparators': [c[1] for c in conditions],
+            'limits': [c[2] for c in conditions],
+            'scales': [c[3] for c in conditions],
+            'offsets': [c[4] for c in conditions],
+            'defaults': [c[5] for c in conditions]
+        })
+    return rules
+
+
+def ontology_rows():
+    """Every node and relationship of the graph as lists of UNWIND rows"""
+    faults = [{'name': name, 'severity': None} for name in FAULT_CATEGORIES]
+    faults += [{'name': name, 'severity': severity} for name, severity, _, _ in FAULTS]
+    return {
+        'parameters': [{'name': name} for name in PARAMETERS],
+        'soc_levels': [{'level': level} for level in SOC_LEVELS],
+        'operating_modes': [{'name': name} for name in OPERATING_MODES],
+        'faults': faults,
+        'mitigations': [{'name': name} for name in MITIGATION_MODES],
+        'limits': limit_rows(),
+        'triggered_by': [{'fault': name, 'limit_type': limit_type}
+                         for name, _, triggers, _ in FAULTS for limit_type in triggers],
+        'associated_with': [{'fault': name, 'limit_type': limit_type}
+                            for name, _, _, associated in FAULTS for limit_type in associated],
+        'rules': rule_rows(),
+        'mitigated_by': [{'fault': fault, 'mitigation': mitigation}
+                         for fault, (first, _) in FAULT_MITIGATIONS.items() for mitigation in first],
+        'recovery_actions': [{'fault': fault, 'mitigation': mitigation}
+                             for fault, (_, recovery) in FAULT_MITIGATIONS.items() for mitigation in recovery],
+        'applicable_in': [{'mitigation': mitigation, 'mode': mode}
+                          for mitigation, modes in MITIGATION_MODES.items() for mode in modes],
+    }
+
+
+def ontology_hash(rows=None):
+    """SHA-256 of the ontology rows, stored on the GraphVersion node to skip rebuilding an unchanged graph"""
+    rows = ontology_rows() if rows is None else rows
+    return hashlib.sha256(json.dumps(rows, sort_keys=True).encode()).hexdigest()
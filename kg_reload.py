@@ -0,0 +1,166 @@
+# KG RELOAD - SWAP IN A REBUILT KNOWLEDGE GRAPH WITHOUT RESTARTING THE MONITOR
+# a KnowledgeBase bundles everything evaluation needs (compiled rules, limit and threshold tables,
+# severities, mitigations) and is never modified after construction. The watcher thread notices a new
+# knowledge_graph.kgb (or .pkl), builds the next KnowledgeBase off the hot path and hands it over;
+# the monitor replaces one reference, so a reading that already picked up the old one finishes with it
+# (read-copy-update: readers take no locks and never see half of an update)
+
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from fault_engine import compile_rules, build_soc_limit_table, build_profile_limit_tables, limit_columns, temp_row
+from kg_artifact import load_artifact, ArtifactError
+from trend_window import trend_features
+from fault_debounce import DebouncePolicy
+from mitigation_plan import MitigationPlanner, pickle_fault_mitigations
+from ingest_queue import PreScreen
+
+RELOAD_POLL_INTERVAL = 2.0  # seconds between file checks
+
+
+class KnowledgeBase:
+    """Immutable evaluation state built from one version of the knowledge graph"""
+
+    def __init__(self, kg_data, version, source=None):
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+        self.kg_data = kg_data
+
+        # Older pickles carry no limit table, interpolate one here instead
+        self.limit_table = kg_data.get('limit_table') or build_soc_limit_table(kg_data)
+        self.fault_rules = compile_rules(kg_data)
+        # rule parameters computed from each device's trend window (IntTemp_Slope, ...)
+        self.trend_features = trend_features(self.fault_rules.parameters)
+
+        # Limit profiles: one threshold table per profile, a device's profile ID picks the table
+        self.profile_table = kg_data.get('profile_table') or build_profile_limit_tables(kg_data, self.limit_table['soc_step'])
+        self.profiles = list(self.profile_table['profiles'])
+        self.default_profile_id = self.profiles.index(kg_data.get('default_profile', self.profiles[0]))
+        self.device_profile_ids = {device: self.profiles.index(profile)
+                                   for device, profile in kg_data.get('device_profiles', {}).items()}
+        self.soc_limit_tables = limit_columns(self.profile_table, self.fault_rules.limit_names)
+        self.threshold_tables = [self.fault_rules.thresholds(table).tolist() for table in self.soc_limit_tables]
+
+        # SoC x temperature grids: the leaves they cover are overwritten from the grid at the reading's temperature
+        self.temperature_leaves, self.temperature_tables = [], None
+        grid = self.profile_table.get('temperature')
+        if grid is not None:
+            self.temperature_leaves, self.temperature_tables = self.fault_rules.grid_thresholds(grid)
+        if self.temperature_leaves:
+            self.temp_min, self.temp_step = grid['temp_min'], grid['temp_step']
+            self.temp_rows = self.temperature_tables.shape[2]
+            # flat float view: one reading reads its few grid thresholds as plain floats, no NumPy calls
+            self._grid = memoryview(np.ascontiguousarray(self.temperature_tables).ravel())
+            self._grid_leaves = list(enumerate(self.temperature_leaves))
+
+        # Default profile, for callers that evaluate a single-chemistry fleet
+        self.soc_limits = self.soc_limit_tables[self.default_profile_id]
+        self.threshold_table = self.threshold_tables[self.default_profile_id]
+
+        self.severities = {fault: detail['severity'] for fault, detail in kg_data['faults_detailed'].items()}
+        self.mitigations = {fault: entry['mitigations'] for fault, entry in kg_data.get('mitigations', {}).items()}
+        self.debounce = DebouncePolicy(self.fault_rules, self.severities)
+        self.planner = MitigationPlanner(self.fault_rules, pickle_fault_mitigations(kg_data.get('mitigations', {})))
+        # the ingest queue's pre-screen, built with the tables above
+        self.prescreen = PreScreen(self)
+
+    def thresholds(self, profile, soc_level, temperature):
+        """Threshold row for one reading: the profile's SoC row, temperature-dependent leaves from the grid.
+        Both are precomputed, a reading costs index lookups only."""
+        row = self.threshold_tables[profile][soc_level]
+        if not self.temperature_leaves:
+            return row
+        row = row.copy()
+        grid, leaves = self._grid, self._grid_leaves
+        start = ((profile * len(self.threshold_tables[profile]) + soc_level) * self.temp_rows
+                 + temp_row(temperature, self.temp_min, self.temp_step, self.temp_rows)) * len(leaves)
+        for j, leaf in leaves:
+            row[leaf] = grid[start + j]
+        return row
+
+    def profile_id(self, device_id):
+        """Limit profile ID of a device (one dict lookup), the default profile for unmapped devices"""
+        return self.device_profile_ids.get(device_id, self.default_profile_id)
+
+
+def load_knowledge_base(artifact_path, pickle_path):
+    """KnowledgeBase from the compiled artifact, or from the pickle when there is no artifact.
+
+    Raises ArtifactError for a damaged or incompatible artifact (never silently falls back).
+    """
+    if os.path.exists(artifact_path):
+        artifact = load_artifact(artifact_path)
+        return KnowledgeBase(artifact.to_kg_data(), artifact.version, artifact_path)
+    with open(pickle_path, 'rb') as f:
+        kg_data = pickle.load(f)
+    # pickles carry no content hash, every build gets its own timestamp
+    return KnowledgeBase(kg_data, kg_data.get('metadata', {}).get('build_timestamp'), pickle_path)
+
+
+def file_signature(path):
+    """(inode, size, mtime) - changes when a builder replaces or rewrites the file, None when missing"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class KnowledgeBaseWatcher:
+    """Background thread polling the KG files and calling on_reload(new KnowledgeBase) after a change.
+
+    A file that fails to load (half-written pickle, rejected artifact) is reported through on_error
+    and retried at the next change; the current KnowledgeBase stays in service meanwhile.
+    """
+
+    def __init__(self, artifact_path, pickle_path, current, on_reload, on_error=None,
+                 poll_interval=RELOAD_POLL_INTERVAL):
+        self.artifact_path = artifact_path
+        self.pickle_path = pickle_path
+        self.current_version = current.version
+        self.on_reload = on_reload
+        self.on_error = on_error
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self._signature = self._signatures()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _signatures(self):
+        return file_signature(self.artifact_path), file_signature(self.pickle_path)
+
+    def check(self):
+        """Reload if the files changed since the last check, returns the new KnowledgeBase or None"""
+        signature = self._signatures()
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        try:
+            knowledge = load_knowledge_base(self.artifact_path, self.pickle_path)
+        except (ArtifactError, OSError, pickle.UnpicklingError, EOFError, KeyError, ValueError) as e:
+            if self.on_error is not None:
+                self.on_error(e)
+            return None
+        if knowledge.version == self.current_version:
+            return None  # rewritten with identical content
+        self.current_version = knowledge.version
+        self.reloads += 1
+        self.on_reload(knowledge)
+        return knowledge
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='kg-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -11,6 +11,9 @@ from datetime import datetime
 import pandas as pd
 import pickle
 import json
+import numpy as np
+from fault_engine import build_soc_limit_table, build_profile_limit_tables
+from kg_artifact import write_artifact
 
 # BUILD KNOWLEDGE GRAPH 
 print("Building knowledge graph...")
@@ -72,11 +75,100 @@ def add_parameter_limits(kg_data):
                 {'soc': 100, 'imp_min': 0.045, 'imp_max': 0.05}
             ]
         },
-        'IntTemp': {'max': 58},
-        'SurfaceTemp': {'max': 55},
+        'IntTemp': {'max': 58, 'runaway': 60},
+        'SurfaceTemp': {'max': 55, 'runaway': 55},
         'Capacity': {'min': 0.8},
-        'Voltage_RoC': {'max': 0.1}
+        'Voltage_RoC': {'max': 0.1},
+        # Trend limits, per second over the device's trend window (trend_window.py)
+        'IntTemp_Slope': {'max': 0.1},
+        # 2e-5 ohm/s = 1.2 mohm/min: SoC alone moves impedance by at most ~1e-5 ohm/s at 0.5 C
+        'Impedance_Slope': {'max': 2e-5}
     }
+    
+    # Limit type names (same as the Limit nodes in Neo4j) and where each value lives above
+    kg_data['limit_types'] = {
+        'Volt_lower_Limit': {'parameter': 'Voltage', 'key': 'v_min'},
+        'Volt_upper_Limit': {'parameter': 'Voltage', 'key': 'v_max'},
+        'Impedance_lower_Limit': {'parameter': 'Impedance', 'key': 'imp_min'},
+        'Impedance_upper_Limit': {'parameter': 'Impedance', 'key': 'imp_max'},
+        'Rate_of_Change_Upper_Limit': {'parameter': 'Voltage_RoC', 'key': 'max'},
+        'Temperature_Upper_Limit': {'parameter': 'IntTemp', 'key': 'max'},
+        'Temperature_Runaway_Limit': {'parameter': 'IntTemp', 'key': 'runaway'},
+        'Surface_Temperature_Upper_Limit': {'parameter': 'SurfaceTemp', 'key': 'max'},
+        'Surface_Temperature_Runaway_Limit': {'parameter': 'SurfaceTemp', 'key': 'runaway'},
+        'Capacity_Lower_Limit': {'parameter': 'Capacity', 'key': 'min'},
+        'Thermal_Ramp_Limit': {'parameter': 'IntTemp_Slope', 'key': 'max'},
+        'Impedance_Trend_Limit': {'parameter': 'Impedance_Slope', 'key': 'max'}
+    }
+    return kg_data
+
+# ADD LIMIT PROFILES
+# One set of limits per cell chemistry / pack build. Voltage limits are per cell and multiplied by
+# cells_in_series. The curves above are the NMC profile; devices not listed in DEVICE_PROFILES use
+# DEFAULT_PROFILE.
+DEFAULT_PROFILE = 'NMC'
+DEVICE_PROFILES = {
+    # 'pack-lfp-01': 'LFP',
+    # 'ess-rack-03': 'LFP_4S',
+}
+
+LFP_LIMITS = {
+    'Voltage': {
+        'limits_per_soc': [
+            {'soc': 0, 'v_min': 2.5, 'v_max': 2.9},
+            {'soc': 20, 'v_min': 3.1, 'v_max': 3.25},
+            {'soc': 40, 'v_min': 3.2, 'v_max': 3.3},
+            {'soc': 60, 'v_min': 3.25, 'v_max': 3.32},
+            {'soc': 80, 'v_min': 3.28, 'v_max': 3.35},
+            {'soc': 100, 'v_min': 3.35, 'v_max': 3.65}
+        ]
+    },
+    'Impedance': {
+        'limits_per_soc': [
+            {'soc': 0, 'imp_min': 0.0, 'imp_max': 0.025},
+            {'soc': 20, 'imp_min': 0.02, 'imp_max': 0.032},
+            {'soc': 40, 'imp_min': 0.025, 'imp_max': 0.035},
+            {'soc': 60, 'imp_min': 0.028, 'imp_max': 0.038},
+            {'soc': 80, 'imp_min': 0.03, 'imp_max': 0.04},
+            {'soc': 100, 'imp_min': 0.032, 'imp_max': 0.045}
+        ]
+    },
+    'IntTemp': {'max': 60, 'runaway': 65},
+    'SurfaceTemp': {'max': 57, 'runaway': 60},
+    'Capacity': {'min': 0.8},
+    'Voltage_RoC': {'max': 0.08},
+    'IntTemp_Slope': {'max': 0.1},
+    'Impedance_Slope': {'max': 2e-5}
+}
+
+# ADD TEMPERATURE LIMITS
+# Cell impedance rises steeply in the cold, so the impedance limits are also given on a SoC x temperature
+# grid: the SoC curves above hold at 25 C and are multiplied by the factor of each temperature. Above 25 C
+# they stay as they are: a warm cell's lower impedance must not tighten the limits of normal 30-40 C
+# operation. The Pi looks the limits up in a dense grid interpolated bilinearly between these points.
+IMPEDANCE_TEMPERATURE_FACTORS = {-20: 3.0, -10: 2.2, 0: 1.6, 10: 1.25, 25: 1.0, 40: 1.0, 60: 1.0}
+
+def temperature_grid(limits_per_soc, factors, keys):
+    return [dict({'soc': item['soc'], 'temp': temp}, **{key: item[key] * factor for key in keys})
+            for item in limits_per_soc for temp, factor in factors.items()]
+
+def add_temperature_limits(kg_data):
+    for limits in (kg_data['parameter_limits'], LFP_LIMITS):
+        impedance = limits['Impedance']
+        impedance['limits_per_soc_temp'] = temperature_grid(impedance['limits_per_soc'], IMPEDANCE_TEMPERATURE_FACTORS,
+                                                            ('imp_min', 'imp_max'))
+    return kg_data
+
+def add_limit_profiles(kg_data):
+    kg_data['limit_profiles'] = {
+        'NMC': {'chemistry': 'NMC', 'cells_in_series': 1, 'parameter_limits': kg_data['parameter_limits']},
+        'LFP': {'chemistry': 'LFP', 'cells_in_series': 1, 'parameter_limits': LFP_LIMITS},
+        'LFP_4S': {'chemistry': 'LFP', 'cells_in_series': 4, 'parameter_limits': LFP_LIMITS},
+    }
+    kg_data['default_profile'] = DEFAULT_PROFILE
+    kg_data['device_profiles'] = dict(DEVICE_PROFILES)
+    # every profile's limit table, stacked and indexed by profile ID (position in limit_profiles)
+    kg_data['profile_table'] = build_profile_limit_tables(kg_data, soc_step=0.1)
     return kg_data
 
 # ADD FAULTS WITH SEVERITY LEVELS
@@ -90,6 +182,11 @@ def add_faults(kg_data):
             'description': 'Fire/explosion risk requires immediate evacuation',
             'triggers': ['IntTemp', 'SurfaceTemp', 'Impedance']
         },
+        'Thermal_Ramp': {
+            'severity': 3,
+            'description': 'Internal temperature climbing steadily towards thermal runaway',
+            'triggers': ['IntTemp_Slope', 'IntTemp']
+        },
         
         # HIGH RISK FAULTS (Severity 4-6) - Electrical hazards that could cause injury
         'Overvoltage_V_Imp': {
@@ -155,10 +252,102 @@ def add_faults(kg_data):
             'severity': 8,
             'description': 'Multiple degradation indicators',
             'triggers': ['Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity']
+        },
+        'Impedance_Rising_Trend': {
+            'severity': 9,
+            'description': 'Impedance rising steadily, early sign of degradation',
+            'triggers': ['Impedance_Slope']
         }
     }
     return kg_data
 
+# ADD FAULT DETECTION RULES
+# Declarative rule table compiled by fault_engine.py at load time. Each condition compares a reading
+# parameter against a limit type: value <comparator> limit * scale + offset. 'default' replaces a limit
+# that is not defined (no default = condition is false). A rule fires when all / any / at least
+# min_count of its conditions hold; a fault with several rules fires when any of them does.
+# Rules are listed in detection order, which also breaks ties between equal severities.
+def add_fault_rules(kg_data):
+    kg_data['fault_rules'] = [
+        # Overcharge check while charging (no severity, reported only in the fault list)
+        {'fault': 'Overvoltage_Charging', 'logic': 'all', 'operating_modes': ['Charging'], 'conditions': [
+            {'parameter': 'Voltage', 'comparator': '>', 'limit': 'Volt_upper_Limit', 'default': 4.2}]},
+        
+        # 1. Sudden Voltage Drop: falling faster than the rate of change limit
+        {'fault': 'Sudden_Voltage_Drop', 'logic': 'all', 'conditions': [
+            {'parameter': 'Voltage_RoC', 'comparator': '<', 'limit': 'Rate_of_Change_Upper_Limit', 'scale': -1.0}]},
+        
+        # 2. Deep Voltage Drop: 0.5V below the lower voltage limit
+        {'fault': 'Deep_Voltage_Drop', 'logic': 'all', 'conditions': [
+            {'parameter': 'Voltage', 'comparator': '<', 'limit': 'Volt_lower_Limit', 'offset': -0.5}]},
+        
+        # 3. Undervolt [V only]
+        {'fault': 'Undervolt_V_Only', 'logic': 'all', 'conditions': [
+            {'parameter': 'Voltage', 'comparator': '<', 'limit': 'Volt_lower_Limit'},
+            {'parameter': 'Impedance', 'comparator': '<=', 'limit': 'Impedance_upper_Limit', 'default': float('inf')}]},
+        
+        # 4. Undervolt [V and Imp] -> Battery Aging
+        {'fault': 'Battery_Aging', 'logic': 'all', 'conditions': [
+            {'parameter': 'Voltage', 'comparator': '<', 'limit': 'Volt_lower_Limit'},
+            {'parameter': 'Impedance', 'comparator': '>', 'limit': 'Impedance_upper_Limit'}]},
+        
+        # 5. Sudden Voltage Increase
+        {'fault': 'Sudden_Voltage_Increase', 'logic': 'all', 'conditions': [
+            {'parameter': 'Voltage_RoC', 'comparator': '>', 'limit': 'Rate_of_Change_Upper_Limit'}]},
+        
+        # 6. Overvoltage [V only]
+        {'fault': 'Overvoltage_V_Only', 'logic': 'all', 'conditions': [
+            {'parameter': 'Voltage', 'comparator': '>', 'limit': 'Volt_upper_Limit'},
+            {'parameter': 'Impedance', 'comparator': '<=', 'limit': 'Impedance_upper_Limit', 'default': float('inf')}]},
+        
+        # 7. Overvoltage [V & Imp]
+        {'fault': 'Overvoltage_V_Imp', 'logic': 'all', 'conditions': [
+            {'parameter': 'Voltage', 'comparator': '>', 'limit': 'Volt_upper_Limit'},
+            {'parameter': 'Impedance', 'comparator': '>', 'limit': 'Impedance_upper_Limit'}]},
+        
+        # 8. Battery Aging [Impedance] while voltage is inside its limits
+        {'fault': 'Battery_Aging_Impedance', 'logic': 'all', 'conditions': [
+            {'parameter': 'Impedance', 'comparator': '>', 'limit': 'Impedance_upper_Limit'},
+            {'parameter': 'Voltage', 'comparator': '>=', 'limit': 'Volt_lower_Limit', 'default': 0.0},
+            {'parameter': 'Voltage', 'comparator': '<=', 'limit': 'Volt_upper_Limit', 'default': float('inf')}]},
+        
+        # 9. Thermal Runaway [Int Temp] / Battery Aging [Int Temp]
+        {'fault': 'Thermal_Runaway', 'logic': 'all', 'conditions': [
+            {'parameter': 'IntTemp', 'comparator': '>', 'limit': 'Temperature_Upper_Limit'},
+            {'parameter': 'IntTemp', 'comparator': '>', 'limit': 'Temperature_Runaway_Limit'}]},
+        {'fault': 'Battery_Aging_IntTemp', 'logic': 'all', 'conditions': [
+            {'parameter': 'IntTemp', 'comparator': '>', 'limit': 'Temperature_Upper_Limit'},
+            {'parameter': 'IntTemp', 'comparator': '<=', 'limit': 'Temperature_Runaway_Limit'}]},
+        
+        # 10. Thermal Runaway [Surface Temp] / Battery Aging [Surface Temp]
+        {'fault': 'Thermal_Runaway', 'logic': 'all', 'conditions': [
+            {'parameter': 'SurfaceTemp', 'comparator': '>', 'limit': 'Surface_Temperature_Upper_Limit'},
+            {'parameter': 'SurfaceTemp', 'comparator': '>', 'limit': 'Surface_Temperature_Runaway_Limit'}]},
+        {'fault': 'Battery_Aging_SurfTemp', 'logic': 'all', 'conditions': [
+            {'parameter': 'SurfaceTemp', 'comparator': '>', 'limit': 'Surface_Temperature_Upper_Limit'},
+            {'parameter': 'SurfaceTemp', 'comparator': '<=', 'limit': 'Surface_Temperature_Runaway_Limit'}]},
+        
+        # 11. Battery Aging [Capacity]
+        {'fault': 'Battery_Aging_Capacity', 'logic': 'all', 'conditions': [
+            {'parameter': 'Capacity', 'comparator': '<', 'limit': 'Capacity_Lower_Limit'}]},
+        
+        # 12. Battery Aging [All] - at least 3 of 4 aging indicators
+        {'fault': 'Battery_Aging_All', 'logic': 'at_least', 'min_count': 3, 'conditions': [
+            {'parameter': 'Impedance', 'comparator': '>', 'limit': 'Impedance_upper_Limit'},
+            {'parameter': 'IntTemp', 'comparator': '>', 'limit': 'Temperature_Upper_Limit'},
+            {'parameter': 'SurfaceTemp', 'comparator': '>', 'limit': 'Surface_Temperature_Upper_Limit'},
+            {'parameter': 'Capacity', 'comparator': '<', 'limit': 'Capacity_Lower_Limit'}]},
+        
+        # 13. Trend faults - <parameter>_Slope is the least-squares slope over the device's trend window
+        # Thermal Ramp: heating faster than the ramp limit while still below the runaway limit
+        {'fault': 'Thermal_Ramp', 'logic': 'all', 'conditions': [
+            {'parameter': 'IntTemp_Slope', 'comparator': '>', 'limit': 'Thermal_Ramp_Limit'},
+            {'parameter': 'IntTemp', 'comparator': '<=', 'limit': 'Temperature_Runaway_Limit'}]},
+        {'fault': 'Impedance_Rising_Trend', 'logic': 'all', 'conditions': [
+            {'parameter': 'Impedance_Slope', 'comparator': '>', 'limit': 'Impedance_Trend_Limit'}]}
+    ]
+    return kg_data
+
 # ADD FAULT RESPONSES
 def add_mitigations(kg_data):
     kg_data['mitigations'] = {
@@ -196,15 +385,31 @@ def add_mitigations(kg_data):
             'mitigations': ['Increase_Monitoring_Frequency', 'Alert_User'],
             'operating_modes': ['All']},
         'Battery_Aging_Capacity': {
+            'mitigations': ['Increase_Monitoring_Frequency', 'Alert_User'],
+            'operating_modes': ['All']},
+        'Thermal_Ramp': {
+            'mitigations': ['Reduce_Charging_Power', 'Reduce_Load', 'Increase_Monitoring_Frequency'],
+            'operating_modes': ['Charging', 'Discharging']},
+        'Impedance_Rising_Trend': {
             'mitigations': ['Increase_Monitoring_Frequency', 'Alert_User'],
             'operating_modes': ['All']}
     }
     return kg_data
 
+# PRECOMPUTE SOC LIMIT TABLE
+# Every limit type interpolated over SoC 0-100 in 0.1% steps, so the Pi only indexes a row
+def add_limit_table(kg_data):
+    kg_data['limit_table'] = build_soc_limit_table(kg_data, soc_step=0.1)
+    return kg_data
+
 # BUILD THE COMPLETE KNOWLEDGE GRAPH
 kg_data = build_kg()
 kg_data = add_parameter_limits(kg_data)
+kg_data = add_limit_table(kg_data)
+kg_data = add_temperature_limits(kg_data)
+kg_data = add_limit_profiles(kg_data)
 kg_data = add_faults(kg_data)
+kg_data = add_fault_rules(kg_data)
 kg_data = add_mitigations(kg_data)
 
 # Add metadata
@@ -219,17 +424,29 @@ with open('knowledge_graph.pkl', 'wb') as f:
     pickle.dump(kg_data, f)
 print(Fore.GREEN + "Knowledge graph exported to knowledge_graph.pkl")
 
-# Also export to JSON for readability
+# Compiled artifact the Pi loads: checksummed, memory-mapped, no unpickling
+artifact_version = write_artifact('knowledge_graph.kgb', kg_data)
+print(Fore.GREEN + f"Knowledge graph compiled to knowledge_graph.kgb (version {artifact_version})")
+
+# Also export to JSON for readability (the stacked profile tables and grids only as a NumPy summary)
 with open('knowledge_graph.json', 'w') as f:
-    json.dump(kg_data, f, indent=2)
+    json.dump(kg_data, f, indent=2, default=lambda o: o.tolist() if isinstance(o, np.ndarray) and o.ndim <= 2 else str(o))
 print(Fore.GREEN + "Knowledge graph exported to knowledge_graph.json")
 
 # Print summary
 print(f"\nKnowledge Graph Summary:")
 print(f"Parameters: {len(kg_data['parameters'])}")
 print(f"SoC Levels: {len(kg_data['soc_levels'])}")
+print(f"Limit Table: {kg_data['limit_table']['values'].shape[0]} SoC rows x {len(kg_data['limit_table']['limit_types'])} limits")
+print(f"Limit Profiles: {', '.join(kg_data['limit_profiles'])} (default {kg_data['default_profile']}, "
+      f"{len(kg_data['device_profiles'])} devices mapped)")
+if 'temperature' in kg_data['profile_table']:
+    temperature = kg_data['profile_table']['temperature']
+    print(f"Temperature Grids: {', '.join(temperature['limit_types'])} "
+          f"({temperature['values'].shape[1]} SoC x {temperature['values'].shape[2]} temperature rows)")
 print(f"Fault Types: {len(kg_data['fault_types'])}")
 print(f"Detailed Faults: {len(kg_data['faults_detailed'])}")
+print(f"Fault Rules: {len(kg_data['fault_rules'])}")
 print(f"Mitigations: {len(kg_data['mitigations'])}")
 print(f"Built in {time.time() - start_time:.2f} seconds")
 
@@ -0,0 +1,135 @@
+# LATENCY - HDR-STYLE HISTOGRAMS FOR THE SENSOR -> DECISION PIPELINE
+# fixed log-linear buckets (every power of two split into equal sub-buckets), so recording is O(1)
+# with no allocation, memory is bounded and percentiles keep ~1% relative precision at any scale
+
+import threading
+import time
+
+PRECISION_BITS = 7        # 2^7 sub-buckets per power of two, ~1.6% worst-case relative error
+MAX_LATENCY_US = 60_000_000  # values above 60 s are clamped into the last bucket
+
+# Pipeline stages, in the order a reading passes through them
+STAGES = ('transit', 'parse', 'queue_urgent', 'queue_benign', 'evaluate', 'decide', 'end_to_end')
+STAGE_DESCRIPTIONS = {
+    'transit': "sensor send -> frame received (same-host senders only, monotonic clocks differ between machines)",
+    'parse': "frame received -> readings decoded (per frame)",
+    'queue_urgent': "wait in the ingest queue's urgent lane (readings that could fire a rule)",
+    'queue_benign': "wait in the ingest queue's benign lane",
+    'evaluate': "fault rules evaluated for one reading",
+    'decide': "highest priority fault and mitigations selected",
+    'end_to_end': "sensor send -> mitigation decision (same-host senders only)",
+}
+PERCENTILES = (('p50', 50.0), ('p99', 99.0), ('p999', 99.9))
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in microseconds"""
+
+    def __init__(self, max_value_us=MAX_LATENCY_US, precision_bits=PRECISION_BITS):
+        self.sub_buckets = 1 << precision_bits
+        self.half = self.sub_buckets >> 1
+        self.precision_bits = precision_bits
+        self.max_value_us = max_value_us
+        self.counts = [0] * (self._index(max_value_us) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def _index(self, value):
+        # values below sub_buckets are exact, above that each power of two gets `half` buckets
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.precision_bits
+        return self.sub_buckets + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def _bucket_value(self, index):
+        """Highest value that falls into bucket index"""
+        if index < self.sub_buckets:
+            return index
+        shift, offset = divmod(index - self.sub_buckets, self.half)
+        shift += 1
+        return ((offset + self.half + 1) << shift) - 1
+
+    def record(self, seconds):
+        """Record one latency given in seconds, negative values (clock mismatch) are ignored"""
+        if seconds < 0:
+            return
+        value = min(int(seconds * 1_000_000), self.max_value_us)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total_us += value
+        if self.min_us is None or value < self.min_us:
+            self.min_us = value
+        if value > self.max_us:
+            self.max_us = value
+
+    def percentile(self, q):
+        """Latency in microseconds at percentile q (0-100), 0 when empty"""
+        if not self.count:
+            return 0
+        target = max(1, -(-self.count * q // 100))  # ceil, rank of the requested sample
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._bucket_value(index), self.max_us)
+        return self.max_us
+
+    def snapshot(self):
+        """Summary in milliseconds: count, min, mean, p50, p99, p999, max"""
+        if not self.count:
+            return {'count': 0}
+        summary = {'count': self.count, 'min_ms': self.min_us / 1000, 'mean_ms': self.total_us / self.count / 1000}
+        for name, q in PERCENTILES:
+            summary[f"{name}_ms"] = self.percentile(q) / 1000
+        summary['max_ms'] = self.max_us / 1000
+        return summary
+
+
+class LatencyRecorder:
+    """One histogram per pipeline stage, shared by every connection.
+
+    record() is not locked: with several server threads an increment can very occasionally be lost,
+    which is acceptable for statistics and keeps the hot path lock-free. snapshot(reset=True) swaps
+    in fresh histograms under a lock so periodic dumps report one interval each.
+    """
+
+    def __init__(self, stages=STAGES):
+        self.stages = tuple(stages)
+        self._lock = threading.Lock()
+        self.histograms = {stage: LatencyHistogram() for stage in self.stages}
+        self.started_at = time.monotonic()
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+
+    def snapshot(self, reset=False):
+        """{'interval_s', 'stages': {stage: histogram summary}}"""
+        with self._lock:
+            histograms = self.histograms
+            now = time.monotonic()
+            interval = now - self.started_at
+            if reset:
+                self.histograms = {stage: LatencyHistogram() for stage in self.stages}
+                self.started_at = now
+        return {'interval_s': round(interval, 3),
+                'stages': {stage: histograms[stage].snapshot() for stage in self.stages}}
+
+
+def format_report(snapshot):
+    """Human-readable table of a LatencyRecorder snapshot"""
+    lines = [f"Latency over {snapshot['interval_s']:.1f}s (ms):",
+             f"  {'stage':<12} {'count':>8} {'p50':>9} {'p99':>9} {'p999':>9} {'max':>9}"]
+    for stage, summary in snapshot['stages'].items():
+        if summary['count']:
+            lines.append(f"  {stage:<12} {summary['count']:>8} {summary['p50_ms']:>9.3f} {summary['p99_ms']:>9.3f} "
+                         f"{summary['p999_ms']:>9.3f} {summary['max_ms']:>9.3f}")
+        else:
+            lines.append(f"  {stage:<12} {0:>8}")
+    return "\n".join(lines)
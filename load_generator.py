@@ -0,0 +1,200 @@
+# LOAD GENERATOR - SYNTHETIC BATTERY FLEET TELEMETRY FOR THE PI SERVER
+# simulates a fleet of cells (normal, aging, thermal runaway, voltage sag) and streams their
+# readings over persistent connections at a target rate, stamped with SentAt for the latency histograms.
+# Cells evolve in simulated seconds (the send time), not per reading, so SoC, aging and trend slopes look
+# the same to the monitor's time-based trend windows whatever the send rate.
+# python load_generator.py --host 127.0.0.1 --scenario mixed --devices 200 --rate 2000 --duration 30
+
+import argparse
+import asyncio
+import random
+import time
+from wire_protocol import encode_frame
+
+# Nominal curves inside the default knowledge graph limits (midpoints of the per-SoC bands)
+VOLTAGE_CURVE = [(0, 3.15), (20, 3.45), (40, 3.7), (60, 3.9), (80, 4.05), (100, 4.15)]
+IMPEDANCE_CURVE = [(0, 0.01), (20, 0.025), (40, 0.0325), (60, 0.0375), (80, 0.0425), (100, 0.0475)]
+
+SCENARIOS = ('normal', 'aging', 'thermal_runaway', 'voltage_sag')
+MIXED_WEIGHTS = {'normal': 0.85, 'aging': 0.05, 'thermal_runaway': 0.05, 'voltage_sag': 0.05}
+RAMP_SECONDS = 600.0  # seconds for aging / thermal runaway to fully develop
+C_RATE = 0.5  # charge / discharge current in C, i.e. SoC moves C_RATE * 100% per hour
+SOC_PER_SECOND = C_RATE * 100 / 3600
+
+
+def interpolate(curve, x):
+    """Piecewise linear lookup in a [(x, y), ...] curve, clamped at both ends"""
+    if x <= curve[0][0]:
+        return curve[0][1]
+    for (x0, y0), (x1, y1) in zip(curve, curve[1:]):
+        if x <= x1:
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return curve[-1][1]
+
+
+class BatteryModel:
+    """One simulated cell following a scenario, one reading per call to reading(now)"""
+
+    def __init__(self, device_id, scenario, rng):
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {scenario!r}, expected one of {SCENARIOS}")
+        self.device_id = device_id
+        self.scenario = scenario
+        self.rng = rng
+        self.started = None  # simulated time of the first reading
+        self.last_time = None
+        self.soc = rng.uniform(20, 80)
+        self.charging = rng.random() < 0.5
+        self.ambient = rng.uniform(22, 30)
+        self.capacity = rng.uniform(0.9, 0.98)
+        self.runaway_onset = rng.uniform(RAMP_SECONDS / 5, RAMP_SECONDS / 2)
+        self.sag_left = 0
+
+    def reading(self, now=None):
+        """The cell's reading at simulated time now (seconds, default time.monotonic())"""
+        rng = self.rng
+        now = time.monotonic() if now is None else now
+        if self.started is None:
+            self.started = self.last_time = now
+        elapsed = now - self.started
+        dt = max(now - self.last_time, 0.0)
+        self.last_time = now
+        progress = min(elapsed / RAMP_SECONDS, 1.0)
+
+        # Cycle between 15% and 95% SoC
+        self.soc += SOC_PER_SECOND * dt if self.charging else -SOC_PER_SECOND * dt
+        if self.soc >= 95 or self.soc <= 15:
+            self.charging = not self.charging
+
+        voltage = interpolate(VOLTAGE_CURVE, self.soc) + rng.gauss(0, 0.01)
+        impedance = interpolate(IMPEDANCE_CURVE, self.soc) * (1 + rng.gauss(0, 0.01))
+        int_temp = self.ambient + (8 if self.charging else 5) + rng.gauss(0, 0.5)
+        surface_temp = int_temp - 2 + rng.gauss(0, 0.3)
+        capacity = self.capacity
+
+        if self.scenario == 'aging':
+            # Capacity fade and impedance growth over the ramp
+            capacity = self.capacity - 0.25 * progress
+            impedance *= 1 + 0.6 * progress
+        elif self.scenario == 'thermal_runaway' and elapsed > self.runaway_onset:
+            # Exponential self-heating (doubling every 15 s), the surface lags the core, voltage collapses late
+            heating = min(2 ** ((elapsed - self.runaway_onset) / 15) - 1, 120)
+            int_temp += heating
+            surface_temp += heating * 0.8
+            if heating > 40:
+                voltage -= min((heating - 40) * 0.02, 1.5)
+        elif self.scenario == 'voltage_sag':
+            # Occasional load steps pull the terminal voltage down for a few readings
+            if self.sag_left == 0 and rng.random() < 0.02:
+                self.sag_left = rng.randint(2, 6)
+                self.sag_depth = rng.uniform(0.15, 0.6)
+            if self.sag_left:
+                self.sag_left -= 1
+                voltage -= self.sag_depth
+
+        return {
+            'DeviceID': self.device_id,
+            'Voltage': round(voltage, 4),
+            'Impedance': round(max(impedance, 0.0), 5),
+            'IntTemp': round(int_temp, 2),
+            'SurfaceTemp': round(surface_temp, 2),
+            'Capacity': round(capacity, 4),
+            'SoC': round(self.soc, 2),
+            'Status': 1 if self.charging else 0,
+        }
+
+
+def build_fleet(scenario, devices, seed=1):
+    """Battery models for a fleet; 'mixed' assigns scenarios by MIXED_WEIGHTS"""
+    rng = random.Random(seed)
+    fleet = []
+    for i in range(devices):
+        if scenario == 'mixed':
+            device_scenario = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+        else:
+            device_scenario = scenario
+        fleet.append(BatteryModel(f"{device_scenario}-{i:05d}", device_scenario, random.Random(rng.random())))
+    return fleet
+
+
+async def send_fleet(host, port, fleet, rate, duration, batch):
+    """Stream readings for part of a fleet over one connection, returns (frames, readings) sent.
+
+    rate is readings/s for this connection (0 sends as fast as the server accepts).
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    loop = asyncio.get_running_loop()
+    interval = batch / rate if rate > 0 else 0.0
+    started = next_send = loop.time()
+    frames = readings = 0
+    position = 0
+    try:
+        while loop.time() - started < duration:
+            frame = []
+            sent_at = time.monotonic()
+            for _ in range(batch):
+                frame.append(fleet[position].reading(sent_at))
+                position = (position + 1) % len(fleet)
+            for reading in frame:
+                reading['SentAt'] = sent_at
+            writer.write(encode_frame(frame))
+            await writer.drain()
+            frames += 1
+            readings += len(frame)
+
+            if interval:
+                next_send += interval
+                delay = next_send - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    await asyncio.sleep(0)
+                    if delay < -1.0:
+                        next_send = loop.time()  # more than a second behind, do not burst to catch up
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+    return frames, readings
+
+
+async def run_load(host, port, scenario='mixed', devices=100, rate=1000, duration=10.0, connections=4, batch=10,
+                   seed=1):
+    """Drive the server with a simulated fleet split across connections.
+
+    Returns {'frames', 'readings', 'seconds', 'send_rate'}.
+    """
+    fleet = build_fleet(scenario, devices, seed)
+    connections = max(1, min(connections, len(fleet)))
+    shares = [fleet[i::connections] for i in range(connections)]
+    started = time.monotonic()
+    results = await asyncio.gather(*(send_fleet(host, port, share, rate / connections, duration, batch)
+                                     for share in shares))
+    elapsed = time.monotonic() - started
+    frames = sum(result[0] for result in results)
+    readings = sum(result[1] for result in results)
+    return {'frames': frames, 'readings': readings, 'seconds': round(elapsed, 3),
+            'send_rate': round(readings / elapsed, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic battery fleet load generator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--scenario', default='mixed', choices=SCENARIOS + ('mixed',))
+    parser.add_argument('--devices', type=int, default=100, help="fleet size")
+    parser.add_argument('--rate', type=float, default=1000, help="total readings/s (0 = as fast as possible)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds to send for")
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=10, help="readings per frame")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"Sending {args.scenario} telemetry for {args.devices} devices to {args.host}:{args.port} "
+          f"at {args.rate:g} readings/s for {args.duration:g}s")
+    summary = asyncio.run(run_load(args.host, args.port, args.scenario, args.devices, args.rate, args.duration,
+                                   args.connections, args.batch, args.seed))
+    print(f"Sent {summary['readings']} readings in {summary['frames']} frames over {summary['seconds']}s "
+          f"({summary['send_rate']} readings/s)")
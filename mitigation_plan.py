@@ -0,0 +1,72 @@
+# MITIGATION PLAN - MERGED, DEDUPLICATED ACTIONS FOR EVERY FAULT IN A BITMASK
+# the knowledge graph's fault -> mitigation lists are compiled once per operating mode into a table
+# indexed by fault bit. A plan walks the set bits of the fault bitmask in priority order and keeps
+# the first occurrence of every mitigation, so a reading costs O(popcount), never a graph walk per
+# fault; plans for a (bitmask, mode) seen before are a dict hit.
+
+from fault_engine import OPERATING_MODES, MODE_CODE
+
+ALL_MODES = 'All'         # operating_modes entry meaning every mode
+MAX_CACHED_PLANS = 4096   # distinct (bitmask, mode) plans kept
+
+
+def pickle_fault_mitigations(mitigations):
+    """{fault: [(mitigation, operating modes)]} from the pickled kg_data['mitigations']"""
+    return {fault: [(name, entry.get('operating_modes', [])) for name in entry['mitigations']]
+            for fault, entry in mitigations.items()}
+
+
+class MitigationPlanner:
+    """Mitigation plans for the fault bitmasks of one RuleSet.
+
+    fault_mitigations maps a fault to its [(mitigation, operating modes)] in the order they should run;
+    no modes or 'All' means every mode. In mode 'Unknown' every mitigation applies, like the graph query.
+    """
+
+    def __init__(self, ruleset, fault_mitigations):
+        self.fault_names = ruleset.fault_names
+        self.mitigation_names = []
+        # actions[mode][bit] = mitigation IDs of that fault applicable in that mode
+        self.actions = [[] for _ in OPERATING_MODES]
+        for fault in ruleset.fault_names:
+            per_mode = [[] for _ in OPERATING_MODES]
+            for name, modes in fault_mitigations.get(fault, []):
+                if name not in self.mitigation_names:
+                    self.mitigation_names.append(name)
+                mitigation = self.mitigation_names.index(name)
+                for mode in OPERATING_MODES:
+                    if (not modes or ALL_MODES in modes or mode in modes or mode == 'Unknown') \
+                            and mitigation not in per_mode[MODE_CODE[mode]]:
+                        per_mode[MODE_CODE[mode]].append(mitigation)
+            for mode_actions, fault_actions in zip(self.actions, per_mode):
+                mode_actions.append(tuple(fault_actions))
+        self._plans = {}
+
+    def fault_actions(self, fault, mode):
+        """Mitigation names of one fault applicable in a mode code"""
+        return [self.mitigation_names[m] for m in self.actions[mode][self.fault_names.index(fault)]]
+
+    def plan(self, bitmask, mode):
+        """((mitigation, fault that asked for it first), ...) for every fault in bitmask, highest priority first"""
+        key = bitmask * len(OPERATING_MODES) + mode
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        actions = self.actions[mode]
+        names = self.mitigation_names
+        seen = 0
+        steps = []
+        remaining = bitmask
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            bit = low.bit_length() - 1
+            for mitigation in actions[bit]:
+                if not seen >> mitigation & 1:
+                    seen |= 1 << mitigation
+                    steps.append((names[mitigation], self.fault_names[bit]))
+        plan = tuple(steps)
+        if len(self._plans) < MAX_CACHED_PLANS:
+            self._plans[key] = plan
+        return plan
@@ -0,0 +1,143 @@
+# REPLAY CACHE - PRE-PARSED SCENARIO FILES FOR THE SIMULATORS
+# the first replay of an Excel scenario cleans it once (to_numeric, Status text -> code) and stores
+# every column as a .npy file in a folder named after the SHA-256 of the source file.
+# later replays memory-map those arrays, so neither pandas nor openpyxl is imported on a cache hit.
+# convert ahead of time:  python replay_cache.py scenario.xlsx [more.xlsx ...]
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+CACHE_FORMAT_VERSION = 1
+CACHE_DIR_NAME = '.replay_cache'  # created next to the source file unless cache_dir is given
+
+NUMERIC_COLUMNS = ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity', 'SoC']
+TEXT_COLUMNS = ['DeviceID']
+DROP_COLUMNS = ['expected error']
+STATUS_CODES = {'charging': 1.0, 'discharging': 0.0}  # anything else (or blank) is stored as NaN
+
+
+def file_hash(path):
+    """SHA-256 of a file's contents, the cache key"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _status_code(value):
+    if isinstance(value, str):
+        return STATUS_CODES.get(value.strip().lower(), np.nan)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def read_scenario_excel(path):
+    """Parse and clean a scenario spreadsheet into {column: ndarray} (imports pandas/openpyxl)"""
+    import pandas as pd
+
+    df = pd.read_excel(path)
+    df = df.drop(columns=DROP_COLUMNS, errors='ignore')
+
+    columns = {}
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            columns[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+    if 'Status' in df.columns:
+        columns['Status'] = np.array([_status_code(value) for value in df['Status']], dtype=np.float64)
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            columns[col] = df[col].fillna('').astype(str).to_numpy(dtype=str)
+    return columns
+
+
+class Scenario:
+    """Columnar replay data, rows come out as plain dicts like the ones the simulators send"""
+
+    def __init__(self, columns, source=None, cached=False):
+        self.columns = columns
+        self.source = source
+        self.cached = cached  # True when loaded from the cache without parsing the spreadsheet
+        self.length = len(next(iter(columns.values()))) if columns else 0
+
+    def __len__(self):
+        return self.length
+
+    def row(self, index):
+        return {col: values[index].item() for col, values in self.columns.items()}
+
+    def rows(self, start=0, stop=None):
+        stop = self.length if stop is None else min(stop, self.length)
+        for index in range(start, stop):
+            yield self.row(index)
+
+
+def cache_path(source, cache_dir=None, digest=None):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(source)), CACHE_DIR_NAME)
+    return os.path.join(cache_dir, digest or file_hash(source))
+
+
+def write_cache(path, columns, source, digest):
+    """Store columns as <path>/<column>.npy plus meta.json, renamed into place in one step"""
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        for col, values in columns.items():
+            np.save(os.path.join(staging, f"{col}.npy"), np.ascontiguousarray(values))
+        meta = {'format_version': CACHE_FORMAT_VERSION, 'source': os.path.basename(source), 'sha256': digest,
+                'rows': len(next(iter(columns.values()))) if columns else 0, 'columns': list(columns)}
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(path):  # another process may have won the rename
+            raise
+
+
+def read_cache(path, digest):
+    """Memory-map a cached scenario, None when missing or written by another format version"""
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format_version') != CACHE_FORMAT_VERSION or meta.get('sha256') != digest:
+        return None
+    try:
+        return {col: np.load(os.path.join(path, f"{col}.npy"), mmap_mode='r') for col in meta['columns']}
+    except (OSError, ValueError):
+        return None
+
+
+def load_scenario(source, cache_dir=None):
+    """Load a scenario spreadsheet through the cache, converting it on the first run"""
+    digest = file_hash(source)
+    path = cache_path(source, cache_dir, digest)
+    columns = read_cache(path, digest)
+    if columns is not None:
+        return Scenario(columns, source, cached=True)
+
+    columns = read_scenario_excel(source)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)  # stale format version
+    write_cache(path, columns, source, digest)
+    return Scenario(columns, source, cached=False)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python replay_cache.py scenario.xlsx [more.xlsx ...]")
+        sys.exit(1)
+    for source in sys.argv[1:]:
+        scenario = load_scenario(source)
+        state = "already cached" if scenario.cached else "converted"
+        print(f"{source}: {len(scenario)} rows, {state} -> {cache_path(source)}")
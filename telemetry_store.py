@@ -0,0 +1,437 @@
+# TELEMETRY STORE - APPEND-ONLY COLUMNAR TIME SERIES OF READINGS AND FAULT EVENTS ON THE PI
+# every device gets its own folder of segment files, one per SEGMENT_SECONDS of wall-clock time.
+# The monitor only appends to an in-memory list; a writer thread group-commits everything received in
+# the last COMMIT_INTERVAL as one block per device and segment, with one fsync per file and commit.
+# A block is one zlib stream of column planes: timestamps as zigzag delta-of-delta microseconds, every
+# parameter as the XOR with its previous value (slowly varying readings leave mostly zero bytes), each
+# byte-shuffled so equal bytes line up, followed by the block's fault events. Blocks carry a CRC32: a torn
+# block at the end of a segment is ignored by readers and cut off before the next append.
+# Segments older than RETENTION_SECONDS, or the oldest ones beyond MAX_STORE_BYTES, are deleted.
+# inspect:  python telemetry_store.py                          devices, samples and time span
+#           python telemetry_store.py DEVICE PARAMETER [MIN]   last MIN minutes (default 10) of one parameter
+#           python telemetry_store.py DEVICE events [MIN]      fault events of the last MIN minutes
+
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import quote, unquote
+import numpy as np
+
+STORE_DIR = 'telemetry'
+STORED_COLUMNS = ['Voltage', 'Impedance', 'IntTemp', 'SurfaceTemp', 'Capacity', 'SoC', 'Status']
+SEGMENT_SECONDS = 3600               # one segment file per device and hour
+RETENTION_SECONDS = 7 * 24 * 3600    # segments ending before this are deleted
+MAX_STORE_BYTES = 256 * 1024 * 1024  # then the oldest segments of any device, until the store fits
+COMMIT_INTERVAL = 10.0               # seconds between group commits, one fsync per touched segment each
+RETENTION_CHECK_INTERVAL = 60.0      # seconds between retention sweeps
+MAX_PENDING = 200000                 # readings waiting for a commit, further ones are dropped (and counted)
+COMPRESS_LEVEL = 6
+
+SEGMENT_MAGIC = b'TSS1'
+SEGMENT_HEADER = struct.Struct('<4sH')      # magic, length of the JSON header that follows
+BLOCK_MAGIC = b'TSB1'
+BLOCK_HEADER = struct.Struct('<4sIIIIqqq')  # magic, crc32, payload bytes, samples, event bytes, t_min, t_max, t_first (us)
+BLOCK_CRC_FROM = 8                          # the CRC covers the header from here on, then the payload
+
+
+# ENCODING - column planes of n 64-bit words, byte-shuffled (byte 0 of every word, then byte 1, ...)
+def shuffle(words):
+    return np.ascontiguousarray(words.view(np.uint8).reshape(-1, 8).T).tobytes()
+
+
+def unshuffle(data, n):
+    return np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(8, n).T).view(np.uint64).ravel()
+
+
+def encode_times(times_us):
+    """Zigzag delta-of-delta of int64 microseconds, a steady sample rate encodes as zeros"""
+    delta = np.diff(times_us, prepend=times_us[:1])
+    dod = np.diff(delta, prepend=np.int64(0))
+    return shuffle(((dod << 1) ^ (dod >> 63)).astype(np.uint64))
+
+
+def decode_times(data, n, first):
+    zigzag = unshuffle(data, n)
+    dod = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    return first + np.cumsum(np.cumsum(dod))
+
+
+def encode_values(values):
+    """XOR of every float64 with the previous one"""
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.uint64)
+    return shuffle(bits ^ np.concatenate((np.zeros(1, np.uint64), bits[:-1])))
+
+
+def decode_values(data, n):
+    return np.bitwise_xor.accumulate(unshuffle(data, n)).view(np.float64)
+
+
+def encode_block(times_us, values, events):
+    """Block of n samples (int64 us, (n, columns) floats) and [[time us, event], ...], n may be 0"""
+    n = len(times_us)
+    event_bytes = json.dumps(events, separators=(',', ':')).encode('utf-8') if events else b''
+    planes = [encode_times(times_us)] + [encode_values(values[:, j]) for j in range(values.shape[1])] if n else []
+    payload = zlib.compress(b''.join(planes) + event_bytes, COMPRESS_LEVEL)
+    stamps = times_us.tolist() + [t for t, _ in events]
+    fields = (len(payload), n, len(event_bytes), min(stamps), max(stamps), int(times_us[0]) if n else 0)
+    crc = zlib.crc32(payload, zlib.crc32(BLOCK_HEADER.pack(BLOCK_MAGIC, 0, *fields)[BLOCK_CRC_FROM:]))
+    return BLOCK_HEADER.pack(BLOCK_MAGIC, crc, *fields) + payload
+
+
+def decode_block(block, columns=()):
+    """(times us, values (n, len(columns)), events) of one block from read_segment, only the
+    requested column indices are decoded"""
+    n, event_bytes, _, _, t_first, payload = block
+    data = zlib.decompress(payload)
+    plane = 8 * n
+    times = decode_times(data[:plane], n, t_first)
+    values = np.empty((n, len(columns)))
+    for i, j in enumerate(columns):
+        values[:, i] = decode_values(data[plane * (j + 1):plane * (j + 2)], n)
+    events = json.loads(data[len(data) - event_bytes:]) if event_bytes else []
+    return times, values, events
+
+
+# SEGMENT FILES - named <start>-<end>.tss (epoch seconds) in a folder per device
+def segment_header(device, columns, start, end):
+    meta = json.dumps({'device': device, 'columns': columns, 'start': start, 'end': end}).encode('utf-8')
+    return SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(meta)) + meta
+
+
+def parse_segment_name(name):
+    """(start, end) in seconds, None for other files"""
+    if not name.endswith('.tss'):
+        return None
+    start, _, end = name[:-4].partition('-')
+    try:
+        return int(start), int(end)
+    except ValueError:
+        return None
+
+
+def read_segment(path):
+    """(columns, blocks, end of the last valid block), blocks as (n, event bytes, t_min, t_max, t_first,
+    payload) up to the first torn or damaged block. Raises ValueError for a file that is not a segment."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < SEGMENT_HEADER.size:
+        raise ValueError(f"{path}: truncated segment header")
+    magic, meta_length = SEGMENT_HEADER.unpack_from(data)
+    offset = SEGMENT_HEADER.size + meta_length
+    if magic != SEGMENT_MAGIC or offset > len(data):
+        raise ValueError(f"{path}: not a telemetry segment")
+    columns = json.loads(data[SEGMENT_HEADER.size:offset])['columns']
+    view = memoryview(data)
+    blocks = []
+    while offset + BLOCK_HEADER.size <= len(data):
+        magic, crc, length, n, event_bytes, t_min, t_max, t_first = BLOCK_HEADER.unpack_from(data, offset)
+        end = offset + BLOCK_HEADER.size + length
+        if magic != BLOCK_MAGIC or end > len(data):
+            break
+        payload = view[offset + BLOCK_HEADER.size:end]
+        if zlib.crc32(payload, zlib.crc32(view[offset + BLOCK_CRC_FROM:offset + BLOCK_HEADER.size])) != crc:
+            break
+        blocks.append((n, event_bytes, t_min, t_max, t_first, payload))
+        offset = end
+    return columns, blocks, offset
+
+
+# STORE
+class TelemetryStore:
+    """Per-device segment files under path, fed by append() / append_event() and a writer thread.
+
+    append() never touches the disk; data can be queried once its commit is done (at most
+    commit_interval later, flush() commits at once). Only the writer thread (or flush()) writes files.
+    """
+
+    def __init__(self, path=STORE_DIR, columns=STORED_COLUMNS, segment_seconds=SEGMENT_SECONDS,
+                 retention=RETENTION_SECONDS, max_bytes=MAX_STORE_BYTES, commit_interval=COMMIT_INTERVAL,
+                 max_pending=MAX_PENDING, fsync=True, on_error=None):
+        self.path = path
+        self.columns = list(columns)
+        self.segment_seconds = segment_seconds
+        self.retention = retention
+        self.max_bytes = max_bytes
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.on_error = on_error  # on_error(exception) when a commit or retention sweep failed
+        self._pending = []         # (device, epoch seconds, values)
+        self._events = []          # (device, epoch seconds, event dict)
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._appending = set()    # segments checked (torn tail cut off) for appending by this process
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_sweep = 0.0
+        self.last_commit_ms = 0.0
+        self.counts = {'appended': 0, 'events': 0, 'dropped': 0, 'committed': 0, 'blocks': 0, 'commits': 0,
+                       'bytes_written': 0, 'torn_tails': 0, 'segments_deleted': 0, 'errors': 0}
+
+    # WRITING
+    def append(self, device, timestamp, row):
+        """Queue one reading ({column: value}, timestamp in epoch seconds), never blocks on the disk"""
+        values = [row.get(col, np.nan) for col in self.columns]
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.counts['dropped'] += 1
+                return
+            self._pending.append((device, timestamp, values))
+            self.counts['appended'] += 1
+
+    def append_event(self, device, kind, faults, timestamp=None, **fields):
+        """Queue one fault event ('raised', 'cleared', ...) with its fault names and any extra fields"""
+        event = dict(fields, kind=kind, faults=faults)
+        with self._lock:
+            self._events.append((device, time.time() if timestamp is None else timestamp, event))
+            self.counts['events'] += 1
+
+    def flush(self):
+        """Commit everything appended so far, returns the number of readings written"""
+        with self._commit_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                events, self._events = self._events, []
+            if not pending and not events:
+                return 0
+            started = time.perf_counter()
+            by_device = {}
+            for device, timestamp, values in pending:
+                entry = by_device.setdefault(device, ([], [], []))
+                entry[0].append(timestamp)
+                entry[1].append(values)
+            for device, timestamp, event in events:
+                by_device.setdefault(device, ([], [], []))[2].append([timestamp, event])
+
+            files = {}
+            try:
+                for device, (times, rows, device_events) in by_device.items():
+                    self._write_blocks(device, times, rows, device_events, files)
+            finally:
+                for f in files.values():
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                    f.close()
+            self.counts['committed'] += len(pending)
+            self.counts['commits'] += 1
+            self.last_commit_ms = (time.perf_counter() - started) * 1000
+            return len(pending)
+
+    def _write_blocks(self, device, times, rows, events, files):
+        """One block per segment the device's readings and events fall into"""
+        span = self.segment_seconds
+        times_us = np.round(np.array(times, dtype=np.float64) * 1e6).astype(np.int64)
+        values = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.columns))
+        segments = times_us // (span * 1_000_000)
+        event_segments = [int(timestamp // span) for timestamp, _ in events]
+        for segment in sorted(set(np.unique(segments).tolist()) | set(event_segments)):
+            selected = segments == segment
+            block_events = [[int(round(timestamp * 1e6)), event]
+                            for (timestamp, event), s in zip(events, event_segments) if s == segment]
+            f = files.get((device, segment))
+            if f is None:
+                f = files[(device, segment)] = self._open_segment(device, segment * span, segment * span + span)
+            block = encode_block(times_us[selected], values[selected], block_events)
+            f.write(block)
+            self.counts['blocks'] += 1
+            self.counts['bytes_written'] += len(block)
+
+    def _open_segment(self, device, start, end):
+        """Segment file opened for appending; the first time this process appends to an existing one,
+        a torn tail is cut off (and a file that is no segment of these columns is moved aside)"""
+        folder = os.path.join(self.path, quote(device, safe=''))
+        path = os.path.join(folder, f"{start}-{end}.tss")
+        if path not in self._appending and os.path.exists(path):
+            try:
+                columns, _, valid = read_segment(path)
+                if columns != self.columns:
+                    raise ValueError(f"{path}: stored columns {columns} differ from {self.columns}")
+            except ValueError:
+                os.replace(path, f"{path}.{int(time.time())}.bad")
+            else:
+                if valid < os.path.getsize(path):
+                    with open(path, 'r+b') as f:
+                        f.truncate(valid)
+                    self.counts['torn_tails'] += 1
+        self._appending.add(path)
+        if not os.path.exists(path):
+            os.makedirs(folder, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(segment_header(device, self.columns, start, end))
+        return open(path, 'ab')
+
+    # RETENTION
+    def segments(self, device=None):
+        """[(device, start, end, path)] of the stored segments, oldest first"""
+        found = []
+        try:
+            folders = [quote(device, safe='')] if device is not None else os.listdir(self.path)
+        except FileNotFoundError:
+            return found
+        for folder in folders:
+            try:
+                names = os.listdir(os.path.join(self.path, folder))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for name in names:
+                span = parse_segment_name(name)
+                if span is not None:
+                    found.append((unquote(folder), span[0], span[1], os.path.join(self.path, folder, name)))
+        found.sort(key=lambda segment: (segment[1], segment[0]))
+        return found
+
+    def sweep(self, now=None):
+        """Delete segments past the retention time, then the oldest ones while the store exceeds max_bytes"""
+        now = time.time() if now is None else now
+        with self._commit_lock:
+            deleted = 0
+            kept = []
+            for device, start, end, path in self.segments():
+                if end < now - self.retention:
+                    deleted += self._delete(path)
+                else:
+                    try:
+                        kept.append((path, os.path.getsize(path)))
+                    except FileNotFoundError:
+                        pass
+            total = sum(size for _, size in kept)
+            for path, size in kept:
+                if total <= self.max_bytes:
+                    break
+                deleted += self._delete(path)
+                total -= size
+            self.counts['segments_deleted'] += deleted
+            return deleted
+
+    def _delete(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        self._appending.discard(path)
+        try:
+            os.rmdir(os.path.dirname(path))  # only succeeds once the device has no segments left
+        except OSError:
+            pass
+        return 1
+
+    # QUERIES
+    def devices(self):
+        return sorted({device for device, _, _, _ in self.segments()})
+
+    def _blocks(self, device, start, end):
+        """(columns, block) of a device's committed blocks overlapping [start, end] (epoch seconds or None)"""
+        start_us = -2 ** 63 if start is None else int(start * 1e6)
+        end_us = 2 ** 63 - 1 if end is None else int(end * 1e6)
+        for _, seg_start, seg_end, path in self.segments(device):
+            if (start is not None and seg_end <= start) or (end is not None and seg_start > end):
+                continue
+            try:
+                columns, blocks, _ = read_segment(path)
+            except (FileNotFoundError, ValueError):
+                continue  # deleted by retention meanwhile, or moved aside
+            for block in blocks:
+                if block[3] >= start_us and block[2] <= end_us:
+                    yield columns, block
+
+    def query(self, device, parameter, start=None, end=None):
+        """(times in epoch seconds, values) of one parameter of one device, in commit order"""
+        times, values = [], []
+        start_us = -np.inf if start is None else start * 1e6
+        end_us = np.inf if end is None else end * 1e6
+        for columns, block in self._blocks(device, start, end):
+            if parameter not in columns or not block[0]:
+                continue
+            block_times, block_values, _ = decode_block(block, [columns.index(parameter)])
+            selected = (block_times >= start_us) & (block_times <= end_us)
+            times.append(block_times[selected])
+            values.append(block_values[selected, 0])
+        if not times:
+            return np.zeros(0), np.zeros(0)
+        return np.concatenate(times) / 1e6, np.concatenate(values)
+
+    def events(self, device, start=None, end=None):
+        """[{'time': epoch seconds, 'kind', 'faults', ...}] of one device"""
+        found = []
+        for _, block in self._blocks(device, start, end):
+            if not block[1]:
+                continue
+            for stamp, event in decode_block(block)[2]:
+                timestamp = stamp / 1e6
+                if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                    found.append(dict(event, time=timestamp))
+        return found
+
+    # WRITER THREAD
+    def _run(self):
+        while not self._stop.wait(self.commit_interval):
+            self._commit_and_sweep()
+        self._commit_and_sweep()
+
+    def _commit_and_sweep(self):
+        try:
+            self.flush()
+            if time.monotonic() - self._last_sweep >= RETENTION_CHECK_INTERVAL:
+                self._last_sweep = time.monotonic()
+                self.sweep()
+        except OSError as e:
+            self.counts['errors'] += 1
+            if self.on_error is not None:
+                self.on_error(e)
+
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Commit what is pending and end the writer"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, pending=len(self._pending), pending_events=len(self._events),
+                        last_commit_ms=round(self.last_commit_ms, 3))
+
+
+# COMMAND LINE - post-incident inspection
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def main(argv):
+    store = TelemetryStore()
+    if not argv:
+        for device in store.devices():
+            segments = store.segments(device)
+            times, _ = store.query(device, store.columns[0])
+            span = f"{_format_time(times.min())} .. {_format_time(times.max())}" if len(times) else "no readings"
+            print(f"{device}: {len(times)} readings in {len(segments)} segments, {span}")
+        return 0
+    if len(argv) < 2:
+        print("usage: python telemetry_store.py [DEVICE (PARAMETER | events) [MINUTES]]")
+        return 2
+    device, parameter = argv[0], argv[1]
+    start = time.time() - 60 * float(argv[2] if len(argv) > 2 else 10)
+    if parameter == 'events':
+        for event in store.events(device, start):
+            print(_format_time(event.pop('time')), event.pop('kind'), ", ".join(event.pop('faults')),
+                  json.dumps(event) if event else "")
+        return 0
+    times, values = store.query(device, parameter, start)
+    for timestamp, value in zip(times.tolist(), values.tolist()):
+        print(f"{_format_time(timestamp)}  {value:g}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
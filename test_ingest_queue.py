@@ -0,0 +1,55 @@
+# INGEST QUEUE TESTS - ORDER OF ONE DEVICE'S READINGS THROUGH THE URGENT AND BENIGN LANES
+# run with: python -m pytest -q test_ingest_queue.py
+
+from ingest_queue import IngestQueue
+
+
+class MarkedScreen:
+    """Pre-screen stand-in: a reading is urgent when its 'u' field says so"""
+    derived_columns = []
+
+    def urgent(self, readings, derived=None):
+        return [reading['u'] for reading in readings]
+
+
+def reading(name, urgent, device='A'):
+    return {'DeviceID': device, 'name': name, 'u': urgent}
+
+
+def run(frames, **options):
+    """Names in the order the queue evaluates them, all frames queued before the worker starts"""
+    processed = []
+    queue = IngestQueue(lambda sensor_data, received_at: processed.append(sensor_data['name']),
+                        lambda: MarkedScreen(), **options)
+    for frame in frames:
+        queue.put(frame)
+    queue.start()
+    queue.stop()
+    return processed
+
+
+def test_interleaved_urgent_and_benign_keep_arrival_order():
+    frames = [[reading('u1', True)], [reading('b2', False)], [reading('u3', True)]]
+    assert run(frames) == ['u1', 'b2', 'u3']
+
+
+def test_urgent_reading_waits_only_for_its_own_device():
+    frames = [[reading('x%d' % i, False, device='X') for i in range(5)],
+              [reading('b1', False)], [reading('u2', True)], [reading('b3', False)]]
+    processed = run(frames)
+    assert processed[:2] == ['b1', 'u2']
+    assert [name for name in processed if name[0] != 'x'] == ['b1', 'u2', 'b3']
+
+
+def test_urgent_coalescing_keeps_arrival_order():
+    frames = [[reading('u1', True)], [reading('b2', False)], [reading('u3', True)], [reading('b4', False)],
+              [reading('u5', True)]]
+    # the second urgent reading fills the device's urgent backlog, u5 supersedes u3 and sheds b4
+    assert run(frames, urgent_backlog=2) == ['u1', 'b2', 'u5']
+
+
+def test_benign_coalescing_never_passes_an_urgent_reading():
+    frames = [[reading('u1', True)], [reading('b2', False)], [reading('u3', True)], [reading('b4', False)],
+              [reading('b5', False)]]
+    # b5 finds the device's benign backlog full and supersedes b4, the newest queued reading
+    assert run(frames, device_backlog=2) == ['u1', 'b2', 'u3', 'b5']
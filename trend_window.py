@@ -0,0 +1,176 @@
+# TREND WINDOW - PER-DEVICE TIME WINDOWS WITH O(1) SLIDING STATISTICS
+# every device keeps the last TREND_SPAN seconds of the parameters its trend rules use in fixed-size
+# double arrays, at most one sample per TREND_RESOLUTION seconds, so a window holds the same stretch of
+# time whatever the send rate and slope noise does not grow with it. Running sums are updated when a
+# sample enters and leaves the window, so the least-squares slope, variance, time-aware EWMA and rate
+# of change cost the same at any window size. Missing values (0 or NaN) are skipped, never averaged in,
+# and a sample older than the last accepted one (reordered in transit) is counted and dropped.
+# Rules reference the statistics as derived parameters named <parameter>_<stat>, e.g. 'IntTemp_Slope'.
+
+import math
+from array import array
+
+TREND_SPAN = 60.0         # seconds of history per device and parameter
+TREND_RESOLUTION = 1.0    # seconds, a sample closer than this to the previous one does not enter the window
+TREND_WINDOW = int(TREND_SPAN / TREND_RESOLUTION) + 1  # samples per device and parameter
+EWMA_TAU = 30.0           # seconds, time constant of the EWMA
+MIN_TREND_SAMPLES = 5     # slope and variance are NaN until the window holds this many samples
+MIN_TREND_SPAN = 50.0     # seconds, ... and the slope until they cover this much time
+TREND_STATS = {
+    'Slope': "least-squares slope over the window (units per second)",
+    'EWMA': "exponentially weighted moving average, time constant EWMA_TAU",
+    'Var': "variance over the window",
+    'Rate': "change since the previous sample divided by the time between them (units per second)",
+}
+
+
+def trend_features(parameters):
+    """[(name, parameter, stat), ...] for the rule parameters that name a trend statistic"""
+    features = []
+    for name in parameters:
+        param, _, stat = name.rpartition('_')
+        if param and stat in TREND_STATS:
+            features.append((name, param, stat))
+    return features
+
+
+class TrendSeries:
+    """Ring buffer of one parameter's recent samples and the running sums behind its statistics.
+
+    Sums are rebuilt from the buffer every TREND_WINDOW samples (amortized O(1)), which also moves the
+    time origin forward so floating-point error neither accumulates nor grows with uptime.
+    """
+    __slots__ = ('span', 'resolution', 'min_span', 'tau', 'size', 'times', 'values', 'head', 'count',
+                 'since_resync', 'origin', 'sum_t', 'sum_tt', 'sum_v', 'sum_tv', 'sum_vv',
+                 'last_time', 'last', 'ewma', 'rate', 'out_of_order')
+
+    def __init__(self, span=TREND_SPAN, resolution=TREND_RESOLUTION, min_span=MIN_TREND_SPAN, tau=EWMA_TAU):
+        self.span = span
+        self.resolution = resolution
+        self.min_span = min_span
+        self.tau = tau
+        self.size = int(span / resolution) + 1
+        self.times = array('d', bytes(8 * self.size))
+        self.values = array('d', bytes(8 * self.size))
+        self.head = 0  # oldest sample
+        self.count = 0
+        self.since_resync = 0
+        self.origin = None
+        self.sum_t = self.sum_tt = self.sum_v = self.sum_tv = self.sum_vv = 0.0
+        self.last_time = math.nan  # timestamp of the last valid sample
+        self.last = math.nan
+        self.ewma = math.nan
+        self.rate = math.nan
+        self.out_of_order = 0  # samples dropped for being older than the last accepted one
+
+    def push(self, timestamp, v):
+        """Add one value (timestamp in seconds), 0 and NaN are missing values and skipped"""
+        if v != v or v == 0:
+            return
+        dt = timestamp - self.last_time
+        if dt < 0:
+            self.out_of_order += 1
+            return
+        if self.ewma != self.ewma:
+            self.ewma = v
+        elif dt > 0:
+            self.rate = (v - self.last) / dt
+            self.ewma += (1.0 - math.exp(-dt / self.tau)) * (v - self.ewma)
+        self.last_time = timestamp
+        self.last = v
+
+        if self.origin is None:
+            self.origin = timestamp
+        t = timestamp - self.origin
+        times, values, size = self.times, self.values, self.size
+        if self.count:
+            if t - times[(self.head + self.count - 1) % size] < self.resolution:
+                return  # thinned out: too close to the previous sample in the window
+            # drop samples that left the time span, and the oldest one when the buffer is full
+            while self.count and (self.count == size or t - times[self.head] > self.span):
+                old_t, old = times[self.head], values[self.head]
+                self.sum_t -= old_t
+                self.sum_tt -= old_t * old_t
+                self.sum_v -= old
+                self.sum_tv -= old_t * old
+                self.sum_vv -= old * old
+                self.head = (self.head + 1) % size
+                self.count -= 1
+        i = (self.head + self.count) % size
+        times[i] = t
+        values[i] = v
+        self.count += 1
+        self.sum_t += t
+        self.sum_tt += t * t
+        self.sum_v += v
+        self.sum_tv += t * v
+        self.sum_vv += v * v
+        self.since_resync += 1
+        if self.since_resync >= size:
+            self._resync()
+
+    def _samples(self):
+        return [(self.times[(self.head + k) % self.size], self.values[(self.head + k) % self.size])
+                for k in range(self.count)]
+
+    def _resync(self):
+        """Recompute the sums from the buffer with the oldest sample as the new time origin"""
+        shift = self.times[self.head]
+        self.origin += shift
+        samples = [(t - shift, v) for t, v in self._samples()]
+        for k, (t, _) in enumerate(samples):
+            self.times[(self.head + k) % self.size] = t
+        self.sum_t = math.fsum(t for t, _ in samples)
+        self.sum_tt = math.fsum(t * t for t, _ in samples)
+        self.sum_v = math.fsum(v for _, v in samples)
+        self.sum_tv = math.fsum(t * v for t, v in samples)
+        self.sum_vv = math.fsum(v * v for _, v in samples)
+        self.since_resync = 0
+
+    # statistics, NaN while they are undefined
+    def slope(self):
+        n = self.count
+        if n < MIN_TREND_SAMPLES or self.times[(self.head + n - 1) % self.size] - self.times[self.head] < self.min_span:
+            return math.nan
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        if denominator <= 0:
+            return math.nan
+        return (n * self.sum_tv - self.sum_t * self.sum_v) / denominator
+
+    def var(self):
+        n = self.count
+        if n < MIN_TREND_SAMPLES:
+            return math.nan
+        mean = self.sum_v / n
+        return max(self.sum_vv / n - mean * mean, 0.0)
+
+    def ewma_value(self):
+        return self.ewma
+
+    def rate_value(self):
+        return self.rate
+
+
+class TrendWindow:
+    """One device's TrendSeries for the parameters of features, the trend_features() list it serves"""
+
+    def __init__(self, features, span=TREND_SPAN, resolution=TREND_RESOLUTION, min_span=MIN_TREND_SPAN,
+                 tau=EWMA_TAU):
+        self.features = features
+        self.series = {}
+        for _, param, _ in features:
+            if param not in self.series:
+                self.series[param] = TrendSeries(span, resolution, min_span, tau)
+        stats = {'Slope': 'slope', 'Var': 'var', 'EWMA': 'ewma_value', 'Rate': 'rate_value'}
+        self._lookups = [(name, getattr(self.series[param], stats[stat])) for name, param, stat in features]
+        self._series = list(self.series.items())
+
+    def push(self, timestamp, row):
+        """Add one reading (timestamp in seconds), returns {feature name: value} after it"""
+        for param, series in self._series:
+            series.push(timestamp, row.get(param, math.nan))
+        return {name: stat() for name, stat in self._lookups}
+
+    def out_of_order(self):
+        """Samples dropped across the parameters for arriving older than the last accepted one"""
+        return sum(series.out_of_order for series in self.series.values())
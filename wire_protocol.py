@@ -0,0 +1,116 @@
+# WIRE PROTOCOL - LENGTH-PREFIXED JSON FRAMES BETWEEN LAPTOP AND PI
+# every frame is a 4-byte big-endian payload length followed by a UTF-8 JSON payload.
+# the payload is either one reading (JSON object) or many readings (JSON array of objects),
+# so one persistent TCP connection can carry any number of readings without relying on recv() boundaries
+
+import asyncio
+import json
+import struct
+
+HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 1024 * 1024  # 1 MiB, protects the Pi from a corrupt or hostile length prefix
+
+
+class ProtocolError(ValueError):
+    """Raised when a frame is malformed or larger than MAX_FRAME_SIZE"""
+
+
+# ENCODING
+def encode_frame(readings):
+    """Encode one reading dict or a list of reading dicts into a single frame"""
+    payload = json.dumps(readings, separators=(',', ':')).encode('utf-8')
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame of {len(payload)} bytes exceeds limit of {MAX_FRAME_SIZE} bytes")
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_readings(sock, readings):
+    """Send one reading or a batch of readings as one frame"""
+    sock.sendall(encode_frame(readings))
+
+
+# DECODING
+def decode_payload(payload):
+    """Decode a frame payload into a list of reading dicts"""
+    try:
+        data = json.loads(payload.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"Invalid frame payload: {e}")
+
+    if isinstance(data, dict):
+        return [data]
+    if isinstance(data, list) and all(isinstance(item, dict) for item in data):
+        return data
+    raise ProtocolError("Frame payload must be a reading object or a list of reading objects")
+
+
+def check_length(length):
+    """Validate a decoded length prefix"""
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame length {length} exceeds limit of {MAX_FRAME_SIZE} bytes")
+    return length
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes, returns None if the peer closed the connection cleanly before any byte"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            if received == 0:
+                return None
+            raise ProtocolError(f"Connection closed mid-frame ({received}/{size} bytes)")
+        received += count
+    return bytes(buffer)
+
+
+def read_payload(sock):
+    """Read the next frame payload from a blocking socket, returns None on disconnect"""
+    header = recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    length = check_length(HEADER.unpack(header)[0])
+    payload = recv_exact(sock, length) if length else b''
+    if payload is None:
+        raise ProtocolError("Connection closed before frame payload")
+    return payload
+
+
+def read_frame(sock):
+    """Read the next frame from a blocking socket, returns a list of readings or None on disconnect"""
+    payload = read_payload(sock)
+    return None if payload is None else decode_payload(payload)
+
+
+# ASYNCIO DECODING
+async def read_length_async(reader):
+    """Wait for the next frame header on an asyncio StreamReader, returns the payload length or None on disconnect"""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ProtocolError("Connection closed mid-header")
+    return check_length(HEADER.unpack(header)[0])
+
+
+async def read_body_async(reader, length):
+    """Read a frame payload of length bytes whose header was already read"""
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        raise ProtocolError(f"Connection closed mid-frame ({len(e.partial)}/{length} bytes)")
+
+
+async def read_payload_async(reader):
+    """Read the next frame payload from an asyncio StreamReader, returns None on disconnect"""
+    length = await read_length_async(reader)
+    return None if length is None else await read_body_async(reader, length)
+
+
+async def read_frame_async(reader):
+    """Read the next frame from an asyncio StreamReader, returns a list of readings or None on disconnect"""
+    payload = await read_payload_async(reader)
+    return None if payload is None else decode_payload(payload)